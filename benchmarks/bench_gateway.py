@@ -0,0 +1,132 @@
+"""Measure SENSOR throughput of GatewaySupervisor for different worker counts.
+
+For every worker count, N inverters are started across the workers and
+connected to a broker. Then ``--rounds`` rounds are pushed through the
+supervisor. Each round sets fresh ENERGY data and publishes SENSOR for
+every device. The run ends when every worker has processed its last round.
+Throughput only scales with workers on a box with that many cores.
+
+    python benchmarks/bench_gateway.py --host 127.0.0.1 -n 1000 --workers 1,2,4,8
+
+Scaling across cores has not been measured yet. The only results so far
+come from a single-core machine with a local amqtt broker (-n 200, 20
+rounds). There, each extra worker only adds overhead:
+
+    workers=1: 4000 SENSOR in 4.05s =  988 msg/s, worker cpu=2.13s, rss=52MB
+    workers=2: 4000 SENSOR in 4.37s =  915 msg/s, worker cpu=2.29s, rss=78MB
+    workers=4: 4000 SENSOR in 5.16s =  775 msg/s, worker cpu=2.85s, rss=135MB
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt import EnergyData, MetricsData, InverterDevice
+from qilowatt.gateway import DeviceSpec, GatewaySupervisor
+
+METRICS = MetricsData(
+    PvPower=[200.0, 200.0], PvVoltage=[300.0, 300.0], PvCurrent=[8.0, 8.0],
+    LoadPower=[500.0, 500.0, 500.0], BatterySOC=[80], LoadCurrent=[10.0, 10.0, 10.0],
+    BatteryPower=[400.0], BatteryCurrent=[15.0], BatteryVoltage=[48.0],
+    GenVoltage=[0.0, 0.0, 0.0], GenPower=[0.0, 0.0, 0.0], GenCurrent=[0.0, 0.0, 0.0],
+    GridExportLimit=5000.0, BatteryTemperature=[30.0], InverterTemperature=40.0,
+)
+
+
+class BenchInverter(InverterDevice):
+    """Inverter that reports the last benchmark round it completed."""
+
+    def __init__(self, device_id):
+        super().__init__(device_id)
+        self.round = -1
+
+    def set_round(self, value):
+        self.round = value
+
+    def start_timers(self):
+        # Publishing is driven by the benchmark, not by the 10 s timer
+        pass
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["round"] = self.round
+        return stats
+
+
+def energy(round_index: int) -> EnergyData:
+    return EnergyData(
+        Power=[1000.0 + round_index, 1000.0, 1000.0], Today=5.0, Total=1000.0,
+        Current=[5.0, 5.0, 5.0], Voltage=[230.0, 230.0, 230.0], Frequency=50.0,
+    )
+
+
+def run(args, workers: int):
+    supervisor = GatewaySupervisor(workers=workers, stats_interval=0.2)
+    device_ids = [f"bench{os.getpid()}w{workers}d{i}" for i in range(args.clients)]
+    for device_id in device_ids:
+        supervisor.add_device(DeviceSpec(
+            device_id, BenchInverter, "bench", "bench",
+            client_kwargs={"host": args.host, "port": args.port, "tls": args.tls},
+        ))
+    supervisor.start()
+    for device_id in device_ids:
+        supervisor.set_metrics_data(device_id, METRICS)
+
+    deadline = time.monotonic() + args.timeout
+    while supervisor.get_stats()["connected"] < len(device_ids):
+        if time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    connected = supervisor.get_stats()["connected"]
+    cpu_before = supervisor.get_stats()["cpu_s"]
+
+    started = time.monotonic()
+    for round_index in range(args.rounds):
+        for device_id in device_ids:
+            supervisor.set_energy_data(device_id, energy(round_index))
+            supervisor.submit(device_id, "publish_sensor_data")
+            supervisor.submit(device_id, "set_round", round_index)
+        supervisor.flush()
+
+    last = args.rounds - 1
+    while time.monotonic() < deadline + args.timeout:
+        if all(
+            (supervisor.get_device_stats(d) or {}).get("device", {}).get("round") == last
+            for d in device_ids
+        ):
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - started
+    stats = supervisor.get_stats()
+    supervisor.stop()
+
+    messages = args.rounds * len(device_ids)
+    print(
+        f"workers={workers}: {connected}/{len(device_ids)} connected, "
+        f"{messages} SENSOR in {elapsed:.2f}s = {messages / elapsed:.0f} msg/s, "
+        f"worker cpu={stats['cpu_s'] - cpu_before:.2f}s, rss={stats['rss_mb']:.0f}MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("-n", "--clients", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--workers", default=",".join(
+        str(w) for w in sorted({1, 2, 4, os.cpu_count() or 1})
+    ))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPUs")
+    for workers in (int(w) for w in args.workers.split(",")):
+        run(args, workers)
+
+
+if __name__ == "__main__":
+    main()
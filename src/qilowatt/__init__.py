@@ -1,6 +1,19 @@
 # qilowatt/__init__.py
 
 from .client import QilowattMQTTClient
+from .endpoints import Endpoint, EndpointSelector
+from .tls import QilowattTLSContext, create_tls_context
+from .delivery import PublishHandle
+from .snapshot import DataSnapshot
+from .clock import Clock, VirtualClock
+from .statestore import StateStore
+from .rules import FieldRule
+from .schema import DeviceSchema, SchemaDevice, Field, Command
+from .telemetry import TelemetryRecorder, read_records, read_batches
+from .budget import BandwidthBudget
+from .ipc import LocalServer, LocalClient
+from .sinks import PublishSink, CallbackSink, MQTTSink
+from .recording import TrafficRecorder, TrafficReplayer, read_traffic
 from .models import (
     EnergyData, MetricsData, WorkModeCommand,
     Status0Data, StatusData, StatusPRMData, StatusFWRData,
@@ -10,9 +23,16 @@ from .exceptions import (
     QilowattException,
     ConnectionError,
     AuthenticationError,
+    DataValidationError,
+    DeadlineExceededError,
+    IPCError,
+    CommandError,
 )
 from .devices.inverter import InverterDevice
 from .devices.switch import SwitchDevice
+from .devices.power_switch import PowerSwitchDevice
+from .devices.plant import PlantDevice
+from .devices.thermostat import ThermostatDevice
 
 try:
     from ._version import version as __version__
@@ -21,8 +41,37 @@ except ImportError:
 
 __all__ = [
     "QilowattMQTTClient",
+    "Endpoint",
+    "EndpointSelector",
+    "QilowattTLSContext",
+    "create_tls_context",
+    "PublishHandle",
+    "DataSnapshot",
+    "Clock",
+    "VirtualClock",
+    "StateStore",
+    "FieldRule",
+    "DeviceSchema",
+    "SchemaDevice",
+    "Field",
+    "Command",
+    "TelemetryRecorder",
+    "read_records",
+    "read_batches",
+    "BandwidthBudget",
+    "LocalServer",
+    "LocalClient",
+    "PublishSink",
+    "CallbackSink",
+    "MQTTSink",
+    "TrafficRecorder",
+    "TrafficReplayer",
+    "read_traffic",
     "InverterDevice",
     "SwitchDevice",
+    "PowerSwitchDevice",
+    "PlantDevice",
+    "ThermostatDevice",
     "EnergyData",
     "MetricsData",
     "WorkModeCommand",
@@ -37,4 +86,8 @@ __all__ = [
     "QilowattException",
     "ConnectionError",
     "AuthenticationError",
+    "DataValidationError",
+    "DeadlineExceededError",
+    "IPCError",
+    "CommandError",
 ]
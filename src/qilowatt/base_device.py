@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, Callable
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Deque, List, Tuple
+import json
 import threading
 import logging
-from datetime import datetime, timezone
+from datetime import timezone
 from .models import (
     Status0Data,
     StatusData, StatusPRMData, StatusFWRData, StatusLOGData,
@@ -11,9 +13,34 @@ from .models import (
 import platform
 import socket
 import getmac
+from .providers import ProviderRunner
+from .clock import Clock, SYSTEM_CLOCK, format_timestamp
+from .statestore import StateStore
+from .serialization import SerializedData, add_fields
+from .histogram import LatencyHistogram, SAMPLE_AGE_BOUNDS
+from .watchdog import DeadlineGuard, get_watchdog
+from .exceptions import DeadlineExceededError
 
 _logger = logging.getLogger(__name__)
 
+# Normal SENSOR publish period in seconds
+SENSOR_INTERVAL = 10.0
+
+# Fastest SENSOR period allowed in burst mode - protects the broker
+MIN_BURST_INTERVAL = 0.5
+
+# STATE and STATUS0 publish periods in seconds
+STATE_INTERVAL = 60.0
+STATUS0_INTERVAL = 3600.0
+
+# Default deadline for get_sensor_data, get_state_data and command callbacks
+CALL_DEADLINE = 5.0
+
+# What publish_sensor_data() does with data older than the max sample age
+STALE_FLAG = "flag"  # publish it marked with ``Stale`` (its age in seconds)
+STALE_SKIP = "skip"  # do not publish it
+STALE_POLICIES = (STALE_FLAG, STALE_SKIP)
+
 class BaseDevice(ABC):
     """Base class for all devices that can communicate via MQTT."""
     
@@ -27,12 +54,70 @@ class BaseDevice(ABC):
         self._sensor_timer_stop_event = threading.Event()
         self._state_timer_stop_event = threading.Event()
         self._status0_timer_stop_event = threading.Event()
+        self._sensor_wake_event = threading.Event()
+
+        # Burst telemetry - disabled until configured with set_burst_mode()
+        self._sensor_interval = SENSOR_INTERVAL
+        # Stretches the SENSOR and STATE periods, e.g. to save bandwidth
+        self._interval_scale = 1.0
+        self._burst_interval = 1.0
+        self._burst_duration = 0.0
+        self._burst_max_per_minute = 30
+        self._burst_until = 0.0
+        self._burst_publish_times: Deque[float] = deque()
+        self._burst_lock = threading.Lock()
+        self._burst_triggered = 0
+        self._burst_publishes = 0
+        self._burst_rate_limited = 0
         
-        self._startup_utc = datetime.utcnow()
+        # Source of time for timestamps and timers - see set_clock()
+        self._clock: Clock = SYSTEM_CLOCK
+        self._startup_utc = self._clock.utcnow()
         self._boot_count = 1
         
+        # Broker endpoint reported in STATUS0 - set by the client
+        self._mqtt_endpoint: Tuple[str, int] = ("", 0)
+
         # Default version data - can be overridden by client
         self._version_data = VersionData()
+
+        # Deadlines for application code called from timer and network threads
+        self._guards = {
+            "sensor": DeadlineGuard("get_sensor_data", CALL_DEADLINE),
+            "state": DeadlineGuard("get_state_data", CALL_DEADLINE),
+            "command": DeadlineGuard("command callback", CALL_DEADLINE),
+        }
+        self._last_good: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._stale_publishes = {"sensor": 0, "state": 0}
+
+        # When the current data was read - see mark_sampled()
+        self._sampled_at: Optional[float] = None
+        self._max_sample_age: Optional[float] = None
+        self._stale_policy = STALE_FLAG
+        self._sample_time_field = False
+        self._sample_stale = False
+        self._stale_samples = {"flagged": 0, "skipped": 0}
+        # Sample age when published, and when the broker acknowledged it
+        self._sample_age = LatencyHistogram(SAMPLE_AGE_BOUNDS)
+        self._sample_age_at_ack = LatencyHistogram(SAMPLE_AGE_BOUNDS)
+
+        # Watchdog bookkeeping: job name -> [last run, reported as stalled]
+        self._timer_jobs: Dict[str, List[Any]] = {}
+        self._late_jobs: Dict[str, int] = {}
+
+        # Pull-based data providers, polled before each SENSOR publish
+        self._providers = ProviderRunner(
+            self.apply_provider_result, name=f"{self.__class__.__name__}Provider"
+        )
+
+        # Optional persistence across restarts - see set_state_store()
+        self._state_store: Optional[StateStore] = None
+        self._sensor_save_interval = 60.0
+        self._sensor_saved_at: Optional[float] = None
+        self._restored_sensor: Optional[Tuple[bytes, float]] = None
+
+        # Local consumers of every SENSOR sample, e.g. TelemetryRecorder
+        self._sensor_recorders: List[Any] = []
         
         
     @property
@@ -65,6 +150,18 @@ class BaseDevice(ABC):
     def handle_command(self, payload: bytes) -> None:
         """Handle incoming command messages."""
         pass
+
+    def execute_command(self, payload: bytes) -> None:
+        """Run a command like handle_command(), but raise if it fails.
+
+        handle_command() only logs failures, as nobody waits for the outcome
+        of a command from the broker. The default just calls it; the built-in
+        devices override this and handle_command() logs what it raises.
+
+        Raises:
+            CommandError: If the command is unknown, malformed or rejected.
+        """
+        self.handle_command(payload)
     
     @abstractmethod
     def get_sensor_data(self) -> Dict[str, Any]:
@@ -92,18 +189,43 @@ class BaseDevice(ABC):
         if "qilowatt-py" in version_data:
             self._version_data.qilowatt_py = version_data["qilowatt-py"]
 
+    def set_mqtt_endpoint(self, host: str, port: int) -> bool:
+        """Set the broker endpoint reported in STATUS0. Returns True if it changed."""
+        changed = self._mqtt_endpoint != (host, port)
+        self._mqtt_endpoint = (host, port)
+        return changed
+
+    def set_clock(self, clock: Clock):
+        """Use ``clock`` for timestamps and timer scheduling.
+
+        Running timers are restarted on the new clock.
+        """
+        running = self._sensor_timer_thread is not None
+        if running:
+            self.stop_timers()
+        self._clock = clock
+        self._startup_utc = clock.utcnow()
+        if running:
+            self.start_timers()
+
     def start_timers(self):
         """Start all data publishing timers."""
+        now = self._clock.monotonic()
+        self._timer_jobs = {name: [now, False] for name in ("sensor", "state", "status0")}
+        get_watchdog().watch(self)
         self._start_sensor_timer()
         self._start_state_timer()
         self._start_status0_timer()
     
     def stop_timers(self):
         """Stop all data publishing timers."""
+        get_watchdog().unwatch(self)
+        self._timer_jobs = {}
         for event in [self._sensor_timer_stop_event, 
                      self._state_timer_stop_event, 
                      self._status0_timer_stop_event]:
             event.set()
+        self._sensor_wake_event.set()
             
         for thread in [self._sensor_timer_thread, 
                       self._state_timer_thread, 
@@ -115,71 +237,468 @@ class BaseDevice(ABC):
         self._sensor_timer_stop_event.clear()
         self._state_timer_stop_event.clear()
         self._status0_timer_stop_event.clear()
+        self._sensor_wake_event.clear()
         self._sensor_timer_thread = None
         self._state_timer_thread = None
         self._status0_timer_thread = None
+        self._providers.close()
+
+    def add_data_provider(self, provider: Callable[[], Any], max_age: float = 0.0,
+                          name: Optional[str] = None) -> str:
+        """Register a sync or async callable polled before each SENSOR publish.
+
+        Its result is passed to apply_provider_result(). A result younger than
+        ``max_age`` seconds is reused instead of calling the provider again.
+        A device still waiting for its first data polls the providers at once.
+        Returns the provider name, used by remove_data_provider().
+
+        Raises:
+            NotImplementedError: If the device does not override
+                apply_provider_result().
+        """
+        if type(self).apply_provider_result is BaseDevice.apply_provider_result:
+            raise NotImplementedError(
+                f"{self.__class__.__name__} does not accept data provider results"
+            )
+        name = self._providers.add(provider, name=name, max_age=max_age)
+        if not self._data_initialized:
+            self.refresh_data()
+        return name
+
+    def remove_data_provider(self, name: str) -> bool:
+        """Unregister a data provider."""
+        return self._providers.remove(name)
+
+    def set_provider_timeout(self, timeout: float):
+        """Set the time budget for polling all providers before a publish.
+
+        Providers run concurrently; those still busy when the budget is used
+        up are published with their previous result.
+        """
+        self._providers.timeout = timeout
+
+    def set_provider_event_loop(self, loop):
+        """Run async providers on the application's event loop."""
+        self._providers.set_event_loop(loop)
+
+    def refresh_data(self, timeout: Optional[float] = None) -> int:
+        """Poll the data providers now. Returns the number of results applied."""
+        return self._providers.refresh(timeout)
+
+    def apply_provider_result(self, result: Any):
+        """Apply a data provider result. Devices that support providers override this."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not accept data provider results"
+        )
+
+    def set_state_store(self, store: StateStore, sensor_interval: float = 60.0):
+        """Keep boot count, last command and last SENSOR data in ``store``.
+
+        The boot count is incremented and saved right away. SENSOR data is
+        saved at most every ``sensor_interval`` seconds; what was saved before
+        the restart is published again by publish_restored_state().
+        """
+        self._state_store = store
+        self._sensor_save_interval = max(0.0, sensor_interval)
+        self._boot_count = int(store.get("boot_count", b"0")) + 1
+        store.put("boot_count", str(self._boot_count).encode())
+        store.flush()
+        sensor = store.get("sensor")
+        if sensor is not None:
+            self._restored_sensor = (sensor, store.written_at("sensor"))
+        try:
+            self.restore_state(store)
+        except Exception as e:
+            _logger.error(f"{self.device_id}: error restoring saved state: {e}")
+
+    def restore_state(self, store: StateStore):
+        """Restore device specific state saved with _save_state(). Override as needed."""
+
+    def _save_state(self, key: str, value: bytes):
+        store = self._state_store
+        if store is not None:
+            store.put(key, value)
+
+    def publish_restored_state(self):
+        """Publish the SENSOR data saved before the restart, marked with ``Stale``.
+
+        The client calls this once connected. Does nothing once fresh SENSOR
+        data was published.
+        """
+        restored = self._restored_sensor
+        if restored is None or not hasattr(self, '_publish_callback'):
+            return None
+        self._restored_sensor = None
+        payload, written_at = restored
+        try:
+            data = json.loads(payload)
+        except ValueError as e:
+            _logger.error(f"{self.device_id}: saved SENSOR data is not valid JSON: {e}")
+            return None
+        data["Stale"] = round(max(0.0, self._clock.time() - written_at), 1)
+        return self._publish_callback(self.sensor_topic, data)
+
+    def _save_sensor(self, data: Dict[str, Any]):
+        self._restored_sensor = None
+        if self._state_store is None or "Stale" in data:
+            return
+        now = self._clock.monotonic()
+        if (self._sensor_saved_at is not None
+                and now - self._sensor_saved_at < self._sensor_save_interval):
+            return
+        self._sensor_saved_at = now
+        payload = data.payload if isinstance(data, SerializedData) else json.dumps(data)
+        self._save_state("sensor", payload.encode("utf-8"))
+
+    def add_sensor_recorder(self, recorder):
+        """Hand every SENSOR sample to ``recorder.record(data, timestamp)``.
+
+        The recorder gets the same data that is published, so it must not
+        modify it and should return quickly (TelemetryRecorder only queues).
+        """
+        self._sensor_recorders = self._sensor_recorders + [recorder]
+
+    def remove_sensor_recorder(self, recorder):
+        self._sensor_recorders = [r for r in self._sensor_recorders if r is not recorder]
+
+    def _record_sensor(self, data: Dict[str, Any]):
+        if "Stale" in data:
+            return
+        timestamp = self._clock.time()
+        for recorder in self._sensor_recorders:
+            try:
+                recorder.record(data, timestamp)
+            except Exception as e:
+                _logger.error(f"{self.device_id}: error recording SENSOR data: {e}")
+
+    def set_call_deadline(self, kind: str, timeout: Optional[float]):
+        """Set the deadline for "sensor", "state" or "command" calls.
+
+        get_sensor_data/get_state_data calls that miss it are replaced by the
+        last good data marked with ``Stale`` (its age in seconds); a command
+        callback that misses it keeps running while command handling moves on.
+        By default every kind has a CALL_DEADLINE (5 s) deadline, and the
+        calls run on shared helper threads. None runs them inline on the
+        calling thread, without a deadline.
+        """
+        if kind not in self._guards:
+            raise ValueError(f"Unknown call kind: {kind}")
+        self._guards[kind].timeout = timeout
+
+    def _guarded_data(self, kind: str,
+                      getter: Callable[[], Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Get data within its deadline, falling back to the last good data."""
+        try:
+            data = self._guards[kind].call(getter)
+        except DeadlineExceededError as e:
+            _logger.warning(f"{self.device_id}: {e}")
+            return self._stale_data(kind)
+        except Exception as e:
+            _logger.error(f"{self.device_id}: error getting {kind} data: {e}")
+            return self._stale_data(kind)
+        if data:
+            self._last_good[kind] = (self._clock.monotonic(), data)
+        return data
+
+    def _stale_data(self, kind: str) -> Optional[Dict[str, Any]]:
+        last_good = self._last_good.get(kind)
+        if last_good is None:
+            return None
+        taken_at, data = last_good
+        self._stale_publishes[kind] += 1
+        stale = dict(data)
+        stale["Stale"] = round(self._clock.monotonic() - taken_at, 1)
+        return stale
+
+    def _run_command_callback(self, callback: Callable[..., Any], *args):
+        """Run an application command callback within its deadline."""
+        try:
+            self._guards["command"].call(callback, *args)
+        except DeadlineExceededError as e:
+            _logger.warning(f"{self.device_id}: {e}")
+
+    def check_timer_jobs(self, now: Optional[float] = None) -> List[str]:
+        """Return the timer jobs that have not run within twice their interval.
+
+        Called periodically by the watchdog, which logs each stall once.
+        """
+        now = self._clock.monotonic() if now is None else now
+        late = []
+        for name, job in list(self._timer_jobs.items()):
+            interval = self._job_interval(name)
+            if now - job[0] <= 2 * interval:
+                continue
+            late.append(name)
+            if not job[1]:
+                job[1] = True
+                self._late_jobs[name] = self._late_jobs.get(name, 0) + 1
+                _logger.warning(
+                    f"{self.device_id}: {name} timer has not run for "
+                    f"{now - job[0]:.0f}s (interval {interval:.0f}s)"
+                )
+        return late
+
+    def _job_interval(self, name: str) -> float:
+        if name == "sensor":
+            return self._sensor_interval * self._interval_scale
+        if name == "state":
+            return STATE_INTERVAL * self._interval_scale
+        return STATUS0_INTERVAL
+
+    def _job_ran(self, name: str):
+        job = self._timer_jobs.get(name)
+        if job is None:
+            return
+        job[0] = self._clock.monotonic()
+        if job[1]:
+            job[1] = False
+            _logger.info(f"{self.device_id}: {name} timer is running again")
+
+    def mark_sampled(self, timestamp: Optional[float] = None):
+        """Record when the device data was read (wall-clock seconds, default now).
+
+        The data setters of the devices call this. Call it again with the
+        reading's own time if the data is known to be older.
+        """
+        self._sampled_at = self._clock.time() if timestamp is None else timestamp
+
+    @property
+    def sample_time(self) -> Optional[float]:
+        """Wall-clock time the current data was read, None if not tracked."""
+        return self._sampled_at
+
+    def set_max_sample_age(self, max_age: Optional[float], policy: str = STALE_FLAG):
+        """Treat SENSOR data read more than ``max_age`` seconds ago as stale.
+
+        With the "flag" policy stale data is published marked with ``Stale``
+        (its age in seconds), with "skip" it is not published at all. None
+        disables the check.
+        """
+        if policy not in STALE_POLICIES:
+            raise ValueError(f"Unknown stale data policy: {policy}")
+        self._max_sample_age = max_age
+        self._stale_policy = policy
+
+    def set_sample_time_field(self, enabled: bool):
+        """Add ``SampleTime``, when the data was read, to SENSOR payloads."""
+        self._sample_time_field = enabled
+
+    def _check_sample(self, data: Dict[str, Any],
+                      sample_time: float) -> Tuple[Optional[Dict[str, Any]], float]:
+        """Record the sample age and apply the stale data policy.
+
+        Returns the data to publish (None to skip it) and the sample age.
+        """
+        age = max(0.0, self._clock.time() - sample_time)
+        self._sample_age.record(age)
+        extra: Dict[str, Any] = {}
+        if self._sample_time_field:
+            extra["SampleTime"] = format_timestamp(sample_time)
+        stale = self._max_sample_age is not None and age > self._max_sample_age
+        if stale != self._sample_stale:
+            self._sample_stale = stale
+            if stale:
+                _logger.warning(f"{self.device_id}: SENSOR data is {age:.0f}s old")
+            else:
+                _logger.info(f"{self.device_id}: SENSOR data is fresh again")
+        if stale:
+            if self._stale_policy == STALE_SKIP:
+                self._stale_samples["skipped"] += 1
+                return None, age
+            self._stale_samples["flagged"] += 1
+            extra["Stale"] = round(age, 1)
+        return (add_fields(data, extra) if extra else data), age
+
+    def _sample_acked(self, age: float, handle):
+        if handle.delivered and handle.latency is not None:
+            self._sample_age_at_ack.record(age + handle.latency)
 
     def publish_sensor_data(self):
-        sensor_data = self.get_sensor_data()
+        if len(self._providers):
+            self._providers.refresh()
+        sensor_data = self._guarded_data("sensor", self.get_sensor_data)
+        if sensor_data is None:
+            return None
         # Ensure VERSION is always present even if device doesn't provide it
         if not isinstance(sensor_data, dict):
             sensor_data = {}
         if "VERSION" not in sensor_data:
             sensor_data["VERSION"] = self.get_version_data()
+        age = None
+        sample_time = self.sample_time
+        if sample_time is not None and "Stale" not in sensor_data:
+            sensor_data, age = self._check_sample(sensor_data, sample_time)
+            if sensor_data is None:
+                return None
+        if self._sensor_recorders:
+            self._record_sensor(sensor_data)
         # Callback will be set by client
         if hasattr(self, '_publish_callback'):
-            self._publish_callback(self.sensor_topic, sensor_data)
+            result = self._publish_callback(self.sensor_topic, sensor_data)
+            self._save_sensor(sensor_data)
+            if age is not None and hasattr(result, "add_done_callback"):
+                result.add_done_callback(lambda handle: self._sample_acked(age, handle))
+            return result
+
+    def set_burst_mode(self, duration: float, interval: float = 1.0, max_per_minute: int = 30):
+        """Configure high-rate SENSOR publishing after a command.
+
+        For ``duration`` seconds after trigger_burst() SENSOR is published every
+        ``interval`` seconds instead of the normal period. At most
+        ``max_per_minute`` burst publishes are sent in any 60 second window,
+        beyond that the normal schedule applies. Set duration to 0 to disable.
+        """
+        with self._burst_lock:
+            self._burst_duration = max(0.0, duration)
+            self._burst_interval = max(MIN_BURST_INTERVAL, interval)
+            self._burst_max_per_minute = max(1, int(max_per_minute))
+            if not self._burst_duration:
+                self._burst_until = 0.0
+
+    def trigger_burst(self):
+        """Start (or extend) a burst window if burst mode is enabled."""
+        with self._burst_lock:
+            if not self._burst_duration:
+                return
+            self._burst_until = self._clock.monotonic() + self._burst_duration
+            self._burst_triggered += 1
+        # Wake the sensor timer so it picks up the faster schedule now
+        self._sensor_wake_event.set()
+
+    @property
+    def burst_active(self) -> bool:
+        """True while a burst window is open."""
+        return self._clock.monotonic() < self._burst_until
+
+    def set_interval_scale(self, scale: float):
+        """Stretch the SENSOR and STATE periods by ``scale`` (1.0 is normal).
+
+        While stretched, burst mode is suspended.
+        """
+        self._interval_scale = max(1.0, scale)
+        self._sensor_wake_event.set()
+
+    def _next_sensor_interval(self) -> float:
+        """Return the period to use for the next SENSOR publish."""
+        normal = self._sensor_interval * self._interval_scale
+        now = self._clock.monotonic()
+        with self._burst_lock:
+            if now >= self._burst_until or self._interval_scale > 1.0:
+                return normal
+            self._expire_burst_publishes(now)
+            if len(self._burst_publish_times) >= self._burst_max_per_minute:
+                return normal
+            return self._burst_interval
+
+    def _record_sensor_publish(self):
+        """Account a SENSOR publish against the burst rate cap."""
+        now = self._clock.monotonic()
+        with self._burst_lock:
+            if now >= self._burst_until:
+                return
+            self._expire_burst_publishes(now)
+            if len(self._burst_publish_times) >= self._burst_max_per_minute:
+                self._burst_rate_limited += 1
+                return
+            self._burst_publish_times.append(now)
+            self._burst_publishes += 1
+
+    def _expire_burst_publishes(self, now: float):
+        while self._burst_publish_times and now - self._burst_publish_times[0] >= 60:
+            self._burst_publish_times.popleft()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get instrumentation counters for this device."""
+        now = self._clock.monotonic()
+        with self._burst_lock:
+            burst = {
+                "active": now < self._burst_until,
+                "remaining": max(0.0, self._burst_until - now),
+                "interval": self._burst_interval,
+                "duration": self._burst_duration,
+                "max_per_minute": self._burst_max_per_minute,
+                "triggered": self._burst_triggered,
+                "publishes": self._burst_publishes,
+                "rate_limited": self._burst_rate_limited,
+            }
+        return {
+            "sensor_interval": self._sensor_interval,
+            "interval_scale": self._interval_scale,
+            "burst": burst,
+            "providers": self._providers.get_stats(),
+            "deadlines": {
+                kind: dict(guard.get_stats(), stale_publishes=self._stale_publishes.get(kind, 0))
+                for kind, guard in self._guards.items()
+            },
+            "watchdog": {
+                "late": dict(self._late_jobs),
+                "stalled": [name for name, job in self._timer_jobs.items() if job[1]],
+            },
+            "samples": {
+                "max_age": self._max_sample_age,
+                "policy": self._stale_policy,
+                "flagged": self._stale_samples["flagged"],
+                "skipped": self._stale_samples["skipped"],
+                "age": self._sample_age.snapshot(),
+                "age_at_ack": self._sample_age_at_ack.snapshot(),
+            },
+        }
 
     def _start_sensor_timer(self):
         """Start timer for sending sensor data."""
         def sensor_timer():
-            while not self._sensor_timer_stop_event.wait(10):
+            last_publish = self._clock.monotonic()
+            while not self._sensor_timer_stop_event.is_set():
+                due = last_publish + self._next_sensor_interval()
+                if self._clock.wait(self._sensor_wake_event, max(0.0, due - self._clock.monotonic())):
+                    # Schedule changed (burst or stop) - recompute the due time
+                    self._sensor_wake_event.clear()
+                    continue
+                last_publish = self._clock.monotonic()
+                self._job_ran("sensor")
+                self._record_sensor_publish()
                 self.publish_sensor_data()
                     
-        self._sensor_timer_thread = threading.Thread(
-            target=sensor_timer, 
-            name=f"{self.__class__.__name__}SensorTimer"
+        self._sensor_timer_thread = self._clock.start_thread(
+            sensor_timer, f"{self.__class__.__name__}SensorTimer"
         )
-        self._sensor_timer_thread.daemon = True
-        self._sensor_timer_thread.start()
 
     def publish_state_data(self):
-        state_data = self.get_state_data()
+        state_data = self._guarded_data("state", self.get_state_data)
+        if state_data is None:
+            return None
         if hasattr(self, '_publish_callback'):
-            self._publish_callback(self.state_topic, state_data)
+            return self._publish_callback(self.state_topic, state_data)
 
     def _start_state_timer(self):
         """Start timer for sending state data."""
         def state_timer():
-            while not self._state_timer_stop_event.wait(60):
+            while not self._clock.wait(self._state_timer_stop_event,
+                                       STATE_INTERVAL * self._interval_scale):
+                self._job_ran("state")
                 self.publish_state_data()
 
-        self._state_timer_thread = threading.Thread(
-            target=state_timer, 
-            name=f"{self.__class__.__name__}StateTimer"
+        self._state_timer_thread = self._clock.start_thread(
+            state_timer, f"{self.__class__.__name__}StateTimer"
         )
-        self._state_timer_thread.daemon = True
-        self._state_timer_thread.start()
 
     def _start_status0_timer(self):
         """Start timer for sending status data."""
         def status0_timer():
             # Send at startup
-            status0_data = self.get_status0_data()
-            if hasattr(self, '_publish_callback'):
-                self._publish_callback(self.status0_topic, status0_data.to_dict())
+            self.publish_status0_data()
             # Then every 60 minutes
-            while not self._status0_timer_stop_event.wait(3600):
-                status0_data = self.get_status0_data()
-                if hasattr(self, '_publish_callback'):
-                    self._publish_callback(self.status0_topic, status0_data.to_dict())
-                    
-        self._status0_timer_thread = threading.Thread(
-            target=status0_timer, 
-            name=f"{self.__class__.__name__}Status0Timer"
+            while not self._clock.wait(self._status0_timer_stop_event, STATUS0_INTERVAL):
+                self._job_ran("status0")
+                self.publish_status0_data()
+
+        self._status0_timer_thread = self._clock.start_thread(
+            status0_timer, f"{self.__class__.__name__}Status0Timer"
         )
-        self._status0_timer_thread.daemon = True
-        self._status0_timer_thread.start()
+
+    def publish_status0_data(self):
+        if hasattr(self, '_publish_callback'):
+            return self._publish_callback(self.status0_topic, self.get_status0_data().to_dict())
 
     def get_status0_data(self) -> Status0Data:
         """Get current status data."""
@@ -209,18 +728,22 @@ class BaseDevice(ABC):
                 Mac=getmac.get_mac_address()
             ),
             StatusMQT=StatusMQTData(
-                MqttHost="mqtt-test.qilowatt.it",
-                MqttPort=8883,
+                MqttHost=self._mqtt_endpoint[0],
+                MqttPort=self._mqtt_endpoint[1],
                 MqttClient="",
                 MqttUser="",
                 MqttClientMask="QWAPI_%06X"
             ),
             StatusTIM=StatusTIMData(
-                UTC=datetime.utcnow().replace(tzinfo=timezone.utc).isoformat(),
-                Local=datetime.now().isoformat()
+                UTC=self._clock.utcnow().replace(tzinfo=timezone.utc).isoformat(),
+                Local=self._clock.localnow().isoformat()
             )
         )
 
-    def set_publish_callback(self, callback: Callable[[str, Dict[str, Any]], None]):
-        """Set callback for publishing data."""
+    def set_publish_callback(self, callback: Callable[[str, Dict[str, Any]], Any]):
+        """Set callback for publishing data.
+
+        Whatever the callback returns (the client returns a PublishHandle) is
+        passed back by publish_sensor_data() and publish_state_data().
+        """
         self._publish_callback = callback
\ No newline at end of file
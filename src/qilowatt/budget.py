@@ -0,0 +1,282 @@
+# qilowatt/budget.py
+
+import calendar
+import math
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from .clock import Clock, SYSTEM_CLOCK
+
+_logger = logging.getLogger(__name__)
+
+# SENSOR fields left out while saving bandwidth ("SECTION.Field" paths)
+DEFAULT_OPTIONAL_FIELDS = (
+    "ENERGY.Current",
+    "ENERGY.Voltage",
+    "METRICS.PvVoltage",
+    "METRICS.PvCurrent",
+    "METRICS.LoadCurrent",
+    "METRICS.BatteryCurrent",
+    "METRICS.GenVoltage",
+    "METRICS.GenPower",
+    "METRICS.GenCurrent",
+)
+
+# SENSOR sections compared by the deadband filter
+_DEADBAND_SECTIONS = ("ENERGY", "METRICS")
+
+# Projections are too noisy to act on before this share of the period passed
+_MIN_PROJECTION_FRACTION = 0.05
+
+# Leave saving mode once the projection is below this share of the budget
+_RESUME_RATIO = 0.9
+
+
+def publish_overhead(topic: str, payload_size: int, qos: int = 0) -> int:
+    """Estimate the MQTT bytes for a PUBLISH (and its PUBACK) besides the payload."""
+    remaining = 2 + len(topic.encode("utf-8")) + payload_size
+    if qos:
+        remaining += 2  # packet identifier
+    length_bytes = 1
+    while remaining >= 128 ** length_bytes and length_bytes < 4:
+        length_bytes += 1
+    overhead = 1 + length_bytes + remaining - payload_size
+    if qos:
+        overhead += 4  # PUBACK / PUBREC
+    if qos == 2:
+        overhead += 8  # PUBREL + PUBCOMP
+    return overhead
+
+
+class ByteCounter:
+    """Count MQTT bytes sent and received, per topic class."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.messages_in = 0
+        self._by_class: Dict[str, int] = {}
+
+    def sent(self, topic_class: Optional[str], size: int):
+        with self._lock:
+            self.bytes_out += size
+            self.messages_out += 1
+            key = topic_class or "other"
+            self._by_class[key] = self._by_class.get(key, 0) + size
+
+    def received(self, size: int):
+        with self._lock:
+            self.bytes_in += size
+            self.messages_in += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bytes_out": self.bytes_out,
+                "bytes_in": self.bytes_in,
+                "messages_out": self.messages_out,
+                "messages_in": self.messages_in,
+                "by_class": dict(self._by_class),
+            }
+
+
+class _Period:
+    """Usage within the current UTC day or month."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.start = 0.0
+        self.end = 0.0
+        self.used = 0
+
+    def roll(self, now: float):
+        if self.start <= now < self.end:
+            return
+        self.start, self.end = _period_bounds(self.name, now)
+        self.used = 0
+
+    def projected(self, now: float) -> Optional[float]:
+        fraction = (now - self.start) / (self.end - self.start)
+        if fraction < _MIN_PROJECTION_FRACTION:
+            return None
+        return self.used / fraction
+
+    def pressure(self, now: float) -> float:
+        """Projected (or, early in the period, actual) use relative to the limit."""
+        projected = self.projected(now)
+        ratio = self.used / self.limit
+        if projected is not None:
+            ratio = max(ratio, projected / self.limit)
+        return ratio
+
+
+def _period_bounds(name: str, now: float) -> Tuple[float, float]:
+    current = datetime.fromtimestamp(now, timezone.utc)
+    if name == "daily":
+        start = current.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start.timestamp(), start.timestamp() + 86400
+    start = current.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    days = calendar.monthrange(start.year, start.month)[1]
+    return start.timestamp(), start.timestamp() + days * 86400
+
+
+class BandwidthBudget:
+    """Daily/monthly byte budget for one client.
+
+    While the projected use of a period exceeds its limit the budget is in
+    saving mode: device intervals are stretched by the projected overshoot
+    (up to ``max_interval_scale``), SENSOR publishes whose values all stayed
+    within ``deadband`` of the last published ones are skipped (but at least
+    one goes out every ``heartbeat`` seconds), and ``optional_fields`` are
+    left out of SENSOR payloads.
+
+    Periods follow ``clock``; without one, the clock of the client the budget
+    is given to (see set_clock()).
+    """
+
+    def __init__(
+        self,
+        daily_bytes: Optional[int] = None,
+        monthly_bytes: Optional[int] = None,
+        deadband: float = 0.02,
+        max_interval_scale: float = 6.0,
+        heartbeat: float = 300.0,
+        optional_fields: Iterable[str] = DEFAULT_OPTIONAL_FIELDS,
+        clock: Optional[Clock] = None,
+    ):
+        self._periods = []
+        if daily_bytes:
+            self._periods.append(_Period("daily", daily_bytes))
+        if monthly_bytes:
+            self._periods.append(_Period("monthly", monthly_bytes))
+        self.deadband = deadband
+        self.max_interval_scale = max(1.0, max_interval_scale)
+        self.heartbeat = heartbeat
+        self._optional: Dict[str, Tuple[str, ...]] = {}
+        for path in optional_fields:
+            section, _, name = path.partition(".")
+            self._optional[section] = self._optional.get(section, ()) + (name,)
+        self._clock = clock or SYSTEM_CLOCK
+        self._own_clock = clock is not None
+        self._lock = threading.Lock()
+
+        self._saving = False
+        self._interval_scale = 1.0
+        self._last_sensor: Optional[Mapping[str, Any]] = None
+        self._last_sensor_at = 0.0
+        self.deadband_skipped = 0
+        self.fields_dropped = 0
+
+    def set_clock(self, clock: Clock):
+        """Use ``clock`` unless one was given to the constructor."""
+        if not self._own_clock:
+            self._clock = clock
+
+    @property
+    def saving(self) -> bool:
+        return self._saving
+
+    @property
+    def interval_scale(self) -> float:
+        return self._interval_scale
+
+    def record(self, size: int) -> bool:
+        """Account sent or received bytes. Returns True if the mode changed."""
+        now = self._clock.time()
+        with self._lock:
+            for period in self._periods:
+                period.roll(now)
+                period.used += size
+            return self._update_mode(now)
+
+    def _update_mode(self, now: float) -> bool:
+        pressure = max((p.pressure(now) for p in self._periods), default=0.0)
+        if pressure > 1.0:
+            saving, scale = True, min(self.max_interval_scale, math.ceil(pressure * 4) / 4)
+        elif self._saving and pressure > _RESUME_RATIO:
+            # Hold the current settings until clearly back under budget
+            saving, scale = True, self._interval_scale
+        else:
+            saving, scale = False, 1.0
+        changed = saving != self._saving or scale != self._interval_scale
+        if saving != self._saving:
+            _logger.warning(
+                "Bandwidth budget %s saving mode (projected use %.0f%% of budget)",
+                "entering" if saving else "leaving", pressure * 100,
+            )
+        self._saving = saving
+        self._interval_scale = scale
+        return changed
+
+    def filter_sensor(self, data: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+        """Apply deadband and optional-field filtering to a SENSOR payload.
+
+        Returns None if the publish should be skipped.
+        """
+        if not self._saving:
+            self._remember(data)
+            return data
+        now = self._clock.time()
+        if (self._last_sensor is not None and now - self._last_sensor_at < self.heartbeat
+                and not self._changed(self._last_sensor, data)):
+            self.deadband_skipped += 1
+            return None
+        self._remember(data)
+
+        filtered = dict(data)
+        for section, names in self._optional.items():
+            values = filtered.get(section)
+            if not isinstance(values, Mapping):
+                continue
+            kept = {k: v for k, v in values.items() if k not in names}
+            self.fields_dropped += len(values) - len(kept)
+            filtered[section] = kept
+        return filtered
+
+    def _remember(self, data: Mapping[str, Any]):
+        self._last_sensor = data
+        self._last_sensor_at = self._clock.time()
+
+    def _changed(self, old: Mapping[str, Any], new: Mapping[str, Any]) -> bool:
+        if old.get("WORKMODE") != new.get("WORKMODE"):
+            return True
+        for section in _DEADBAND_SECTIONS:
+            old_values, new_values = old.get(section) or {}, new.get(section) or {}
+            if old_values.keys() != new_values.keys():
+                return True
+            for key, value in new_values.items():
+                if self._value_changed(old_values[key], value):
+                    return True
+        return False
+
+    def _value_changed(self, old: Any, new: Any) -> bool:
+        if isinstance(new, (list, tuple)) and isinstance(old, (list, tuple)):
+            return len(old) != len(new) or any(
+                self._value_changed(a, b) for a, b in zip(old, new)
+            )
+        if isinstance(new, (int, float)) and isinstance(old, (int, float)):
+            return abs(new - old) > self.deadband * max(abs(old), 1.0)
+        return old != new
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = self._clock.time()
+        with self._lock:
+            periods = {}
+            for period in self._periods:
+                period.roll(now)
+                periods[period.name] = {
+                    "limit": period.limit,
+                    "used": period.used,
+                    "projected": period.projected(now),
+                }
+            return {
+                "periods": periods,
+                "saving": self._saving,
+                "interval_scale": self._interval_scale,
+                "deadband_skipped": self.deadband_skipped,
+                "fields_dropped": self.fields_dropped,
+            }
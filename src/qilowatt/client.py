@@ -1,16 +1,74 @@
 # qilowatt/client.py
 
+import contextvars
 import ssl
 import json
+import time
+import uuid
+from collections import deque
 import threading
 import logging
 import paho.mqtt.client as mqtt
-from typing import Dict, Any, Callable, List, Optional
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple, Union
 from .exceptions import ConnectionError, AuthenticationError
 from .base_device import BaseDevice
+from .tls import get_default_tls_context
+from .network_loop import SharedNetworkLoop
+from .outbound import OutboundQueue, DEFAULT_TOPIC_PRIORITIES, PRIORITY_NORMAL
+from .delivery import PublishHandle, InflightWindow
+from .histogram import LatencyHistogram
+from .serialization import SerializedData
+from .budget import BandwidthBudget, ByteCounter, publish_overhead
+from .recording import TrafficRecorder
+from .sinks import PublishSink
+from .clock import Clock, SYSTEM_CLOCK
+from .endpoints import Endpoint, EndpointSelector
 
 _logger = logging.getLogger(__name__)
 
+# CONNACK codes meaning bad credentials (MQTT 3.1.1 raw codes and MQTT 5 reason codes)
+AUTH_FAILURE_CODES = (4, 5, 134, 135)
+
+# CONNACK codes meaning the broker itself cannot take the connection (server
+# unavailable, server busy, use another server, server moved). Only these, and
+# transport failures, count against an endpoint: other refusals such as bad
+# credentials would be refused by every endpoint alike.
+ENDPOINT_FAILURE_CODES = (3, 136, 137, 156, 157)
+
+# Set while a network thread callback runs. A context variable rather than a
+# thread-local, so it also covers command callbacks run by a DeadlineGuard.
+_in_callback: "contextvars.ContextVar[bool]" = contextvars.ContextVar(
+    "qilowatt_in_callback", default=False
+)
+
+# MQTT 5 "Unsupported protocol version" reason code
+UNSUPPORTED_PROTOCOL_CODE = 132
+
+# Default MQTT 5 message expiry (seconds) per topic class
+DEFAULT_MESSAGE_EXPIRY = {
+    "SENSOR": 30,
+    "STATE": 120,
+    "POWER1": 120,
+    "STATUS0": 3600,
+}
+
+# Default QoS per topic class
+DEFAULT_QOS = {
+    "SENSOR": 0,
+    "STATE": 0,
+    "POWER1": 0,
+    "STATUS0": 0,
+}
+
+
+def _serialize(data: Any) -> str:
+    if isinstance(data, SerializedData):
+        return data.payload
+    return json.dumps(data)
+
+
 class QilowattMQTTClient:
     """Client to handle MQTT communication with Qilowatt server."""
 
@@ -25,20 +83,105 @@ class QilowattMQTTClient:
         max_auth_retries: int = 5,
         auth_retry_delay: float = 5.0,
         max_auth_retry_delay: float = 60.0,
+        mqtt_v5: bool = False,
+        session_expiry: int = 300,
+        message_expiry: Optional[Dict[str, int]] = None,
+        client_id: Optional[str] = None,
+        clean_session: bool = True,
+        tls_context: Optional[ssl.SSLContext] = None,
+        network_loop: Optional[SharedNetworkLoop] = None,
+        outbound_queue_size: Optional[int] = None,
+        topic_priorities: Optional[Dict[str, int]] = None,
+        max_unwritten: int = 10,
+        qos: Optional[Dict[str, int]] = None,
+        max_inflight: int = 20,
+        inflight_timeout: float = 5.0,
+        bandwidth_budget: Optional[BandwidthBudget] = None,
+        recorder: Optional[TrafficRecorder] = None,
+        clock: Optional[Clock] = None,
+        sinks: Optional[List[PublishSink]] = None,
+        endpoints: Optional[Union[Sequence[Tuple[str, int]], EndpointSelector]] = None,
+        endpoint_probe_interval: Optional[float] = 300.0,
     ):
         self.mqtt_username = mqtt_username
         self.mqtt_password = mqtt_password
         self.device = device
-
+        # A given clock drives the device's timers too
+        self._clock = clock or SYSTEM_CLOCK
+        if clock is not None:
+            device.set_clock(clock)
+
+        # Several endpoints: connect to the fastest healthy one, fail over on errors
+        if endpoints is not None and not isinstance(endpoints, EndpointSelector):
+            endpoints = EndpointSelector(endpoints)
+        self._endpoints: Optional[EndpointSelector] = endpoints
+        self._probe_interval = endpoint_probe_interval
+        self._probe_timer = None
+        if endpoints is not None:
+            host, port = endpoints.current
         self.host = host
         self.port = port
+        device.set_mqtt_endpoint(host, port)
         self.tls = tls
+        # Shared between clients unless a dedicated context is given
+        self._tls_context = tls_context
+        # Without a shared loop every client runs its own paho network thread
+        self._network_loop = network_loop
 
         self._max_auth_retries = max(0, max_auth_retries)
         self._auth_retry_delay = max(0.0, auth_retry_delay)
         self._max_auth_retry_delay = max(self._auth_retry_delay, max_auth_retry_delay)
 
-        self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        # MQTT 5 options - used only while the broker accepts v5
+        self._mqtt_v5 = mqtt_v5
+        self._session_expiry = max(0, int(session_expiry))
+        self._message_expiry = dict(DEFAULT_MESSAGE_EXPIRY)
+        if message_expiry:
+            self._message_expiry.update(message_expiry)
+        # A persistent session survives process restarts, so it needs a stable client id
+        self._clean_session = clean_session
+        if client_id:
+            self._client_id = client_id
+        elif not clean_session:
+            self._client_id = f"qilowatt-{device.device_id}"
+        else:
+            self._client_id = f"qilowatt-{device.device_id}-{uuid.uuid4().hex[:8]}"
+        self._topic_classes = {
+            device.sensor_topic: "SENSOR",
+            device.state_topic: "STATE",
+            device.power_topic: "POWER1",
+            device.status0_topic: "STATUS0",
+        }
+        self._alias_lock = threading.Lock()
+        self._topic_alias_max = 0
+        self._topic_aliases: Dict[str, int] = {}
+        self._publish_properties: Dict[str, Tuple[Properties, Optional[int]]] = {}
+        self._session_subscribed = False
+
+        # Delivery tracking - QoS 1/2 messages hold a slot until acknowledged
+        self._qos = dict(DEFAULT_QOS)
+        if qos:
+            self._qos.update(qos)
+        self._inflight_timeout = max(0.0, inflight_timeout)
+        self._inflight = InflightWindow(max_inflight, on_complete=self._on_delivery)
+        self._delivery_lock = threading.Lock()
+        self._delivered = 0
+        self._delivery_failures: Dict[str, int] = {}
+        self._ack_latency = {topic_class: LatencyHistogram() for topic_class in DEFAULT_QOS}
+
+        # Byte accounting, and optional budget for metered uplinks
+        self._bytes = ByteCounter()
+        self._budget = bandwidth_budget
+        if bandwidth_budget is not None:
+            bandwidth_budget.set_clock(self._clock)
+        self._recorder = recorder
+
+        # Reconnect-to-ready latency tracking
+        self._connect_started: Optional[float] = None
+        self._last_ready_latency: Optional[float] = None
+        self._session_resumes = 0
+
+        self._client = self._create_client()
         self._connected = False
         self._subscribed = False
         self._lock = threading.Lock()
@@ -55,28 +198,192 @@ class QilowattMQTTClient:
         self._max_subscribe_retries = 3
         self._subscribe_timeout = 5.0  # seconds to wait for SUBACK
 
+        # Outbound pipeline - without a queue, publishes run on the caller's thread
+        self._topic_priorities = dict(DEFAULT_TOPIC_PRIORITIES)
+        if topic_priorities:
+            self._topic_priorities.update(topic_priorities)
+        self._max_unwritten = max(1, max_unwritten)
+        self._unwritten: deque = deque()
+        self._outbound: Optional[OutboundQueue] = None
+        if outbound_queue_size:
+            self._outbound = OutboundQueue(
+                self._write_outbound,
+                max_depth=outbound_queue_size,
+                ready=lambda: self._client.is_connected(),
+                name=f"QilowattOutbound-{device.device_id}",
+                on_discard=lambda topic, item, reason: self._fail(item[1], reason),
+            )
+
+        # Extra destinations sharing each serialized payload
+        self._sinks: Tuple[PublishSink, ...] = ()
+        for sink in sinks or ():
+            self.add_sink(sink)
+
         # Enable automatic reconnection
         self._client.reconnect_delay_set(min_delay=10, max_delay=60)
 
         self._setup_client()
 
         # Set up device callback
-        def publish_callback(topic: str, data: Dict[str, Any]):
-            if self._client.is_connected():
-                payload = json.dumps(data)
-                result = self._client.publish(topic, payload)
-                if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                    _logger.debug(f"Published data to {topic}")
-                else:
-                    _logger.warning(f"Failed to publish to {topic}: {result.rc}")
-            else:
-                _logger.warning(f"Cannot publish to {topic}: not connected")
-                # Update our internal state if Paho detected disconnection
-                if self._connected:
-                    self._connected = False
-                    self._notify_connection_change(False)
-        
-        self.device.set_publish_callback(publish_callback)
+        self.device.set_publish_callback(self.publish)
+
+    def publish(self, topic: str, data: Any) -> PublishHandle:
+        """Publish JSON-serializable data with the QoS of the topic's class.
+
+        Returns a handle that resolves once the message was written (QoS 0)
+        or acknowledged by the broker (QoS 1/2).
+        """
+        topic_class = self._topic_classes.get(topic)
+        handle = PublishHandle(topic, self._qos.get(topic_class, 0))
+        payload = None
+        sinks = self._sinks
+        if sinks:
+            # Sinks get the full data; the budget only applies to our uplink
+            payload = _serialize(data)
+            for sink in sinks:
+                sink.submit(topic, payload, topic_class)
+        if self._budget is not None and topic_class == "SENSOR":
+            filtered = self._budget.filter_sensor(data)
+            if filtered is None:
+                # Not sent on purpose - not a delivery failure
+                handle._resolve(False, "deadband", skipped=True)
+                return handle
+            if filtered is not data:
+                data, payload = filtered, None
+        if payload is None:
+            payload = _serialize(data)
+        if self._outbound is not None:
+            priority = self._topic_priorities.get(topic_class, PRIORITY_NORMAL)
+            self._outbound.put(topic, (payload, handle), priority)
+        else:
+            self._publish_now(topic, payload, handle)
+        return handle
+
+    def _publish_now(self, topic: str, payload: str,
+                     handle: PublishHandle) -> Optional[mqtt.MQTTMessageInfo]:
+        """Hand a serialized payload to paho. Returns None if it was not published."""
+        if not self._client.is_connected():
+            self._report_not_connected(topic)
+            self._fail(handle, "not_connected")
+            return None
+        if handle.qos and not self._inflight.acquire(self._inflight_wait()):
+            _logger.warning(f"Cannot publish to {topic}: too many messages in flight")
+            self._fail(handle, "inflight_full")
+            return None
+
+        result = self._publish_payload(topic, payload, handle.qos)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            _logger.debug(f"Published data to {topic}")
+            self._inflight.track(result.mid, handle)
+            self._count_bytes_out(topic, payload, handle.qos)
+            self._record_outbound(topic, payload)
+        elif handle.qos and result.rc == mqtt.MQTT_ERR_NO_CONN:
+            # paho keeps QoS 1/2 messages and sends them after reconnecting
+            _logger.debug(f"Queued {topic} until reconnected")
+            self._inflight.track(result.mid, handle)
+            self._count_bytes_out(topic, payload, handle.qos)
+            self._record_outbound(topic, payload)
+        else:
+            _logger.warning(f"Failed to publish to {topic}: {result.rc}")
+            if handle.qos:
+                self._inflight.release()
+            self._fail(handle, "publish_error")
+        return result
+
+    def _count_bytes_out(self, topic: str, payload: str, qos: int):
+        # json.dumps output is ASCII, so its length is its size in bytes
+        size = len(payload) + publish_overhead(topic, len(payload), qos)
+        self._bytes.sent(self._topic_classes.get(topic), size)
+        self._record_budget(size)
+
+    def _record_budget(self, size: int):
+        if self._budget is not None and self._budget.record(size):
+            self.device.set_interval_scale(self._budget.interval_scale)
+
+    def add_sink(self, sink: PublishSink):
+        """Also send every published payload to ``sink`` and start it.
+
+        Sinks may be shared between clients, so they are not closed on
+        disconnect; close them once no client uses them anymore.
+        """
+        sink.start()
+        if sink not in self._sinks:
+            self._sinks = self._sinks + (sink,)
+
+    def remove_sink(self, sink: PublishSink):
+        """Stop sending to ``sink``. The sink keeps running."""
+        self._sinks = tuple(s for s in self._sinks if s is not sink)
+
+    def set_recorder(self, recorder: Optional[TrafficRecorder]):
+        """Start recording traffic into ``recorder``, or stop with None.
+
+        The recorder is not closed when it is replaced.
+        """
+        self._recorder = recorder
+
+    def _record_outbound(self, topic: str, payload: str):
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_outbound(topic, payload)
+
+    def _inflight_wait(self) -> float:
+        # Acks are processed on the network thread, so never block it waiting for one
+        if _in_callback.get():
+            return 0.0
+        return self._inflight_timeout
+
+    def _fail(self, handle: PublishHandle, reason: str):
+        if handle._resolve(False, reason):
+            self._count_failure(reason)
+
+    def _count_failure(self, reason: str):
+        with self._delivery_lock:
+            self._delivery_failures[reason] = self._delivery_failures.get(reason, 0) + 1
+
+    def _on_delivery(self, handle: PublishHandle):
+        """Account for a message resolved by the in-flight window."""
+        if not handle.delivered:
+            self._count_failure(handle.reason or "unknown")
+            return
+        with self._delivery_lock:
+            self._delivered += 1
+        histogram = self._ack_latency.get(self._topic_classes.get(handle.topic))
+        if handle.qos and histogram is not None:
+            histogram.record(handle.latency)
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        rejected = getattr(reason_code, "is_failure", False)
+        if rejected:
+            _logger.warning(f"Broker rejected message {mid}: {reason_code}")
+        self._inflight.complete(mid, not rejected, "rejected" if rejected else None)
+
+    def _report_not_connected(self, topic: str):
+        _logger.warning(f"Cannot publish to {topic}: not connected")
+        # Update our internal state if Paho detected disconnection
+        if self._connected:
+            self._connected = False
+            self._notify_connection_change(False)
+
+    def _write_outbound(self, topic: str, item: Tuple[str, PublishHandle]) -> bool:
+        """Outbound queue writer: publish and keep paho's own backlog short."""
+        payload, handle = item
+        result = self._publish_now(topic, payload, handle)
+        if result is None or result.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        self._unwritten.append(result)
+        while len(self._unwritten) > self._max_unwritten:
+            # Wait for the socket to take the oldest message, so messages wait
+            # in our latest-value slots rather than in paho's unbounded queue
+            try:
+                oldest = self._unwritten.popleft()
+            except IndexError:
+                # Cleared by _on_connect on the network thread
+                break
+            try:
+                oldest.wait_for_publish(timeout=self._client.keepalive or 30)
+            except (ValueError, RuntimeError):
+                pass
+        return True
 
     @property
     def connected(self) -> bool:
@@ -87,6 +394,11 @@ class QilowattMQTTClient:
         """
         return self._connected
 
+    @property
+    def mqtt_v5(self) -> bool:
+        """True when the client speaks MQTT 5 (False after falling back to 3.1.1)."""
+        return self._mqtt_v5
+
     @property
     def subscribed(self) -> bool:
         """Get the subscription state. True if subscribed to command topic."""
@@ -122,31 +434,232 @@ class QilowattMQTTClient:
             except Exception as e:
                 _logger.error(f"Error in connection callback: {e}")
 
+    @property
+    def persistent_session(self) -> bool:
+        """True when the broker is expected to keep our session between connections."""
+        if self._mqtt_v5:
+            return bool(self._session_expiry)
+        return not self._clean_session
+
+    def _create_client(self) -> mqtt.Client:
+        if self._mqtt_v5:
+            return mqtt.Client(
+                mqtt.CallbackAPIVersion.VERSION2,
+                client_id=self._client_id,
+                protocol=mqtt.MQTTv5,
+            )
+        if not self._clean_session:
+            return mqtt.Client(
+                mqtt.CallbackAPIVersion.VERSION2,
+                client_id=self._client_id,
+                clean_session=False,
+            )
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+
+    def _connect_kwargs(self) -> Dict[str, Any]:
+        if not self._mqtt_v5:
+            return {}
+        kwargs: Dict[str, Any] = {"properties": self._connect_properties()}
+        if not self._clean_session:
+            # Resume the session of a previous process too, not only on reconnect
+            kwargs["clean_start"] = False
+        return kwargs
+
+    def _connect_properties(self) -> Optional[Properties]:
+        if not self._mqtt_v5:
+            return None
+        properties = Properties(PacketTypes.CONNECT)
+        if self._session_expiry:
+            properties.SessionExpiryInterval = self._session_expiry
+        return properties
+
+    def _publish_payload(self, topic: str, payload: str, qos: int = 0) -> mqtt.MQTTMessageInfo:
+        """Publish using topic aliases and message expiry when on MQTT 5."""
+        if not self._mqtt_v5:
+            return self._client.publish(topic, payload, qos=qos)
+
+        with self._alias_lock:
+            cached = self._publish_properties.get(topic)
+            if cached is None:
+                cached = self._build_publish_properties(topic)
+                self._publish_properties[topic] = cached
+            properties, alias = cached
+
+            if alias is None:
+                return self._client.publish(topic, payload, qos=qos, properties=properties)
+            if topic in self._topic_aliases:
+                # Alias already known to the broker - send an empty topic
+                return self._client.publish("", payload, qos=qos, properties=properties)
+
+            result = self._client.publish(topic, payload, qos=qos, properties=properties)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._topic_aliases[topic] = alias
+            return result
+
+    def _build_publish_properties(self, topic: str) -> Tuple[Properties, Optional[int]]:
+        """Build the PUBLISH properties for a topic and assign it an alias if possible."""
+        properties = Properties(PacketTypes.PUBLISH)
+        topic_class = self._topic_classes.get(topic)
+        if topic_class is None:
+            return properties, None
+
+        expiry = self._message_expiry.get(topic_class)
+        if expiry:
+            properties.MessageExpiryInterval = expiry
+
+        if self._qos.get(topic_class):
+            # QoS 1/2 messages can be resent on a later connection, where the alias is unknown
+            return properties, None
+
+        alias = len([a for _, a in self._publish_properties.values() if a]) + 1
+        if alias > self._topic_alias_max:
+            return properties, None
+        properties.TopicAlias = alias
+        return properties, alias
+
+    def _reset_topic_aliases(self, properties: Optional[Properties]):
+        """Topic aliases are per network connection - start over on every CONNACK."""
+        with self._alias_lock:
+            self._topic_aliases.clear()
+            self._publish_properties.clear()
+            self._topic_alias_max = getattr(properties, "TopicAliasMaximum", 0) or 0
+
+    def _fall_back_to_v311(self):
+        """Replace the MQTT 5 client with a 3.1.1 one after the broker rejected v5."""
+        _logger.warning("Broker rejected MQTT 5, falling back to MQTT 3.1.1")
+        with self._lock:
+            if self._shutdown:
+                return
+            old_client = self._client
+            self._mqtt_v5 = False
+            self._reset_topic_aliases(None)
+            self._client = self._create_client()
+            self._client.reconnect_delay_set(min_delay=10, max_delay=60)
+            self._setup_client()
+            try:
+                # Called from the old network thread, so loop_stop only flags it to exit
+                self._close_client(old_client)
+            except Exception as exc:
+                _logger.debug("Error while closing MQTT 5 client: %s", exc)
+            # Unacknowledged messages went away with the old client
+            self._inflight.fail_all("abandoned")
+            self._client.connect_async(self.host, self.port, keepalive=30)
+            self._start_network(connect=True)
+
+    def _start_network(self, connect: bool = False):
+        """Start servicing the paho client's network traffic.
+
+        With a shared loop this must run before connecting; ``connect=True``
+        lets the loop do the (connect_async) connection itself.
+        """
+        if self._network_loop is None:
+            self._client.loop_start()
+            return
+        self._network_loop.add(self._client, lambda: not self._shutdown, connect=connect)
+
+    def _close_client(self, client: mqtt.Client):
+        """Disconnect a paho client and stop servicing it."""
+        if self._network_loop is None:
+            # Disconnect first so the network thread still writes the DISCONNECT
+            client.disconnect()
+            client.loop_stop()
+        else:
+            # The shared loop flushes the queued DISCONNECT before letting go
+            client.disconnect()
+            self._network_loop.remove(client)
+
     def _setup_client(self):
         if self.tls:
-            self._client.tls_set(cert_reqs=ssl.CERT_NONE)
-            self._client.tls_insecure_set(True)
+            self._client.tls_set_context(self._tls_context or get_default_tls_context())
 
         self._client.username_pw_set(self.mqtt_username, self.mqtt_password)
+        self._client.on_pre_connect = self._on_pre_connect
         self._client.on_connect = self._on_connect
         self._client.on_message = self._on_message
         self._client.on_disconnect = self._on_disconnect
+        self._client.on_connect_fail = self._on_connect_fail
         self._client.on_subscribe = self._on_subscribe
+        self._client.on_publish = self._on_publish
+        self._client.max_inflight_messages_set(self._inflight.max_inflight)
 
         # Set keep-alive to detect connection issues faster
         self._client.keepalive = 30
 
+    def _on_pre_connect(self, client, userdata):
+        self._connect_started = self._clock.monotonic()
+
+    def _mark_ready(self):
+        """Report the client as connected and record reconnect-to-ready latency."""
+        if self._connected:
+            return
+        if self._connect_started is not None:
+            self._last_ready_latency = self._clock.monotonic() - self._connect_started
+            self._connect_started = None
+        self._connected = True
+        self._notify_connection_change(True)
+        # STATUS0 reports the broker in use, so send it again after a failover
+        if self.device.set_mqtt_endpoint(self.host, self.port):
+            self.device.publish_status0_data()
+        # After a restart, show the last known state until fresh data arrives
+        self.device.publish_restored_state()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection instrumentation for this client."""
+        return {
+            "connected": self._connected,
+            "subscribed": self._subscribed,
+            "mqtt_v5": self._mqtt_v5,
+            "persistent_session": self.persistent_session,
+            "session_resumes": self._session_resumes,
+            "last_ready_latency": self._last_ready_latency,
+            "outbound": self._outbound.get_stats() if self._outbound else None,
+            "delivery": self.get_delivery_stats(),
+            "bandwidth": dict(
+                self._bytes.get_stats(),
+                budget=self._budget.get_stats() if self._budget else None,
+            ),
+            "recorder": self._recorder.get_stats() if self._recorder else None,
+            "sinks": {sink.name: sink.get_stats() for sink in self._sinks},
+            "endpoints": dict(
+                self._endpoints.get_stats(), in_use=f"{self.host}:{self.port}"
+            ) if self._endpoints else None,
+        }
+
+    def get_delivery_stats(self) -> Dict[str, Any]:
+        """Get QoS settings, delivery counters and ack latency per topic class."""
+        stats = self._inflight.get_stats()
+        with self._delivery_lock:
+            stats["delivered"] = self._delivered
+            stats["failed"] = dict(self._delivery_failures)
+        stats["qos"] = dict(self._qos)
+        stats["ack_latency"] = {
+            topic_class: histogram.snapshot()
+            for topic_class, histogram in self._ack_latency.items()
+        }
+        return stats
+
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         _logger.debug(f"Connected with result code {reason_code}")
         if reason_code == 0:
+            if self._endpoints is not None:
+                self._endpoints.record_success(Endpoint(self.host, self.port))
             self._cancel_retry_timer()
             self._auth_failures = 0
             self._last_error = None
             self._subscribed = False
             self._subscribe_attempts = 0
+            if self._mqtt_v5:
+                self._reset_topic_aliases(properties)
+            self._unwritten.clear()
+            if self._outbound is not None:
+                self._outbound.notify()
+            if self._resume_session(flags):
+                return
             # Subscribe to command topic and wait for SUBACK
             self._attempt_subscribe()
-        elif reason_code == 5:
+        elif self._mqtt_v5 and reason_code == UNSUPPORTED_PROTOCOL_CODE:
+            self._fall_back_to_v311()
+        elif reason_code in AUTH_FAILURE_CODES:
             self._handle_authentication_failure()
         else:
             error = ConnectionError(f"Connection failed with result code {reason_code}")
@@ -154,6 +667,29 @@ class QilowattMQTTClient:
             self._connected = False
             self._notify_connection_change(False)
             _logger.error(str(error))
+            if reason_code in ENDPOINT_FAILURE_CODES:
+                self._endpoint_failed()
+
+    def _resume_session(self, flags) -> bool:
+        """Skip the SUBSCRIBE round-trip when the broker kept our session.
+
+        Returns True if the existing subscription was reused.
+        """
+        if not self.persistent_session:
+            return False
+        if getattr(flags, "session_present", False) is not True:
+            self._session_subscribed = False
+            return False
+        # With clean_session=False the session may be left by a previous process,
+        # which subscribed to the command topic on connect as well
+        if self._clean_session and not self._session_subscribed:
+            return False
+        _logger.debug("Broker resumed session, reusing command subscription")
+        self._session_resumes += 1
+        self._subscribed = True
+        self._session_subscribed = True
+        self._mark_ready()
+        return True
 
     def _on_disconnect(self, client, userdata, flags, reason_code, properties):
         _logger.debug(f"Disconnected with result code {reason_code}")
@@ -162,11 +698,67 @@ class QilowattMQTTClient:
         self._pending_subscribe_mid = None
         self._connected = False
         self._notify_connection_change(False)
+        self._inflight.fail_unsent("not_connected")
+        # Reconnect to whichever endpoint is preferred now
+        self._apply_endpoint()
+
+    def _on_connect_fail(self, client, userdata):
+        _logger.debug(f"Could not reach {self.host}:{self.port}")
+        self._endpoint_failed()
+
+    def _endpoint_failed(self):
+        if self._endpoints is not None:
+            self._endpoints.record_failure(Endpoint(self.host, self.port))
+            self._apply_endpoint()
+
+    def _apply_endpoint(self):
+        """Point paho's automatic reconnects at the selected endpoint."""
+        if self._endpoints is None or self._shutdown:
+            return
+        host, port = self._endpoints.current
+        if (host, port) == (self.host, self.port):
+            return
+        self.host, self.port = host, port
+        # connect_async only stores the address for the next reconnect attempt
+        self._client.connect_async(host, port, keepalive=30, **self._connect_kwargs())
+
+    def _schedule_probe(self):
+        if (self._endpoints is None or not self._probe_interval
+                or len(self._endpoints.endpoints) < 2 or self._shutdown):
+            return
+        self._probe_timer = self._clock.call_later(self._probe_interval, self._run_probe)
+
+    def _run_probe(self):
+        if self._shutdown:
+            return
+        try:
+            self._endpoints.probe()
+            # A working connection is kept; the ranking applies to the next reconnect
+            if not self._client.is_connected():
+                self._apply_endpoint()
+        except Exception as e:
+            _logger.error(f"Error probing broker endpoints: {e}")
+        self._schedule_probe()
+
+    def _cancel_probe_timer(self):
+        if self._probe_timer is not None:
+            self._probe_timer.cancel()
+            self._probe_timer = None
 
     def _on_message(self, client, userdata, msg):
         _logger.debug(f"Message received on {msg.topic}: {msg.payload}")
+        size = len(msg.payload) + publish_overhead(msg.topic, len(msg.payload), msg.qos)
+        self._bytes.received(size)
+        self._record_budget(size)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record_inbound(msg.topic, msg.payload)
         if msg.topic == self.device.command_topic:
-            self.device.handle_command(msg.payload)
+            token = _in_callback.set(True)
+            try:
+                self.device.handle_command(msg.payload)
+            finally:
+                _in_callback.reset(token)
 
     def _attempt_subscribe(self):
         """Attempt to subscribe to the command topic with timeout tracking."""
@@ -184,11 +776,9 @@ class QilowattMQTTClient:
             )
             # Start timeout timer
             self._cancel_subscribe_timer()
-            self._subscribe_timer = threading.Timer(
+            self._subscribe_timer = self._clock.call_later(
                 self._subscribe_timeout, self._on_subscribe_timeout
             )
-            self._subscribe_timer.daemon = True
-            self._subscribe_timer.start()
         else:
             _logger.warning(f"Failed to send subscribe request: {result}")
             self._handle_subscribe_failure()
@@ -202,12 +792,11 @@ class QilowattMQTTClient:
             self._cancel_subscribe_timer()
             self._pending_subscribe_mid = None
             self._subscribed = True
+            self._session_subscribed = True
             self._subscribe_attempts = 0
 
             # Now we're fully connected and subscribed
-            if not self._connected:
-                self._connected = True
-                self._notify_connection_change(True)
+            self._mark_ready()
 
     def _on_subscribe_timeout(self):
         """Called when subscription confirmation times out."""
@@ -231,9 +820,7 @@ class QilowattMQTTClient:
             )
             # Still mark as connected so publishing works, but log the issue
             # The client can still publish, just won't receive commands
-            if not self._connected:
-                self._connected = True
-                self._notify_connection_change(True)
+            self._mark_ready()
 
     def _cancel_subscribe_timer(self):
         """Cancel the subscription timeout timer."""
@@ -254,22 +841,101 @@ class QilowattMQTTClient:
                 self._subscribe_attempts = 0
                 self._subscribed = False
                 self._last_error = None
-                self._client.connect(self.host, self.port, keepalive=30)
-                self._client.loop_start()
+                if self._outbound is not None:
+                    self._outbound.start()
+                if self._endpoints is None:
+                    self._open_connection()
+                    return
+                self._connect_endpoints()
+                self._cancel_probe_timer()
+                self._schedule_probe()
+
+    def _open_connection(self):
+        if self._network_loop is None:
+            self._client.connect(
+                self.host, self.port, keepalive=30, **self._connect_kwargs()
+            )
+            self._start_network()
+            return
+        # The shared loop must see the socket being opened
+        self._start_network()
+        try:
+            self._client.connect(
+                self.host, self.port, keepalive=30, **self._connect_kwargs()
+            )
+        except Exception:
+            self._network_loop.remove(self._client)
+            raise
+
+    def _connect_endpoints(self):
+        """Connect to the best endpoint, trying the others if it is unreachable."""
+        endpoints = self._endpoints
+        if not endpoints.probe_rounds and len(endpoints.endpoints) > 1:
+            endpoints.probe()
+        attempts = len(endpoints.endpoints)
+        for attempt in range(attempts):
+            self.host, self.port = endpoints.current
+            try:
+                self._open_connection()
+                return
+            except OSError as e:
+                if attempt == attempts - 1:
+                    raise
+                _logger.warning(f"Cannot connect to {self.host}:{self.port}: {e}")
+                endpoints.record_failure(immediate=True)
+
+    def disconnect(self, flush_timeout: float = 0.0) -> Dict[str, int]:
+        """Disconnect from the MQTT broker and stop the loop.
 
-    def disconnect(self):
-        """Disconnect from the MQTT broker and stop the loop."""
+        Args:
+            flush_timeout: Seconds to keep the connection open so queued and
+                unacknowledged QoS 1/2 messages can still be delivered. The device
+                timers are stopped first so no new messages are produced.
+
+        Returns:
+            Counts of messages ``flushed`` before disconnecting and of messages
+            ``abandoned`` because the deadline passed or the link was down.
+        """
+        self.device.stop_timers()
+        with self._delivery_lock:
+            delivered_before = self._delivered
+        if flush_timeout > 0 and self._client.is_connected():
+            self._flush(time.monotonic() + flush_timeout)
+
+        abandoned = 0
         with self._lock:
             self._shutdown = True
             self._cancel_retry_timer()
             self._cancel_subscribe_timer()
+            self._cancel_probe_timer()
+            if self._outbound is not None:
+                abandoned += self._outbound.stop()
             if self._connected or self._client.is_connected():
-                self._client.loop_stop()
-                self._client.disconnect()
+                self._close_client(self._client)
                 self._connected = False
                 self._subscribed = False
                 self._notify_connection_change(False)
-        self.device.stop_timers()
+            elif self._network_loop is not None:
+                self._network_loop.remove(self._client)
+        abandoned += self._inflight.fail_all("abandoned")
+
+        with self._delivery_lock:
+            flushed = self._delivered - delivered_before
+        if abandoned:
+            _logger.warning(f"Disconnected with {abandoned} undelivered messages")
+        return {"flushed": flushed, "abandoned": abandoned}
+
+    def _flush(self, deadline: float):
+        """Wait until the outbound queue and sinks are empty and QoS 1/2 messages acked.
+
+        QoS 0 messages handed to paho are written before its DISCONNECT packet,
+        so there is nothing to wait for.
+        """
+        if self._outbound is not None:
+            self._outbound.wait_empty(max(0.0, deadline - time.monotonic()))
+        for sink in self._sinks:
+            sink.flush(max(0.0, deadline - time.monotonic()))
+        self._inflight.wait_acknowledged(max(0.0, deadline - time.monotonic()))
 
     def last_error(self) -> Optional[Exception]:
         """Return the most recent connection error, if any."""
@@ -294,11 +960,7 @@ class QilowattMQTTClient:
                 self._shutdown = True
                 self._cancel_retry_timer()
                 try:
-                    self._client.loop_stop()
-                except Exception:
-                    pass
-                try:
-                    self._client.disconnect()
+                    self._close_client(self._client)
                 except Exception:
                     pass
             self.device.stop_timers()
@@ -325,9 +987,7 @@ class QilowattMQTTClient:
             if self._shutdown:
                 return
             self._cancel_retry_timer()
-            self._retry_timer = threading.Timer(delay, self._attempt_reauth)
-            self._retry_timer.daemon = True
-            self._retry_timer.start()
+            self._retry_timer = self._clock.call_later(delay, self._attempt_reauth)
 
     def _cancel_retry_timer(self):
         if self._retry_timer:
@@ -0,0 +1,206 @@
+# qilowatt/clock.py
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+_logger = logging.getLogger(__name__)
+
+# How long VirtualClock.advance() waits for woken threads to block again
+SETTLE_TIMEOUT = 5.0
+
+
+def format_timestamp(seconds: float) -> str:
+    """ISO timestamp (UTC, whole seconds) as used in payload ``Time`` fields."""
+    return datetime.fromtimestamp(int(seconds), timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class Clock:
+    """Time source and scheduler used by clients and devices.
+
+    This one uses the system clocks and real threads. Tests can pass a
+    VirtualClock instead to run timer schedules without waiting.
+    """
+
+    def __init__(self):
+        self._cached_timestamp: Tuple[int, str] = (-1, "")
+
+    def time(self) -> float:
+        """Wall-clock seconds since the epoch."""
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def utcnow(self) -> datetime:
+        """Current UTC time as a naive datetime (like datetime.utcnow())."""
+        return datetime.fromtimestamp(self.time(), timezone.utc).replace(tzinfo=None)
+
+    def localnow(self) -> datetime:
+        return datetime.fromtimestamp(self.time())
+
+    def timestamp(self) -> str:
+        """ISO timestamp of the current UTC second, formatted once per second."""
+        second = int(self.time())
+        cached = self._cached_timestamp
+        if cached[0] != second:
+            cached = (second, format_timestamp(second))
+            self._cached_timestamp = cached
+        return cached[1]
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        """Wait until ``event`` is set or ``timeout`` passed. Returns event.is_set()."""
+        return event.wait(timeout)
+
+    def call_later(self, delay: float, callback: Callable[[], Any]):
+        """Call ``callback`` after ``delay`` seconds. Returns an object with cancel()."""
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def start_thread(self, target: Callable[[], Any], name: str) -> threading.Thread:
+        """Start a daemon thread whose waits go through this clock."""
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class _VirtualTimer:
+    __slots__ = ("callback", "cancelled")
+
+    def __init__(self, callback: Callable[[], Any]):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock(Clock):
+    """Clock that only moves when advance() is called.
+
+    Threads started with start_thread() and blocked in wait() are woken in
+    deadline order, and advance() lets each one run until it waits again (or
+    exits) before moving on. call_later() callbacks run on the thread calling
+    advance(). Days of timer schedule run in milliseconds this way.
+    """
+
+    def __init__(self, start: float = 1000.0, wall_start: float = 1704067200.0):
+        super().__init__()
+        self._now = start
+        self._wall_offset = wall_start - start
+        self._cond = threading.Condition(threading.RLock())
+        self._timers: List[Tuple[float, int, _VirtualTimer]] = []
+        self._seq = itertools.count()
+        # Blocked threads: deadline (None: no timeout) and the event waited on
+        self._waiters: Dict[threading.Thread, Tuple[Optional[float], threading.Event]] = {}
+        # Threads from start_thread(), and those of them that may run until their next wait()
+        self._threads: Set[threading.Thread] = set()
+        self._running: Set[threading.Thread] = set()
+
+    def time(self) -> float:
+        return self._now + self._wall_offset
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        me = threading.current_thread()
+        with self._cond:
+            due = None if timeout is None else self._now + timeout
+            self._waiters[me] = (due, event)
+            self._running.discard(me)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if event.is_set():
+                        return True
+                    if due is not None and self._now >= due:
+                        return False
+                    # Event.set() does not notify us, so poll for it
+                    self._cond.wait(0.01)
+            finally:
+                del self._waiters[me]
+                if me in self._threads:
+                    self._running.add(me)
+
+    def call_later(self, delay: float, callback: Callable[[], Any]) -> _VirtualTimer:
+        timer = _VirtualTimer(callback)
+        with self._cond:
+            heapq.heappush(self._timers, (self._now + max(0.0, delay), next(self._seq), timer))
+        return timer
+
+    def start_thread(self, target: Callable[[], Any], name: str) -> threading.Thread:
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        with self._cond:
+            self._threads.add(thread)
+            self._running.add(thread)
+        thread.start()
+        return thread
+
+    def advance(self, seconds: float):
+        """Move time forward, running everything that falls due on the way."""
+        with self._cond:
+            target = self._now + max(0.0, seconds)
+        while True:
+            with self._cond:
+                self._settle()
+                due = self._next_due()
+                if due is None or due > target:
+                    self._now = target
+                    return
+                self._now = max(self._now, due)
+                self._cond.notify_all()
+                callbacks = []
+                while self._timers and self._timers[0][0] <= self._now:
+                    timer = heapq.heappop(self._timers)[2]
+                    if not timer.cancelled:
+                        callbacks.append(timer.callback)
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    _logger.error(f"Error in virtual timer callback: {e}")
+
+    def settle(self):
+        """Wait until every thread on this clock is blocked or finished."""
+        with self._cond:
+            self._settle()
+
+    def _next_due(self) -> Optional[float]:
+        dues = [due for due, _ in self._waiters.values() if due is not None]
+        if self._timers:
+            dues.append(self._timers[0][0])
+        return min(dues) if dues else None
+
+    def _settle(self):
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        while True:
+            self._threads = {t for t in self._threads if t.is_alive() or t.ident is None}
+            self._running = {
+                t for t in self._running if t in self._threads and t not in self._waiters
+            }
+            # Waiters whose event was set or whose deadline passed are about to run
+            busy = list(self._running) + [
+                thread for thread, (due, event) in self._waiters.items()
+                if event.is_set() or (due is not None and due <= self._now)
+            ]
+            if not busy:
+                return
+            if time.monotonic() > deadline:
+                _logger.warning(
+                    "Threads still running after %.0fs: %s", SETTLE_TIMEOUT,
+                    ", ".join(t.name for t in busy),
+                )
+                return
+            self._cond.wait(0.01)
@@ -0,0 +1,242 @@
+# qilowatt/delivery.py
+
+import threading
+import time
+import logging
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+# Guards handle state changes and lazy event creation for all handles;
+# handles are resolved once, so contention on it is negligible
+_handle_lock = threading.Lock()
+
+_PENDING = 0
+_DELIVERED = 1
+_FAILED = 2
+_SKIPPED = 3
+
+# Early outcomes kept for mids not tracked yet; entries only live until
+# publish() returns, so anything beyond this is stale and dropped oldest first
+_MAX_EARLY = 256
+
+
+class PublishHandle:
+    """Lightweight future for one publish.
+
+    A QoS 0 message counts as delivered once it was written to the socket,
+    QoS 1/2 messages once the broker acknowledged them. Failed handles carry
+    a short ``reason``: "not_connected", "superseded", "dropped",
+    "inflight_full", "publish_error", "rejected" or "abandoned". A message
+    deliberately not sent, e.g. "deadband", is ``skipped``: done but neither
+    delivered nor failed.
+    """
+
+    __slots__ = ("topic", "qos", "mid", "reason", "_state", "_created",
+                 "_latency", "_event", "_callbacks")
+
+    def __init__(self, topic: str, qos: int = 0):
+        self.topic = topic
+        self.qos = qos
+        self.mid: Optional[int] = None
+        self.reason: Optional[str] = None
+        self._state = _PENDING
+        self._created = time.monotonic()
+        self._latency: Optional[float] = None
+        self._event: Optional[threading.Event] = None
+        self._callbacks: Optional[List[Callable[["PublishHandle"], None]]] = None
+
+    def done(self) -> bool:
+        """True once the message was delivered or given up on."""
+        return self._state != _PENDING
+
+    @property
+    def delivered(self) -> bool:
+        return self._state == _DELIVERED
+
+    @property
+    def skipped(self) -> bool:
+        return self._state == _SKIPPED
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Seconds from publish to delivery, None until delivered."""
+        return self._latency
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the outcome. Returns True if the message was delivered."""
+        with _handle_lock:
+            if self._state == _PENDING and self._event is None:
+                self._event = threading.Event()
+            event = self._event
+        if event is not None:
+            event.wait(timeout)
+        return self._state == _DELIVERED
+
+    def add_done_callback(self, callback: Callable[["PublishHandle"], None]):
+        """Call ``callback(handle)`` once resolved (immediately if already done)."""
+        with _handle_lock:
+            if self._state == _PENDING:
+                if self._callbacks is None:
+                    self._callbacks = []
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _resolve(self, delivered: bool, reason: Optional[str] = None,
+                 skipped: bool = False) -> bool:
+        """Set the outcome. Returns False if the handle was already resolved."""
+        with _handle_lock:
+            if self._state != _PENDING:
+                return False
+            if delivered:
+                self._state = _DELIVERED
+                self._latency = time.monotonic() - self._created
+            else:
+                self._state = _SKIPPED if skipped else _FAILED
+                self.reason = reason
+            event, callbacks = self._event, self._callbacks
+            self._callbacks = None
+        if event is not None:
+            event.set()
+        for callback in callbacks or ():
+            self._run_callback(callback)
+        return True
+
+    def _run_callback(self, callback: Callable[["PublishHandle"], None]):
+        try:
+            callback(self)
+        except Exception as e:
+            _logger.error(f"Error in publish callback: {e}")
+
+    def __repr__(self):
+        state = {_PENDING: "pending", _DELIVERED: "delivered", _FAILED: "failed",
+                 _SKIPPED: "skipped"}[self._state]
+        return f"<PublishHandle {self.topic} qos={self.qos} mid={self.mid} {state}>"
+
+
+def failed_handle(topic: str, qos: int, reason: str) -> PublishHandle:
+    """Create an already failed handle."""
+    handle = PublishHandle(topic, qos)
+    handle._resolve(False, reason)
+    return handle
+
+
+class InflightWindow:
+    """Track published messages by mid until paho reports them sent or acked.
+
+    Only QoS 1/2 messages take a slot of the window; at most ``max_inflight``
+    of them may wait for their acknowledgement at any time. ``on_complete``
+    is called with every handle the window resolves.
+    """
+
+    def __init__(self, max_inflight: int = 20,
+                 on_complete: Optional[Callable[[PublishHandle], None]] = None):
+        self._max_inflight = max(1, max_inflight)
+        self._on_complete = on_complete
+        self._condition = threading.Condition()
+        self._handles: Dict[int, PublishHandle] = {}
+        # Outcomes reported by on_publish before publish() returned to the caller
+        self._early: Dict[int, Tuple[bool, Optional[str]]] = {}
+        self._slots = 0
+
+    @property
+    def max_inflight(self) -> int:
+        return self._max_inflight
+
+    @property
+    def inflight(self) -> int:
+        """Number of QoS 1/2 messages waiting for an acknowledgement."""
+        return self._slots
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Reserve a slot for a QoS 1/2 message, waiting up to ``timeout``."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._slots < self._max_inflight, timeout
+            ):
+                return False
+            self._slots += 1
+            return True
+
+    def release(self):
+        """Give back a slot whose message was never handed to paho."""
+        with self._condition:
+            self._slots = max(0, self._slots - 1)
+            self._condition.notify_all()
+
+    def track(self, mid: int, handle: PublishHandle):
+        """Start tracking a message paho accepted."""
+        handle.mid = mid
+        with self._condition:
+            outcome = self._early.pop(mid, None)
+            if outcome is None:
+                self._handles[mid] = handle
+                return
+        self._finish(handle, *outcome)
+
+    def complete(self, mid: int, delivered: bool = True,
+                 reason: Optional[str] = None) -> Optional[PublishHandle]:
+        """Resolve the message with ``mid``. Returns its handle if it was tracked."""
+        with self._condition:
+            handle = self._handles.pop(mid, None)
+            if handle is None:
+                self._early[mid] = (delivered, reason)
+                while len(self._early) > _MAX_EARLY:
+                    del self._early[next(iter(self._early))]
+                return None
+            self._condition.notify_all()
+        self._finish(handle, delivered, reason)
+        return handle
+
+    def _finish(self, handle: PublishHandle, delivered: bool, reason: Optional[str] = None):
+        handle._resolve(delivered, reason)
+        if handle.qos:
+            self.release()
+        if self._on_complete is not None:
+            try:
+                self._on_complete(handle)
+            except Exception as e:
+                _logger.error(f"Error in publish completion callback: {e}")
+
+    def fail_all(self, reason: str) -> int:
+        """Give up on every tracked message. Returns how many there were."""
+        with self._condition:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._early.clear()
+            self._slots = 0
+            self._condition.notify_all()
+        for handle in handles:
+            handle._resolve(False, reason)
+        return len(handles)
+
+    def fail_unsent(self, reason: str) -> int:
+        """Give up on the QoS 0 messages not written yet. Returns how many there were.
+
+        paho drops them when the connection is lost without calling on_publish;
+        QoS 1/2 messages are kept and sent again after reconnecting.
+        """
+        with self._condition:
+            handles = [handle for handle in self._handles.values() if not handle.qos]
+            for handle in handles:
+                del self._handles[handle.mid]
+            self._condition.notify_all()
+        for handle in handles:
+            self._finish(handle, False, reason)
+        return len(handles)
+
+    def wait_acknowledged(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no QoS 1/2 message waits for its acknowledgement."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not any(handle.qos for handle in self._handles.values()), timeout
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "inflight": self._slots,
+                "max_inflight": self._max_inflight,
+                "tracked": len(self._handles),
+            }
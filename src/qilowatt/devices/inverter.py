@@ -2,23 +2,73 @@ from ..base_device import BaseDevice
 from ..models import (
     EnergyData, MetricsData, WorkModeCommand
 )
+from ..snapshot import DataSnapshot, freeze, thaw
+from ..serialization import SerializedData, SectionEncoder, encode_object
+from ..exceptions import CommandError, DataValidationError
+from ..rules import (
+    ABSOLUTE_MAX_POWER, DEFAULT_ENERGY_RULES, DEFAULT_METRICS_RULES, POWER_FIELDS,
+    FieldRule, SectionRules, limit_rule,
+)
 import json
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any, Callable
+import threading
+from dataclasses import fields
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Callable, List, Mapping, Tuple
 
 _logger = logging.getLogger(__name__)
 
-# Absolute maximum power limit - failsafe that cannot be exceeded
-ABSOLUTE_MAX_POWER = 100000.0
+# Snapshot section -> (payload key, dataclass, power field limited on publish)
+_SECTIONS = {
+    "energy": ("ENERGY", EnergyData, "Power"),
+    "metrics": ("METRICS", MetricsData, "BatteryPower"),
+}
+
+def parse_workmode(payload: bytes) -> Tuple[str, Dict[str, Any], WorkModeCommand]:
+    """Split a ``WORKMODE {...}`` payload into its JSON, its data and the command.
+
+    Raises:
+        CommandError: If it is not a WORKMODE command with a JSON object.
+    """
+    try:
+        message = payload.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise CommandError(f"Command is not UTF-8: {e}")
+    if not message.startswith("WORKMODE"):
+        raise CommandError(f"Unknown command: {message.split(' ', 1)[0]!r}")
+    json_part = message[len("WORKMODE "):]
+    try:
+        data = json.loads(json_part)
+        return json_part, data, WorkModeCommand.from_dict(data)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise CommandError(f"Invalid WORKMODE command: {e}")
+
 
 class InverterDevice(BaseDevice):
     """Implementation of an inverter device."""
     
     def __init__(self, device_id: str):
         super().__init__(device_id)
-        self._energy_data: Optional[EnergyData] = None
-        self._metrics_data: Optional[MetricsData] = None
+        # Replaced as a whole on every write, never mutated - see snapshot
+        self._snapshot = DataSnapshot()
+        self._write_lock = threading.Lock()
+        # Rules as set by the user; power fields also get the power limits
+        self._user_rules = {
+            "energy": dict(DEFAULT_ENERGY_RULES),
+            "metrics": dict(DEFAULT_METRICS_RULES),
+        }
+        # Effective field rules, applied once to every new section before publishing
+        self._rules = {
+            "energy": SectionRules("ENERGY", DEFAULT_ENERGY_RULES),
+            "metrics": SectionRules("METRICS", DEFAULT_METRICS_RULES),
+        }
+        # Serialization caches, keyed by the immutable snapshot sections
+        self._sanitized_sections: Dict[
+            str, Tuple[Mapping[str, Any], int, Mapping[str, Any]]
+        ] = {}
+        self._encoders = {name: SectionEncoder() for name in _SECTIONS}
+        # Called with every new snapshot, e.g. by a PlantDevice
+        self._snapshot_listeners: List[Callable[[DataSnapshot], None]] = []
         self._workmode_command = WorkModeCommand.from_dict({"Mode": "normal"})
         self._on_command_callback: Optional[Callable[[WorkModeCommand], None]] = None
         
@@ -26,35 +76,228 @@ class InverterDevice(BaseDevice):
         self._max_energy_power: Optional[float] = None
         self._max_battery_power: Optional[float] = None
     
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """The latest ENERGY and METRICS data as one immutable snapshot."""
+        return self._snapshot
+
+    def add_snapshot_listener(self, listener: Callable[[DataSnapshot], None]):
+        """Call ``listener`` with every new snapshot, from the writing thread."""
+        if listener not in self._snapshot_listeners:
+            self._snapshot_listeners.append(listener)
+
+    def remove_snapshot_listener(self, listener: Callable[[DataSnapshot], None]):
+        if listener in self._snapshot_listeners:
+            self._snapshot_listeners.remove(listener)
+
+    def _notify_snapshot(self, snapshot: DataSnapshot):
+        for listener in list(self._snapshot_listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                _logger.error(f"Error in snapshot listener: {e}")
+
     def set_energy_data(self, energy_data: EnergyData):
-        """Set the ENERGY data."""
-        self._energy_data = energy_data
-        self._check_data_initialized()
+        """Set the ENERGY data.
+
+        Raises:
+            DataValidationError: If a value violates a "reject" field rule.
+        """
+        self._swap_snapshot(energy=freeze(energy_data))
 
     def set_metrics_data(self, metrics_data: MetricsData):
-        """Set the METRICS data."""
-        self._metrics_data = metrics_data
-        self._check_data_initialized()
+        """Set the METRICS data.
+
+        Raises:
+            DataValidationError: If a value violates a "reject" field rule.
+        """
+        self._swap_snapshot(metrics=freeze(metrics_data))
+
+    def set_data(self, energy_data: EnergyData, metrics_data: MetricsData):
+        """Set ENERGY and METRICS together, so they are never published apart.
+
+        Raises:
+            DataValidationError: If a value violates a "reject" field rule.
+        """
+        self._swap_snapshot(energy=freeze(energy_data), metrics=freeze(metrics_data))
+
+    def set_field_rule(self, section: str, field: str, rule: Optional[FieldRule]):
+        """Replace the rule for an ENERGY or METRICS field (None removes it).
+
+        Every field has a default rule, see qilowatt.rules. The power fields
+        (rules.POWER_FIELDS) stay limited to ABSOLUTE_MAX_POWER and to the
+        set_max_energy_power()/set_max_battery_power() limit whatever rule
+        is set. While such a limit is set, a "clamp" rule of that field
+        reports its violations as 0.
+        """
+        name = section.lower()
+        if name not in self._rules:
+            raise ValueError(f"Unknown data section: {section}")
+        if rule is None:
+            self._user_rules[name].pop(field, None)
+        else:
+            self._user_rules[name][field] = rule
+        self._install_rule(name, field)
+
+    def get_field_rule(self, section: str, field: str) -> Optional[FieldRule]:
+        """The rule applied to a field, power limits included."""
+        rules = self._rules.get(section.lower())
+        return rules.get_rule(field) if rules else None
+
+    def _install_rule(self, name: str, field: str):
+        rule = self._user_rules[name].get(field)
+        if field in POWER_FIELDS[_SECTIONS[name][0]]:
+            limit = ABSOLUTE_MAX_POWER
+            max_value = self._power_limit(name) if field == _SECTIONS[name][2] else None
+            if max_value is not None:
+                limit = min(max_value, ABSOLUTE_MAX_POWER)
+            rule = limit_rule(rule, limit, zero=max_value is not None)
+        self._rules[name].set_rule(field, rule)
+
+    def _power_limit(self, name: str) -> Optional[float]:
+        return self._max_energy_power if name == "energy" else self._max_battery_power
+
+    def apply_provider_result(self, result: Any):
+        """Apply data returned by a data provider.
+
+        Providers may return EnergyData, MetricsData, a dict of update()
+        arguments (``{"energy": {...}, "metrics": {...}}``) or None when they
+        have nothing new.
+        """
+        if result is None:
+            return
+        if isinstance(result, EnergyData):
+            self.set_energy_data(result)
+        elif isinstance(result, MetricsData):
+            self.set_metrics_data(result)
+        elif isinstance(result, Mapping):
+            unknown = set(result) - set(_SECTIONS)
+            if unknown:
+                raise DataValidationError(
+                    f"Unknown provider data sections: {', '.join(sorted(unknown))}"
+                )
+            self.update(**result)
+        else:
+            raise DataValidationError(
+                f"Unsupported provider result: {type(result).__name__}"
+            )
+
+    def update(
+        self,
+        energy: Optional[Mapping[str, Any]] = None,
+        metrics: Optional[Mapping[str, Any]] = None,
+    ) -> DataSnapshot:
+        """Change individual ENERGY/METRICS fields in one atomic step.
+
+        Only fields whose value actually changes are marked dirty in the new
+        snapshot; an update that changes nothing keeps the current snapshot.
+        A section that was never set must be given in full. The sample time
+        is updated either way, see mark_sampled().
+
+        Raises:
+            DataValidationError: If a field name is not part of the dataclass,
+                or a value violates a "reject" field rule.
+        """
+        patches = {"energy": energy, "metrics": metrics}
+        for name, patch in patches.items():
+            if patch:
+                self._validate_fields(name, patch)
+                self._rules[name].validate(patch)
+        # Fresh readings even if nothing changed
+        self.mark_sampled()
+
+        with self._write_lock:
+            current = self._snapshot
+            sections: Dict[str, Mapping[str, Any]] = {}
+            dirty = {}
+            for name, patch in patches.items():
+                if not patch:
+                    continue
+                section, changed = self._patch_section(name, getattr(current, name), patch)
+                if changed:
+                    sections[name] = section
+                    dirty[name] = changed
+            if not sections:
+                return current
+            snapshot = self._snapshot = current._replace(
+                version=current.version + 1, dirty=MappingProxyType(dirty), **sections
+            )
+            if not self._data_initialized:
+                self._check_data_initialized()
+        self._notify_snapshot(snapshot)
+        return snapshot
+
+    @staticmethod
+    def _validate_fields(name: str, patch: Mapping[str, Any]):
+        payload_key, data_class, _ = _SECTIONS[name]
+        unknown = set(patch) - {f.name for f in fields(data_class)}
+        if unknown:
+            raise DataValidationError(
+                f"Unknown {payload_key} fields: {', '.join(sorted(unknown))}"
+            )
+
+    @staticmethod
+    def _patch_section(name: str, section: Optional[Mapping[str, Any]],
+                       patch: Mapping[str, Any]):
+        if section is None:
+            payload_key, data_class, _ = _SECTIONS[name]
+            try:
+                section = freeze(data_class(**patch))
+            except TypeError as e:
+                raise DataValidationError(f"Incomplete {payload_key} data: {e}")
+            return section, frozenset(section)
+
+        frozen = freeze(patch)
+        changed = frozenset(key for key, value in frozen.items() if section[key] != value)
+        if not changed:
+            return section, changed
+        updated = dict(section)
+        updated.update((key, frozen[key]) for key in changed)
+        return MappingProxyType(updated), changed
+
+    def _swap_snapshot(self, **sections):
+        for name, section in sections.items():
+            self._rules[name].validate(section)
+        self.mark_sampled()
+        # The data was copied by the caller; the lock only orders the writers
+        dirty = MappingProxyType({name: frozenset(section) for name, section in sections.items()})
+        with self._write_lock:
+            current = self._snapshot
+            snapshot = self._snapshot = current._replace(
+                version=current.version + 1, dirty=dirty, **sections
+            )
+            self._check_data_initialized()
+        self._notify_snapshot(snapshot)
 
     def _check_data_initialized(self):
-        if self._energy_data and self._metrics_data and not self._data_initialized:
+        snapshot = self._snapshot
+        if snapshot.energy and snapshot.metrics and not self._data_initialized:
             self._data_initialized = True
             self.start_timers()
             
     def handle_command(self, payload: bytes):
         """Handle WORKMODE commands."""
         try:
-            message = payload.decode('utf-8')
-            if message.startswith("WORKMODE"):
-                json_part = message[len("WORKMODE "):]
-                data = json.loads(json_part)
-                command = WorkModeCommand.from_dict(data)
-                self._workmode_command = command
-                if self._on_command_callback:
-                    self._on_command_callback(command)
+            self.execute_command(payload)
         except Exception as e:
             _logger.error(f"Error processing command message: {e}")
 
+    def execute_command(self, payload: bytes):
+        """Apply a WORKMODE command, raising CommandError if it is invalid."""
+        json_part, _, command = parse_workmode(payload)
+        self._workmode_command = command
+        self._save_state("command", json_part.encode("utf-8"))
+        if self._on_command_callback:
+            self._run_command_callback(self._on_command_callback, command)
+        # Let the optimizer see the effect of the new mode quickly
+        self.trigger_burst()
+
+    def restore_state(self, store):
+        """Restore the last WORKMODE command received before a restart."""
+        command = store.get("command")
+        if command is not None:
+            self._workmode_command = WorkModeCommand.from_dict(json.loads(command))
+
     def set_command_callback(self, callback: Callable[[WorkModeCommand], None]):
         """Set callback for command handling."""
         self._on_command_callback = callback
@@ -62,60 +305,86 @@ class InverterDevice(BaseDevice):
     def set_max_energy_power(self, max_value: Optional[float]):
         """Set the maximum allowed value for Energy Power.
         
-        Values exceeding this limit will be reported as 0.
+        Values exceeding this limit will be reported as 0 (dropped or
+        rejected instead if the field's rule says so).
         Set to None to disable the limit.
         """
         self._max_energy_power = max_value
+        self._install_rule("energy", "Power")
 
     def set_max_battery_power(self, max_value: Optional[float]):
         """Set the maximum allowed value for Battery Power.
         
-        Values exceeding this limit (absolute value) will be reported as 0.
+        Values exceeding this limit (absolute value) will be reported as 0
+        (dropped or rejected instead if the field's rule says so).
         Set to None to disable the limit.
         """
         self._max_battery_power = max_value
+        self._install_rule("metrics", "BatteryPower")
 
-    def _apply_power_limits(self, values: list, max_value: Optional[float]) -> list:
-        """Apply max value limit to a list of power values.
-        
-        Returns 0 for any value that exceeds the max (by absolute value).
-        The absolute failsafe limit (ABSOLUTE_MAX_POWER) is always enforced.
-        """
-        effective_max = ABSOLUTE_MAX_POWER
-        if max_value is not None:
-            effective_max = min(max_value, ABSOLUTE_MAX_POWER)
-        return [0.0 if abs(v) > effective_max else v for v in values]
+    def sanitized_sections(self, snapshot: Optional[DataSnapshot] = None
+                           ) -> Tuple[Optional[Mapping[str, Any]], Optional[Mapping[str, Any]]]:
+        """ENERGY and METRICS of ``snapshot`` (default: the latest) as published."""
+        snapshot = snapshot or self._snapshot
+        return tuple(
+            None if section is None else self._sanitized_section(name, section)
+            for name, section in (("energy", snapshot.energy), ("metrics", snapshot.metrics))
+        )
+
+    def _sanitized_section(self, name: str, section: Mapping[str, Any]) -> Mapping[str, Any]:
+        """Return the section with its field rules applied, cached per snapshot."""
+        rules = self._rules[name]
+        cached = self._sanitized_sections.get(name)
+        if cached is not None and cached[1] != rules.version:
+            cached = None
+        if cached is not None and cached[0] is section:
+            return cached[2]
+        # Values shared with the previous section keep their checked result,
+        # and so their cached JSON
+        result = rules.apply(section, (cached[0], cached[2]) if cached else None)
+        self._sanitized_sections[name] = (section, rules.version, result)
+        return result
 
     def get_sensor_data(self) -> Dict[str, Any]:
         """Get current sensor data."""
         if not self._data_initialized:
             return {}
-        
-        # Apply power limits to energy data
-        energy_dict = self._energy_data.__dict__.copy()
-        energy_dict["Power"] = self._apply_power_limits(
-            self._energy_data.Power, self._max_energy_power
-        )
-        
-        # Apply power limits to metrics data
-        metrics_dict = self._metrics_data.__dict__.copy()
-        metrics_dict["BatteryPower"] = self._apply_power_limits(
-            self._metrics_data.BatteryPower, self._max_battery_power
-        )
-            
+
+        # One read of the reference gives a consistent ENERGY/METRICS pair
+        snapshot = self._snapshot
+        energy = self._sanitized_section("energy", snapshot.energy)
+        metrics = self._sanitized_section("metrics", snapshot.metrics)
+
         sensor_data = {
-            "Time": datetime.utcnow().isoformat(),
+            "Time": self._clock.timestamp(),
             "POWER1": 0,
             "VERSION": self.get_version_data(),
-            "ENERGY": energy_dict,
-            "METRICS": metrics_dict,
+            "ENERGY": thaw(energy),
+            "METRICS": thaw(metrics),
             "WORKMODE": self._workmode_command.to_dict()
         }
-        return sensor_data
+        # Unchanged ENERGY/METRICS fields reuse their JSON from the last publish
+        payload = encode_object([
+            f'"Time": {json.dumps(sensor_data["Time"])}',
+            '"POWER1": 0',
+            f'"VERSION": {json.dumps(sensor_data["VERSION"])}',
+            f'"ENERGY": {self._encoders["energy"].encode(energy)}',
+            f'"METRICS": {self._encoders["metrics"].encode(metrics)}',
+            f'"WORKMODE": {json.dumps(sensor_data["WORKMODE"])}',
+        ])
+        return SerializedData(sensor_data, payload)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get device counters, including field rule violations per section."""
+        stats = super().get_stats()
+        stats["rules"] = {
+            rules.name: dict(rules.violations) for rules in self._rules.values()
+        }
+        return stats
 
     def get_state_data(self) -> Dict[str, Any]:
         """Get current state data."""
         return {
-            "Time": datetime.utcnow().isoformat(),
-            "Uptime": int((datetime.utcnow() - self._startup_utc).total_seconds()),
+            "Time": self._clock.timestamp(),
+            "Uptime": int((self._clock.utcnow() - self._startup_utc).total_seconds()),
         }
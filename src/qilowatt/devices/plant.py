@@ -0,0 +1,343 @@
+from ..base_device import BaseDevice
+from ..models import WorkModeCommand
+from ..snapshot import DataSnapshot, thaw
+from ..serialization import SerializedData, SectionEncoder, encode_object
+from ..exceptions import CommandError
+from .inverter import InverterDevice, parse_workmode
+import json
+import logging
+import math
+import threading
+from itertools import zip_longest
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Callable, List, Mapping, Sequence, Tuple
+
+_logger = logging.getLogger(__name__)
+
+# How member values combine into the plant value
+SUM = "sum"
+MEAN = "mean"
+MAX = "max"
+
+# Section -> field -> aggregation, in payload order. List fields (phases,
+# PV strings) are combined index by index.
+AGGREGATIONS: Mapping[str, Mapping[str, str]] = MappingProxyType({
+    "energy": MappingProxyType({
+        "Power": SUM, "Today": SUM, "Total": SUM, "Current": SUM,
+        "Voltage": MEAN, "Frequency": MEAN,
+    }),
+    "metrics": MappingProxyType({
+        "PvPower": SUM, "PvVoltage": MEAN, "PvCurrent": SUM,
+        "LoadPower": SUM, "BatterySOC": MEAN, "LoadCurrent": SUM,
+        "BatteryPower": SUM, "BatteryCurrent": SUM, "BatteryVoltage": MEAN,
+        "GenVoltage": MEAN, "GenPower": SUM, "GenCurrent": SUM,
+        "GridExportLimit": SUM, "BatteryTemperature": MAX,
+        "InverterTemperature": MAX, "AlarmCodes": MAX, "InverterStatus": MAX,
+    }),
+})
+
+# WORKMODE fields that add up across the plant (W, or A for the currents):
+# split across members by weight, so the members together do what the plant
+# was asked to. The other fields (Mode, _source, the BatterySoc target and
+# unknown extras) are copied to every member.
+SPLIT_FIELDS = (
+    "PowerLimit", "MaxPower", "MxByPw", "MxSlPw", "PeakShaving",
+    "ChargeCurrent", "DischargeCurrent",
+)
+
+
+def _combine(how: str, values: List[Any]) -> Any:
+    if not values:
+        return None
+    if how == MAX:
+        return max(values)
+    total = math.fsum(values)
+    if how == MEAN:
+        mean = total / len(values)
+        if all(type(value) is int for value in values):
+            return int(round(mean))
+        return round(mean, 3)
+    if all(type(value) is int for value in values):
+        return int(total)
+    return round(total, 3)
+
+
+def _aggregate(how: str, values: List[Any]) -> Any:
+    """Combine one field's member values; lists column by column.
+
+    Missing readings (None) are left out; None if no member has one.
+    """
+    values = [value for value in values if value is not None]
+    if values and isinstance(values[0], (list, tuple)):
+        return tuple(
+            _combine(how, [value for value in column if value is not None])
+            for column in zip_longest(*values)
+        )
+    return _combine(how, values)
+
+
+def split_total(total: Any, weights: Sequence[float]) -> List[int]:
+    """Split ``total`` into integer parts proportional to ``weights``.
+
+    The parts always add up to ``total`` (rounded to an int); the remainder
+    left by rounding down goes to the largest fractions first.
+    """
+    total = int(round(total))
+    weight_sum = math.fsum(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    parts = [math.floor(share) for share in shares]
+    by_fraction = sorted(range(len(shares)), key=lambda i: parts[i] - shares[i])
+    for index in by_fraction[:total - sum(parts)]:
+        parts[index] += 1
+    return parts
+
+
+class _Member:
+    __slots__ = ("device", "weight", "version", "sections", "listener")
+
+    def __init__(self, device: InverterDevice, weight: float):
+        self.device = device
+        self.weight = weight
+        self.version = -1
+        # Member sections as published (field rules applied)
+        self.sections: Dict[str, Mapping[str, Any]] = {}
+        self.listener: Optional[Callable[[DataSnapshot], None]] = None
+
+
+class PlantDevice(BaseDevice):
+    """One device combining several InverterDevice members of a site.
+
+    The plant listens to its members' snapshots. When a member changes, only
+    the fields it changed are combined again across members (see
+    AGGREGATIONS): powers, currents and energy counters add up, voltages,
+    frequency and SOC are averaged, temperatures and codes take the maximum.
+    WORKMODE commands are passed on to every member with the SPLIT_FIELDS
+    limits and currents divided by the member weights.
+    """
+
+    def __init__(self, device_id: str, members: Sequence[InverterDevice] = (),
+                 weights: Optional[Sequence[float]] = None):
+        super().__init__(device_id)
+        if weights is not None and len(weights) != len(members):
+            raise ValueError("Need one weight per member")
+        self._lock = threading.Lock()
+        self._members: List[_Member] = []
+        self._snapshot = DataSnapshot()
+        self._totals: Dict[str, Dict[str, Any]] = {"energy": {}, "metrics": {}}
+        self._encoders = {name: SectionEncoder() for name in AGGREGATIONS}
+        self._workmode_command = WorkModeCommand.from_dict({"Mode": "normal"})
+        self._on_command_callback: Optional[Callable[[WorkModeCommand], None]] = None
+        for index, member in enumerate(members):
+            self.add_member(member, 1.0 if weights is None else weights[index])
+
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """The combined ENERGY and METRICS data."""
+        return self._snapshot
+
+    @property
+    def sample_time(self) -> Optional[float]:
+        """Sample time of the member with the oldest data."""
+        times = [m.device.sample_time for m in self._members]
+        times = [t for t in times if t is not None]
+        return min(times) if times else None
+
+    @property
+    def members(self) -> List[InverterDevice]:
+        return [member.device for member in self._members]
+
+    def add_member(self, device: InverterDevice, weight: float = 1.0):
+        """Add an inverter; ``weight`` is its share of the split WORKMODE fields."""
+        if weight < 0:
+            raise ValueError("Member weight must not be negative")
+        member = _Member(device, float(weight))
+        member.listener = lambda snapshot: self._member_changed(member, snapshot)
+        with self._lock:
+            if any(m.device is device for m in self._members):
+                return
+            self._members.append(member)
+        device.add_snapshot_listener(member.listener)
+        self._member_changed(member, device.snapshot)
+
+    def remove_member(self, device: InverterDevice):
+        with self._lock:
+            member = next((m for m in self._members if m.device is device), None)
+            if member is None:
+                return
+            self._members.remove(member)
+            device.remove_snapshot_listener(member.listener)
+            self._recombine({name: set(section) for name, section in member.sections.items()})
+
+    def set_weights(self, weights: Sequence[float]):
+        """Set the member weights, in member order."""
+        if len(weights) != len(self._members):
+            raise ValueError("Need one weight per member")
+        if any(weight < 0 for weight in weights):
+            raise ValueError("Member weight must not be negative")
+        with self._lock:
+            for member, weight in zip(self._members, weights):
+                member.weight = float(weight)
+
+    def get_weights(self) -> List[float]:
+        return [member.weight for member in self._members]
+
+    def _member_changed(self, member: _Member, snapshot: DataSnapshot):
+        sections = member.device.sanitized_sections(snapshot)
+        with self._lock:
+            # Listeners run outside the member's lock, so they can arrive late
+            if snapshot.version <= member.version or member not in self._members:
+                return
+            member.version = snapshot.version
+            changed: Dict[str, set] = {}
+            for name, section in zip(AGGREGATIONS, sections):
+                if section is None:
+                    continue
+                previous = member.sections.get(name, {})
+                keys = set(section) | set(previous)
+                changed[name] = {
+                    key for key in keys
+                    if key not in section or key not in previous or previous[key] != section[key]
+                }
+                member.sections[name] = section
+            self._recombine(changed)
+        if not self._data_initialized:
+            self._check_data_initialized()
+
+    def _recombine(self, changed: Mapping[str, set]):
+        """Combine the ``changed`` fields across members (lock held)."""
+        dirty = {}
+        sections = {}
+        for name, keys in changed.items():
+            if not keys:
+                continue
+            totals = self._totals[name]
+            for key in keys:
+                how = AGGREGATIONS[name].get(key)
+                if how is None:
+                    continue
+                values = [
+                    m.sections[name][key] for m in self._members
+                    if key in m.sections.get(name, ())
+                ]
+                if values:
+                    totals[key] = _aggregate(how, values)
+                else:
+                    totals.pop(key, None)
+            dirty[name] = frozenset(keys)
+            sections[name] = MappingProxyType(
+                {key: totals[key] for key in AGGREGATIONS[name] if key in totals}
+            )
+        if sections:
+            current = self._snapshot
+            self._snapshot = current._replace(
+                version=current.version + 1, dirty=MappingProxyType(dirty), **sections
+            )
+
+    def _check_data_initialized(self):
+        with self._lock:
+            ready = bool(self._members) and all(
+                len(member.sections) == len(AGGREGATIONS) for member in self._members
+            )
+            if not ready or self._data_initialized:
+                return
+            self._data_initialized = True
+        self.start_timers()
+
+    def handle_command(self, payload: bytes):
+        """Pass WORKMODE commands on to the members, splitting SPLIT_FIELDS."""
+        try:
+            self.execute_command(payload)
+        except Exception as e:
+            _logger.error(f"Error processing command message: {e}")
+
+    def execute_command(self, payload: bytes):
+        """Pass a WORKMODE command on to the members.
+
+        Raises:
+            CommandError: If the command is invalid, or after passing it on
+                if a member rejected its part.
+        """
+        json_part, data, command = parse_workmode(payload)
+        try:
+            parts = self._split_command(data)
+        except (ValueError, TypeError) as e:
+            raise CommandError(f"Cannot split WORKMODE command: {e}")
+        self._workmode_command = command
+        self._save_state("command", json_part.encode("utf-8"))
+        failed = []
+        for device, member_data in parts:
+            try:
+                device.execute_command(f"WORKMODE {json.dumps(member_data)}".encode("utf-8"))
+            except Exception as e:
+                failed.append(f"{device.device_id}: {e}")
+        if self._on_command_callback:
+            self._run_command_callback(self._on_command_callback, command)
+        self.trigger_burst()
+        if failed:
+            raise CommandError(f"WORKMODE failed on {'; '.join(failed)}")
+
+    def _split_command(self, data: Dict[str, Any]) -> List[Tuple[InverterDevice, Dict[str, Any]]]:
+        with self._lock:
+            members = [(member.device, member.weight) for member in self._members]
+        if not members:
+            return []
+        weights = [weight for _, weight in members]
+        if not math.fsum(weights) > 0:
+            raise ValueError("Member weights add up to 0")
+        commands = [dict(data) for _ in members]
+        for key in SPLIT_FIELDS:
+            if data.get(key) is None:
+                continue
+            for command, part in zip(commands, split_total(data[key], weights)):
+                command[key] = part
+        return [(device, command) for (device, _), command in zip(members, commands)]
+
+    def restore_state(self, store):
+        """Restore the last WORKMODE command received before a restart."""
+        command = store.get("command")
+        if command is not None:
+            self._workmode_command = WorkModeCommand.from_dict(json.loads(command))
+
+    def set_command_callback(self, callback: Callable[[WorkModeCommand], None]):
+        """Set callback called with the plant-wide command, before it is split."""
+        self._on_command_callback = callback
+
+    def get_sensor_data(self) -> Dict[str, Any]:
+        """Get current sensor data."""
+        if not self._data_initialized:
+            return {}
+
+        snapshot = self._snapshot
+        sensor_data = {
+            "Time": self._clock.timestamp(),
+            "POWER1": 0,
+            "VERSION": self.get_version_data(),
+            "ENERGY": thaw(snapshot.energy),
+            "METRICS": thaw(snapshot.metrics),
+            "WORKMODE": self._workmode_command.to_dict()
+        }
+        # Combined fields that did not change keep their JSON
+        payload = encode_object([
+            f'"Time": {json.dumps(sensor_data["Time"])}',
+            '"POWER1": 0',
+            f'"VERSION": {json.dumps(sensor_data["VERSION"])}',
+            f'"ENERGY": {self._encoders["energy"].encode(snapshot.energy)}',
+            f'"METRICS": {self._encoders["metrics"].encode(snapshot.metrics)}',
+            f'"WORKMODE": {json.dumps(sensor_data["WORKMODE"])}',
+        ])
+        return SerializedData(sensor_data, payload)
+
+    def get_state_data(self) -> Dict[str, Any]:
+        """Get current state data."""
+        return {
+            "Time": self._clock.timestamp(),
+            "Uptime": int((self._clock.utcnow() - self._startup_utc).total_seconds()),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["members"] = {
+            member.device.device_id: {"weight": member.weight, "version": member.version}
+            for member in self._members
+        }
+        return stats
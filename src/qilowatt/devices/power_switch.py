@@ -1,30 +1,72 @@
-from ..base_device import BaseDevice
-from typing import Dict, Any
-from ..models import Status0Data
+from ..schema import SchemaDevice, DeviceSchema, Field, Command, SWITCH, parse_switch
+from typing import Callable, Optional
 
-class PowerSwitchDevice(BaseDevice):
+
+class PowerSwitchDevice(SchemaDevice):
     """Implementation of a switch with power measurement."""
-    
+
+    schema = DeviceSchema(
+        sensor=(
+            Field("Switch1", "_state", kind=SWITCH),
+            Field("Power", "_power", precision=1, unit="W", section="ENERGY"),
+            Field("Voltage", "_voltage", precision=1, unit="V", section="ENERGY"),
+            Field("Current", "_current", precision=3, unit="A", section="ENERGY"),
+            Field("Today", "_today", precision=3, unit="kWh", section="ENERGY"),
+        ),
+        state=(
+            Field("Uptime", "uptime", unit="s"),
+            Field("POWER1", "_state", kind=SWITCH),
+        ),
+        commands=(
+            Command("POWER1", "set_power", parse=parse_switch),
+        ),
+        power="_state",
+    )
+
     def __init__(self, device_id: str):
         super().__init__(device_id)
         self._state = False
         self._power = 0.0
         self._voltage = 230.0
         self._current = 0.0
+        self._today = 0.0
+        self._on_switch_command_callback: Optional[Callable[[bool], None]] = None
         self._data_initialized = True
         self.start_timers()
-    
-    def handle_command(self, payload: bytes):
-        """Handle on/off commands."""
-        # Implement command handling for power switch
-        pass
-    
-    def get_sensor_data(self) -> Dict[str, Any]:
-        """Get current sensor data."""
-        # Implement sensor data for power switch
-        pass
-    
-    def get_state_data(self) -> Dict[str, Any]:
-        """Get current state data."""
-        # Implement state data for power switch
-        pass
\ No newline at end of file
+
+    def set_command_callback(self, callback: Callable[[bool], None]):
+        """Set callback for command handling."""
+        self._on_switch_command_callback = callback
+
+    def restore_state(self, store):
+        """Restore the on/off state from before a restart."""
+        self._state = store.get("power") == b"1"
+
+    def update(self, power: Optional[float] = None, voltage: Optional[float] = None,
+               current: Optional[float] = None, today: Optional[float] = None):
+        """Update the measured values. Omitted values are left unchanged."""
+        self.mark_sampled()
+        if power is not None:
+            self._power = float(power)
+        if voltage is not None:
+            self._voltage = float(voltage)
+        if current is not None:
+            self._current = float(current)
+        if today is not None:
+            self._today = float(today)
+
+    def set_power(self, on: bool):
+        """Switch on or off, publish the new state and tell the application."""
+        self._state = bool(on)
+        self._save_state("power", b"1" if self._state else b"0")
+        self.send_update()
+        if self._on_switch_command_callback:
+            self._run_command_callback(self._on_switch_command_callback, self._state)
+
+    def turn_on(self):
+        """Turn the switch on."""
+        self.set_power(True)
+
+    def turn_off(self):
+        """Turn the switch off."""
+        self.set_power(False)
@@ -1,7 +1,7 @@
 from ..base_device import BaseDevice
+from ..exceptions import CommandError
 from typing import Dict, Any
 from typing import Callable, Optional
-from datetime import datetime
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -29,32 +29,43 @@ class SwitchDevice(BaseDevice):
     def handle_command(self, payload: bytes):
         """Handle on/off commands."""
         try:
-            message = payload.decode('utf-8')
-            if message == "POWER1 1":
-                self.turn_on()
-            elif message == "POWER1 0":
-                self.turn_off()
+            self.execute_command(payload)
         except Exception as e:
             _logger.error(f"Error processing command message: {e}")
+
+    def execute_command(self, payload: bytes):
+        """Turn the switch on or off, raising CommandError for anything else."""
+        if payload == b"POWER1 1":
+            self.turn_on()
+        elif payload == b"POWER1 0":
+            self.turn_off()
+        else:
+            raise CommandError(f"Unknown command: {payload[:64]!r}")
  
+    def restore_state(self, store):
+        """Restore the on/off state from before a restart."""
+        self._state = store.get("power") == b"1"
+
     def turn_on(self):
         """Turn the switch on."""
         self._state = True
+        self._save_state("power", b"1")
         self.send_update()
         if self._on_switch_command_callback:
-            self._on_switch_command_callback(self._state)
+            self._run_command_callback(self._on_switch_command_callback, self._state)
 
     def turn_off(self):
         """Turn the switch off."""
         self._state = False
+        self._save_state("power", b"0")
         self.send_update()
         if self._on_switch_command_callback:
-            self._on_switch_command_callback(self._state)
+            self._run_command_callback(self._on_switch_command_callback, self._state)
    
     def get_sensor_data(self) -> Dict[str, Any]:
         """Get current sensor data."""
         return {
-            "Time": datetime.utcnow().isoformat(),
+            "Time": self._clock.timestamp(),
             "Switch1": "ON" if self._state else "OFF",
             "VERSION": self.get_version_data(),
         }
@@ -62,7 +73,7 @@ class SwitchDevice(BaseDevice):
     def get_state_data(self) -> Dict[str, Any]:
         """Get current state data."""
         return {
-            "Time": datetime.utcnow().isoformat(),
-            "Uptime": int((datetime.utcnow() - self._startup_utc).total_seconds()),
+            "Time": self._clock.timestamp(),
+            "Uptime": int((self._clock.utcnow() - self._startup_utc).total_seconds()),
             "POWER1": "ON" if self._state else "OFF",
         }
\ No newline at end of file
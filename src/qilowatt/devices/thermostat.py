@@ -1,29 +1,92 @@
-from ..base_device import BaseDevice
-from typing import Dict, Any
-from ..models import Status0Data
+from ..schema import SchemaDevice, DeviceSchema, Field, Command, SWITCH, TEXT
+from typing import Callable, Optional
+
+THERMOSTAT_MODES = ("heat", "cool", "off")
+
+# Allowed TARGET range in degrees Celsius
+MIN_TARGET_TEMPERATURE = 5.0
+MAX_TARGET_TEMPERATURE = 35.0
+
+
+class ThermostatDevice(SchemaDevice):
+    """Implementation of a thermostat device.
+
+    Accepts ``TARGET <degrees>`` and ``MODE <heat|cool|off>`` commands.
+    """
+
+    schema = DeviceSchema(
+        sensor=(
+            Field("Temperature", "_temperature", precision=1, unit="C", section="ANALOG"),
+            Field("Target", "_target_temperature", precision=1, unit="C", section="THERMOSTAT"),
+            Field("Mode", "_mode", kind=TEXT, section="THERMOSTAT"),
+            Field("Heating", "heating", kind=SWITCH, section="THERMOSTAT"),
+            Field("TempUnit", value="C"),
+        ),
+        state=(
+            Field("Uptime", "uptime", unit="s"),
+            Field("Mode", "_mode", kind=TEXT),
+            Field("POWER1", "heating", kind=SWITCH),
+        ),
+        commands=(
+            Command("TARGET", "set_target_temperature", parse=float,
+                    minimum=MIN_TARGET_TEMPERATURE, maximum=MAX_TARGET_TEMPERATURE),
+            Command("MODE", "set_mode", parse=lambda argument: argument.lower(),
+                    choices=THERMOSTAT_MODES),
+        ),
+        power="heating",
+    )
 
-class ThermostatDevice(BaseDevice):
-    """Implementation of a thermostat device."""
-    
     def __init__(self, device_id: str):
         super().__init__(device_id)
         self._temperature = 20.0
         self._target_temperature = 21.0
         self._mode = "heat"  # heat, cool, off
+        self._on_command_callback: Optional[Callable[[str, float], None]] = None
         self._data_initialized = True
         self.start_timers()
-    
-    def handle_command(self, payload: bytes):
-        """Handle temperature and mode commands."""
-        # Implement command handling for thermostat
-        pass
-    
-    def get_sensor_data(self) -> Dict[str, Any]:
-        """Get current sensor data."""
-        # Implement sensor data for thermostat
-        pass
-    
-    def get_state_data(self) -> Dict[str, Any]:
-        """Get current state data."""
-        # Implement state data for thermostat
-        pass
\ No newline at end of file
+
+    @property
+    def heating(self) -> bool:
+        """True while the thermostat calls for heat (or cooling in cool mode)."""
+        if self._mode == "heat":
+            return self._temperature < self._target_temperature
+        if self._mode == "cool":
+            return self._temperature > self._target_temperature
+        return False
+
+    def set_command_callback(self, callback: Callable[[str, float], None]):
+        """Set callback called with (mode, target temperature) after a command."""
+        self._on_command_callback = callback
+
+    def restore_state(self, store):
+        """Restore mode and target temperature from before a restart."""
+        mode = store.get("mode")
+        if mode is not None and mode.decode() in THERMOSTAT_MODES:
+            self._mode = mode.decode()
+        target = store.get("target")
+        if target is not None:
+            self._target_temperature = float(target)
+
+    def update_temperature(self, temperature: float):
+        """Set the measured room temperature."""
+        self._temperature = float(temperature)
+        self.mark_sampled()
+
+    def set_target_temperature(self, target: float):
+        self._target_temperature = float(target)
+        self._save_state("target", repr(self._target_temperature).encode())
+        self._command_applied()
+
+    def set_mode(self, mode: str):
+        if mode not in THERMOSTAT_MODES:
+            raise ValueError(f"Unknown thermostat mode: {mode}")
+        self._mode = mode
+        self._save_state("mode", mode.encode())
+        self._command_applied()
+
+    def _command_applied(self):
+        self.send_update()
+        if self._on_command_callback:
+            self._run_command_callback(
+                self._on_command_callback, self._mode, self._target_temperature
+            )
@@ -0,0 +1,218 @@
+# qilowatt/endpoints.py
+
+import socket
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+_logger = logging.getLogger(__name__)
+
+
+class Endpoint(NamedTuple):
+    """A broker address."""
+
+    host: str
+    port: int
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+def probe_rtt(endpoint: Endpoint, timeout: float = 2.0) -> Optional[float]:
+    """Time a TCP connect to ``endpoint``. Returns None if it failed.
+
+    Only the TCP handshake is measured - no TLS or MQTT session is set up,
+    so a probe costs the broker next to nothing.
+    """
+    started = time.monotonic()
+    try:
+        sock = socket.create_connection((endpoint.host, endpoint.port), timeout=timeout)
+    except OSError:
+        return None
+    rtt = time.monotonic() - started
+    sock.close()
+    return rtt
+
+
+class _EndpointState:
+    __slots__ = ("rtt", "healthy", "failures", "probes", "probe_failures")
+
+    def __init__(self):
+        self.rtt: Optional[float] = None
+        self.healthy = True
+        self.failures = 0
+        self.probes = 0
+        self.probe_failures = 0
+
+
+class EndpointSelector:
+    """Choose the broker endpoint a client connects to.
+
+    probe() measures every endpoint's RTT (smoothed over probes) and marks
+    endpoints whose probe fails as unhealthy. The current endpoint is only
+    replaced when it turns unhealthy, after ``failure_threshold`` connect
+    failures in a row, or when another endpoint is faster by at least
+    ``switch_margin`` (a fraction of the current RTT) and ``min_gain``
+    seconds - so similar endpoints do not make the client flap between them.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Union[Endpoint, Tuple[str, int]]],
+        failure_threshold: int = 3,
+        switch_margin: float = 0.3,
+        min_gain: float = 0.02,
+        smoothing: float = 0.3,
+        probe_timeout: float = 2.0,
+        probe: Callable[[Endpoint, float], Optional[float]] = probe_rtt,
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints: List[Endpoint] = [Endpoint(host, int(port)) for host, port in endpoints]
+        self._failure_threshold = max(1, failure_threshold)
+        self._switch_margin = max(0.0, switch_margin)
+        self._min_gain = max(0.0, min_gain)
+        self._smoothing = min(1.0, max(0.0, smoothing)) or 1.0
+        self._probe_timeout = probe_timeout
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._states = {endpoint: _EndpointState() for endpoint in self.endpoints}
+        self._current = self.endpoints[0]
+        self.switches = 0
+        self.probe_rounds = 0
+
+    @property
+    def current(self) -> Endpoint:
+        return self._current
+
+    def probe(self) -> Endpoint:
+        """Probe all endpoints in parallel and return the one to use."""
+        results: Dict[Endpoint, Optional[float]] = {}
+
+        def run(endpoint: Endpoint):
+            try:
+                results[endpoint] = self._probe(endpoint, self._probe_timeout)
+            except Exception as e:
+                _logger.debug(f"Probe of {endpoint} failed: {e}")
+                results[endpoint] = None
+
+        threads = [
+            threading.Thread(target=run, args=(endpoint,), name=f"QilowattProbe-{endpoint}")
+            for endpoint in self.endpoints
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(self._probe_timeout + 1.0)
+
+        with self._lock:
+            self.probe_rounds += 1
+            for endpoint in self.endpoints:
+                state = self._states[endpoint]
+                state.probes += 1
+                rtt = results.get(endpoint)
+                if rtt is None:
+                    state.probe_failures += 1
+                    state.healthy = False
+                    continue
+                state.healthy = True
+                if state.rtt is None:
+                    state.rtt = rtt
+                else:
+                    state.rtt += self._smoothing * (rtt - state.rtt)
+            if self.probe_rounds == 1:
+                # Nothing to stick to yet: start on the fastest endpoint
+                self._switch(self._ranked()[0], "fastest")
+            else:
+                self._reselect()
+            return self._current
+
+    def record_success(self, endpoint: Optional[Endpoint] = None):
+        """``endpoint`` (default: the current one) accepted a connection."""
+        with self._lock:
+            state = self._states.get(endpoint or self._current)
+            if state is not None:
+                state.failures = 0
+                state.healthy = True
+
+    def record_failure(self, endpoint: Optional[Endpoint] = None,
+                       immediate: bool = False) -> bool:
+        """A connection to ``endpoint`` (default: the current one) failed.
+
+        The endpoint turns unhealthy after ``failure_threshold`` failures in
+        a row, or at once with ``immediate``. Returns True on failover.
+        """
+        with self._lock:
+            endpoint = endpoint or self._current
+            state = self._states.get(endpoint)
+            if state is None:
+                return False
+            state.failures += 1
+            if state.failures < self._failure_threshold and not immediate:
+                return False
+            state.healthy = False
+            state.failures = 0
+            return endpoint == self._current and self._reselect()
+
+    def ranked(self) -> List[Endpoint]:
+        """Healthy endpoints, fastest first, then the rest in configured order."""
+        with self._lock:
+            return self._ranked()
+
+    def _ranked(self) -> List[Endpoint]:
+        order = {endpoint: index for index, endpoint in enumerate(self.endpoints)}
+
+        def key(endpoint: Endpoint):
+            state = self._states[endpoint]
+            # Never probed endpoints rank after measured ones, in list order
+            return (not state.healthy, state.rtt is None, state.rtt or 0.0, order[endpoint])
+
+        return sorted(self.endpoints, key=key)
+
+    def _reselect(self) -> bool:
+        current = self._states[self._current]
+        ranked = self._ranked()
+        if not current.healthy:
+            # Move on to the next endpoint even if none is known to be healthy
+            candidates = [e for e in ranked if e != self._current and self._states[e].healthy]
+            if not candidates:
+                index = self.endpoints.index(self._current)
+                candidates = [self.endpoints[(index + 1) % len(self.endpoints)]]
+            return self._switch(candidates[0], "unhealthy")
+
+        best = ranked[0]
+        best_rtt = self._states[best].rtt
+        if best == self._current or best_rtt is None or current.rtt is None:
+            return False
+        gain = current.rtt - best_rtt
+        if gain >= self._min_gain and best_rtt <= current.rtt * (1.0 - self._switch_margin):
+            return self._switch(best, f"{gain * 1000:.0f} ms faster")
+        return False
+
+    def _switch(self, endpoint: Endpoint, reason: str) -> bool:
+        if endpoint == self._current:
+            return False
+        _logger.warning(f"Switching broker endpoint from {self._current} to {endpoint} ({reason})")
+        self._current = endpoint
+        self.switches += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "current": str(self._current),
+                "switches": self.switches,
+                "probe_rounds": self.probe_rounds,
+                "endpoints": {
+                    str(endpoint): {
+                        "rtt": state.rtt,
+                        "healthy": state.healthy,
+                        "failures": state.failures,
+                        "probes": state.probes,
+                        "probe_failures": state.probe_failures,
+                    }
+                    for endpoint, state in self._states.items()
+                },
+            }
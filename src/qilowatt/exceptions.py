@@ -12,4 +12,16 @@ class AuthenticationError(QilowattException):
 
 class DataValidationError(QilowattException):
     """Raised when data validation fails."""
+    pass
+
+class DeadlineExceededError(QilowattException):
+    """Raised when a device call does not return within its deadline."""
+    pass
+
+class IPCError(QilowattException):
+    """Raised when the local IPC server rejects a request."""
+    pass
+
+class CommandError(QilowattException):
+    """Raised when a device cannot carry out a command."""
     pass
\ No newline at end of file
@@ -0,0 +1,426 @@
+# qilowatt/gateway.py
+
+import os
+import time
+import zlib
+import threading
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, List, Optional, Tuple, Type
+from .base_device import BaseDevice
+
+_logger = logging.getLogger(__name__)
+
+# Device methods whose latest call is kept and replayed into a restarted worker
+REPLAYED_METHOD_PREFIX = "set_"
+
+
+@dataclass
+class DeviceSpec:
+    """Everything a worker process needs to build one device and its client.
+
+    ``device_class`` must be importable by the worker (a module-level class)
+    and is called as ``device_class(device_id)``.
+    """
+    device_id: str
+    device_class: Type[BaseDevice]
+    mqtt_username: str
+    mqtt_password: str
+    client_kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+def shard_for(device_id: str, workers: int) -> int:
+    """Stable shard index for a device id (unlike hash(), same in every process)."""
+    return zlib.crc32(device_id.encode("utf-8")) % workers
+
+
+def _process_stats() -> Dict[str, float]:
+    times = os.times()
+    rss_mb = 0.0
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    rss_mb = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        pass
+    return {"cpu_s": times.user + times.system, "rss_mb": rss_mb}
+
+
+def _command_to_message(command: Any) -> Any:
+    # WorkModeCommand does not survive pickling, send its dict form instead
+    return command.to_dict() if hasattr(command, "to_dict") else command
+
+
+def _worker_main(conn, specs: List[DeviceSpec], stats_interval: float, retry_interval: float):
+    """Entry point of a worker process: run devices and clients for one shard."""
+    from .client import QilowattMQTTClient
+    from .network_loop import SharedNetworkLoop
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (OSError, EOFError):
+                pass
+
+    loop = SharedNetworkLoop()
+    devices: Dict[str, BaseDevice] = {}
+    clients: Dict[str, Any] = {}
+    unconnected: List[str] = []
+
+    def add(spec: DeviceSpec):
+        device = spec.device_class(spec.device_id)
+        if hasattr(device, "set_command_callback"):
+            device_id = spec.device_id
+            device.set_command_callback(
+                lambda command: send(("command", device_id, _command_to_message(command)))
+            )
+        devices[spec.device_id] = device
+        clients[spec.device_id] = QilowattMQTTClient(
+            spec.mqtt_username, spec.mqtt_password, device,
+            network_loop=loop, **spec.client_kwargs
+        )
+        connect(spec.device_id)
+
+    def connect(device_id: str):
+        try:
+            clients[device_id].connect()
+        except Exception as exc:
+            _logger.warning(f"Connect failed for {device_id}: {exc}")
+            unconnected.append(device_id)
+
+    def call(device_id: str, method: str, args: tuple):
+        device = devices.get(device_id)
+        if device is None:
+            _logger.warning(f"Unknown device {device_id}")
+            return
+        try:
+            getattr(device, method)(*args)
+        except Exception as exc:
+            _logger.error(f"Error calling {method} on {device_id}: {exc}")
+
+    def stats():
+        per_device = {}
+        for device_id, device in devices.items():
+            per_device[device_id] = {
+                "device": device.get_stats(),
+                "client": clients[device_id].get_stats(),
+            }
+        result = _process_stats()
+        result.update({
+            "pid": os.getpid(),
+            "devices": len(devices),
+            "connected": sum(1 for c in clients.values() if c.connected),
+            "per_device": per_device,
+        })
+        return result
+
+    for spec in specs:
+        add(spec)
+
+    next_stats = time.monotonic()
+    next_retry = time.monotonic() + retry_interval
+    running = True
+    while running:
+        timeout = max(0.0, min(next_stats, next_retry) - time.monotonic())
+        try:
+            has_message = conn.poll(timeout)
+            message = conn.recv() if has_message else None
+        except (OSError, EOFError):
+            break  # Supervisor went away
+
+        if message is not None:
+            kind = message[0]
+            if kind == "calls":
+                for device_id, method, args in message[1]:
+                    call(device_id, method, args)
+            elif kind == "add":
+                add(message[1])
+            elif kind == "stop":
+                running = False
+
+        now = time.monotonic()
+        if now >= next_retry:
+            next_retry = now + retry_interval
+            retry, unconnected[:] = list(unconnected), []
+            for device_id in retry:
+                connect(device_id)
+        if now >= next_stats or not running:
+            next_stats = now + stats_interval
+            send(("stats", stats()))
+
+    for client in clients.values():
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+    loop.stop()
+    conn.close()
+
+
+class _Worker:
+    """Parent-side handle of one worker process."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.specs: List[DeviceSpec] = []
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        # Pending calls; set_* calls are coalesced per (device_id, method)
+        self.buffer: Dict[Any, Tuple[str, str, tuple]] = {}
+        self.sequence = 0
+        self.stats: Dict[str, Any] = {}
+        self.restarts = 0
+        self.restart_at: Optional[float] = None
+
+
+class GatewaySupervisor:
+    """Shard devices across worker processes, each running its own clients.
+
+    One Python process is limited to one core for JSON encoding and TLS.
+    The supervisor assigns every device to a worker by a stable hash of its
+    device_id. Data is sent to the workers in bulk over pipes and commands
+    are forwarded back to ``on_command(device_id, command)``. A dead worker
+    is restarted and gets the latest ``set_*`` calls of its devices replayed.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        on_command: Optional[Callable[[str, Any], None]] = None,
+        flush_interval: float = 0.2,
+        stats_interval: float = 5.0,
+        restart_delay: float = 1.0,
+        connect_retry_interval: float = 10.0,
+        mp_context: Optional[str] = "spawn",
+    ):
+        self._worker_count = max(1, workers or os.cpu_count() or 1)
+        self._on_command = on_command
+        self._flush_interval = flush_interval
+        self._stats_interval = stats_interval
+        self._restart_delay = restart_delay
+        self._connect_retry_interval = connect_retry_interval
+        self._mp = multiprocessing.get_context(mp_context)
+
+        self._workers = [_Worker(i) for i in range(self._worker_count)]
+        self._device_workers: Dict[str, _Worker] = {}
+        self._last_calls: Dict[Tuple[str, str], tuple] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def add_device(self, spec: DeviceSpec):
+        """Assign a device to its worker (starting it there if already running)."""
+        worker = self._workers[shard_for(spec.device_id, self._worker_count)]
+        with self._lock:
+            worker.specs.append(spec)
+            self._device_workers[spec.device_id] = worker
+            running = self._running
+        if running and worker.conn is not None:
+            self._send(worker, ("add", spec))
+
+    def worker_for(self, device_id: str) -> int:
+        """Index of the worker running a device."""
+        return self._device_workers[device_id].index
+
+    def start(self):
+        """Start the worker processes and the supervisor thread."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        for worker in self._workers:
+            self._start_worker(worker)
+        self._thread = threading.Thread(target=self._supervise, name="QilowattGatewaySupervisor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush pending calls, stop the workers and wait for them to exit."""
+        self.flush()
+        with self._lock:
+            self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            if worker.conn is not None:
+                self._send(worker, ("stop",))
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.process = None
+            if worker.conn is not None:
+                worker.conn.close()
+                worker.conn = None
+
+    def submit(self, device_id: str, method: str, *args):
+        """Queue ``device.<method>(*args)`` for the device's worker.
+
+        Calls are sent in bulk on the next flush. Repeated ``set_*`` calls for
+        the same device are coalesced, only the latest value is sent.
+        """
+        worker = self._device_workers[device_id]
+        with self._lock:
+            if method.startswith(REPLAYED_METHOD_PREFIX):
+                self._last_calls[(device_id, method)] = args
+                key: Any = (device_id, method)
+            else:
+                worker.sequence += 1
+                key = worker.sequence
+            worker.buffer.pop(key, None)
+            worker.buffer[key] = (device_id, method, args)
+
+    def set_energy_data(self, device_id: str, energy_data):
+        self.submit(device_id, "set_energy_data", energy_data)
+
+    def set_metrics_data(self, device_id: str, metrics_data):
+        self.submit(device_id, "set_metrics_data", metrics_data)
+
+    def flush(self):
+        """Send all queued calls, one message per worker."""
+        for worker in self._workers:
+            with self._lock:
+                if not worker.buffer or worker.conn is None:
+                    continue
+                calls = list(worker.buffer.values())
+                worker.buffer.clear()
+            self._send(worker, ("calls", calls))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aggregated view over all workers (as of their last report)."""
+        per_worker = []
+        totals = {"devices": 0, "connected": 0, "cpu_s": 0.0, "rss_mb": 0.0}
+        with self._lock:
+            for worker in self._workers:
+                alive = worker.process is not None and worker.process.is_alive()
+                stats = worker.stats
+                for key in totals:
+                    totals[key] += stats.get(key, 0)
+                per_worker.append({
+                    "index": worker.index,
+                    "alive": alive,
+                    "pid": stats.get("pid"),
+                    "devices": len(worker.specs),
+                    "connected": stats.get("connected", 0),
+                    "cpu_s": stats.get("cpu_s", 0.0),
+                    "rss_mb": stats.get("rss_mb", 0.0),
+                    "restarts": worker.restarts,
+                })
+        totals.update({
+            "workers": self._worker_count,
+            "alive": sum(1 for w in per_worker if w["alive"]),
+            "restarts": sum(w["restarts"] for w in per_worker),
+            "per_worker": per_worker,
+        })
+        return totals
+
+    def get_device_stats(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Last reported device/client stats of one device."""
+        worker = self._device_workers[device_id]
+        return worker.stats.get("per_device", {}).get(device_id)
+
+    def _start_worker(self, worker: _Worker):
+        parent_conn, child_conn = self._mp.Pipe()
+        with self._lock:
+            specs = list(worker.specs)
+            replay = [
+                (device_id, method, args)
+                for (device_id, method), args in self._last_calls.items()
+                if self._device_workers.get(device_id) is worker
+            ]
+            # Replayed state supersedes anything still buffered for the old process
+            worker.buffer = {
+                k: v for k, v in worker.buffer.items()
+                if not isinstance(k, tuple)
+            }
+        process = self._mp.Process(
+            target=_worker_main,
+            args=(child_conn, specs, self._stats_interval, self._connect_retry_interval),
+            name=f"QilowattGatewayWorker-{worker.index}",
+        )
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.restart_at = None
+        if replay:
+            self._send(worker, ("calls", replay))
+
+    def _send(self, worker: _Worker, message):
+        with worker.send_lock:
+            if worker.conn is None:
+                return
+            try:
+                worker.conn.send(message)
+            except (OSError, EOFError) as exc:
+                _logger.warning(f"Worker {worker.index} unreachable: {exc}")
+
+    def _supervise(self):
+        next_flush = time.monotonic()
+        while self._running:
+            conns = {w.conn: w for w in self._workers if w.conn is not None}
+            timeout = max(0.0, next_flush - time.monotonic())
+            for conn in wait(list(conns), timeout) if conns else []:
+                self._receive(conns[conn])
+            if not conns:
+                time.sleep(timeout)
+
+            now = time.monotonic()
+            if now >= next_flush:
+                next_flush = now + self._flush_interval
+                self.flush()
+            self._check_workers(now)
+
+    def _receive(self, worker: _Worker):
+        try:
+            message = worker.conn.recv()
+        except (OSError, EOFError):
+            self._mark_dead(worker)
+            return
+        kind = message[0]
+        if kind == "stats":
+            with self._lock:
+                worker.stats = message[1]
+        elif kind == "command" and self._on_command:
+            try:
+                self._on_command(message[1], message[2])
+            except Exception as exc:
+                _logger.error(f"Error in command callback: {exc}")
+
+    def _mark_dead(self, worker: _Worker):
+        if worker.process is not None and worker.process.is_alive():
+            # Lost the pipe but not the process - replace it
+            worker.process.terminate()
+            worker.process.join()
+        worker.process = None
+        with worker.send_lock:
+            if worker.conn is not None:
+                worker.conn.close()
+                worker.conn = None
+        if worker.restart_at is None:
+            worker.restart_at = time.monotonic() + self._restart_delay
+
+    def _check_workers(self, now: float):
+        for worker in self._workers:
+            if worker.process is not None and not worker.process.is_alive():
+                _logger.warning(
+                    f"Worker {worker.index} exited with {worker.process.exitcode}, restarting"
+                )
+                self._mark_dead(worker)
+            if worker.restart_at is not None and now >= worker.restart_at and self._running:
+                worker.restarts += 1
+                self._start_worker(worker)
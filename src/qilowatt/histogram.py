@@ -0,0 +1,87 @@
+# qilowatt/histogram.py
+
+import bisect
+import math
+import threading
+from typing import Dict, Any, Optional, Sequence
+
+# Default bucket upper bounds in seconds, from 1 ms to 1 minute
+DEFAULT_LATENCY_BOUNDS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Bucket upper bounds in seconds for the age of device data, up to 1 hour
+SAMPLE_AGE_BOUNDS = (
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0,
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram for latencies, cheap enough to update per message."""
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BOUNDS):
+        self._bounds = tuple(sorted(bounds))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all recorded values."""
+        with self._lock:
+            # One extra bucket for values above the last bound
+            self._counts = [0] * (len(self._bounds) + 1)
+            self._count = 0
+            self._sum = 0.0
+            self._min: Optional[float] = None
+            self._max: Optional[float] = None
+
+    def record(self, value: float):
+        """Add one observation."""
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            if self._min is None or value < self._min:
+                self._min = value
+            if self._max is None or value > self._max:
+                self._max = value
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Estimate a percentile as the upper bound of the bucket holding it."""
+        with self._lock:
+            return self._percentile(percent)
+
+    def _percentile(self, percent: float) -> Optional[float]:
+        if not self._count:
+            return None
+        rank = max(1, int(math.ceil(self._count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                if index < len(self._bounds):
+                    return min(self._bounds[index], self._max)
+                return self._max
+        return self._max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get count, sum, min/max, percentile estimates and bucket counts."""
+        with self._lock:
+            buckets = {f"le_{bound:g}": count for bound, count in zip(self._bounds, self._counts)}
+            buckets["inf"] = self._counts[-1]
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "min": self._min,
+                "max": self._max,
+                "mean": self._sum / self._count if self._count else None,
+                "p50": self._percentile(50),
+                "p90": self._percentile(90),
+                "p99": self._percentile(99),
+                "buckets": buckets,
+            }
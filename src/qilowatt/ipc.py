@@ -0,0 +1,496 @@
+# qilowatt/ipc.py
+
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set, Tuple
+from .base_device import BaseDevice
+from .exceptions import ConnectionError, IPCError
+from .serialization import SerializedData
+
+_logger = logging.getLogger(__name__)
+
+# Per frame: type, device id length, request id, payload length; then the
+# device id and the payload
+_HEADER = struct.Struct("<BBHI")
+MAX_PAYLOAD = 1024 * 1024
+
+# Requests
+SNAPSHOT = 0x01
+SUBSCRIBE = 0x02
+UNSUBSCRIBE = 0x03
+COMMAND = 0x04
+
+# Replies carry the request id; updates are pushed with request id 0
+DATA = 0x81
+UPDATE = 0x82
+OK = 0x83
+ERROR = 0x84
+
+# SNAPSHOT flag: build the data now instead of returning the last SENSOR
+FRESH = 0x01
+
+# Seconds a device's idle command worker waits for the next command before exiting
+_COMMAND_IDLE = 5.0
+
+
+def encode_frame(kind: int, device_id: str = "", payload: bytes = b"",
+                 request_id: int = 0) -> bytes:
+    device = device_id.encode("utf-8")
+    return _HEADER.pack(kind, len(device), request_id, len(payload)) + device + payload
+
+
+def _decode_frames(buffer: bytearray) -> Iterable[Tuple[int, int, str, bytes]]:
+    """Pop complete frames off ``buffer``.
+
+    Raises:
+        ValueError: If a frame is larger than MAX_PAYLOAD.
+    """
+    while len(buffer) >= _HEADER.size:
+        kind, id_len, request_id, length = _HEADER.unpack_from(buffer)
+        if length > MAX_PAYLOAD:
+            raise ValueError(f"Frame of {length} bytes exceeds the limit")
+        end = _HEADER.size + id_len + length
+        if len(buffer) < end:
+            return
+        device_id = bytes(buffer[_HEADER.size:_HEADER.size + id_len]).decode("utf-8")
+        payload = bytes(buffer[_HEADER.size + id_len:end])
+        del buffer[:end]
+        yield kind, request_id, device_id, payload
+
+
+class _Feed:
+    """Latest SENSOR payload of one device; registered as its sensor recorder."""
+
+    def __init__(self, server: "LocalServer", device: BaseDevice):
+        self.server = server
+        self.device = device
+        self.payload: Optional[bytes] = None
+        self.frame: Optional[bytes] = None
+        self.updates = 0
+        # COMMAND requests waiting for the device's command worker
+        self.commands: Deque[Tuple["_Connection", int, bytes]] = deque()
+        self.commands_ready = threading.Condition(server._lock)
+        self.worker: Optional[threading.Thread] = None
+
+    def record(self, data, timestamp: float):
+        text = data.payload if isinstance(data, SerializedData) else json.dumps(data)
+        self.payload = text.encode("utf-8")
+        # Built once, the same bytes go to every subscriber
+        self.frame = encode_frame(UPDATE, self.device.device_id, self.payload)
+        self.updates += 1
+        self.server._broadcast(self.device.device_id, self.frame)
+
+
+class _Connection:
+    __slots__ = ("sock", "inbuf", "outbuf", "subscriptions", "dropped")
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        # Subscribed device ids; "" subscribes to every device
+        self.subscriptions: Set[str] = set()
+        self.dropped = 0
+
+
+class LocalServer:
+    """Serve device telemetry and accept commands on a Unix domain socket.
+
+    Meant for a local energy manager that should not go through the broker.
+    Requests and replies are small binary frames (see encode_frame()):
+    SNAPSHOT returns the last SENSOR payload the device published, as is;
+    SUBSCRIBE streams every further SENSOR payload; COMMAND passes its
+    payload to the device's execute_command() and answers ERROR if that
+    raises. A subscriber that falls more than ``max_buffer`` bytes behind
+    misses updates instead of holding up the device. One thread serves all
+    connections; commands run in order on a worker thread per device and are
+    answered when they finish, so a slow command only holds up later
+    commands to the same device.
+    """
+
+    def __init__(self, path: str, devices: Iterable[BaseDevice] = (),
+                 max_buffer: int = 1024 * 1024, mode: int = 0o660):
+        self.path = path
+        self._max_buffer = max(1, max_buffer)
+        self._mode = mode
+        self._lock = threading.Lock()
+        self._feeds: Dict[str, _Feed] = {}
+        self._connections: Dict[socket.socket, _Connection] = {}
+        self._selector = selectors.DefaultSelector()
+        self._listener: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.requests = 0
+        self.commands = 0
+        self.errors = 0
+        for device in devices:
+            self.add_device(device)
+
+    def add_device(self, device: BaseDevice):
+        feed = _Feed(self, device)
+        with self._lock:
+            if device.device_id in self._feeds:
+                return
+            self._feeds[device.device_id] = feed
+        device.add_sensor_recorder(feed)
+
+    def remove_device(self, device: BaseDevice):
+        with self._lock:
+            feed = self._feeds.pop(device.device_id, None)
+        if feed is not None:
+            device.remove_sensor_recorder(feed)
+
+    def start(self):
+        """Bind the socket and start serving. A stale socket file is replaced."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, self._mode)
+        listener.listen(16)
+        listener.setblocking(False)
+        self._listener = listener
+        self._selector.register(listener, selectors.EVENT_READ, None)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, name="QilowattLocalServer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Close every connection and remove the socket file."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._wake()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        for conn in list(self._connections.values()):
+            self._close(conn)
+        self._selector.unregister(self._listener)
+        self._selector.unregister(self._wake_r)
+        self._listener.close()
+        self._listener = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self) -> "LocalServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _broadcast(self, device_id: str, frame: bytes):
+        """Queue an update for the subscribers of ``device_id`` (any thread)."""
+        queued = False
+        with self._lock:
+            for conn in self._connections.values():
+                if device_id not in conn.subscriptions and "" not in conn.subscriptions:
+                    continue
+                if len(conn.outbuf) >= self._max_buffer:
+                    conn.dropped += 1
+                    continue
+                conn.outbuf += frame
+                queued = True
+        if queued:
+            self._wake()
+
+    # server thread
+
+    def _run(self):
+        while self._running:
+            for key, mask in self._selector.select(1.0):
+                sock = key.fileobj
+                if sock is self._wake_r:
+                    self._drain_wake()
+                elif sock is self._listener:
+                    self._accept()
+                else:
+                    conn = self._connections.get(sock)
+                    if conn is None:
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._read(conn)
+                    if mask & selectors.EVENT_WRITE and conn.sock.fileno() != -1:
+                        self._write(conn)
+            self._update_events()
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setblocking(False)
+        conn = _Connection(sock)
+        with self._lock:
+            self._connections[sock] = conn
+        self._selector.register(sock, selectors.EVENT_READ, None)
+
+    def _close(self, conn: _Connection):
+        with self._lock:
+            self._connections.pop(conn.sock, None)
+        try:
+            self._selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+    def _read(self, conn: _Connection):
+        try:
+            data = conn.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(conn)
+            return
+        conn.inbuf += data
+        try:
+            for kind, request_id, device_id, payload in _decode_frames(conn.inbuf):
+                reply = self._handle(conn, kind, request_id, device_id, payload)
+                if reply is None:
+                    continue
+                with self._lock:
+                    conn.outbuf += reply
+        except ValueError as e:
+            _logger.warning(f"Closing local connection: {e}")
+            self._close(conn)
+            return
+        self._write(conn)
+
+    def _handle(self, conn: _Connection, kind: int, request_id: int,
+                device_id: str, payload: bytes) -> Optional[bytes]:
+        """Answer a request; None if the reply follows later (COMMAND)."""
+        self.requests += 1
+        try:
+            if kind == SUBSCRIBE:
+                self._feed(device_id, allow_all=True)
+                with self._lock:
+                    conn.subscriptions.add(device_id)
+                return encode_frame(OK, device_id, request_id=request_id)
+            if kind == UNSUBSCRIBE:
+                with self._lock:
+                    conn.subscriptions.discard(device_id)
+                return encode_frame(OK, device_id, request_id=request_id)
+            feed = self._feed(device_id)
+            if kind == SNAPSHOT:
+                return encode_frame(DATA, device_id, self._snapshot(feed, payload), request_id)
+            if kind == COMMAND:
+                self.commands += 1
+                self._queue_command(feed, conn, request_id, payload)
+                return None
+            raise IPCError(f"Unknown request type {kind}")
+        except Exception as e:
+            self.errors += 1
+            return encode_frame(ERROR, device_id, str(e).encode("utf-8"), request_id)
+
+    def _queue_command(self, feed: _Feed, conn: _Connection, request_id: int, payload: bytes):
+        with self._lock:
+            feed.commands.append((conn, request_id, payload))
+            feed.commands_ready.notify()
+            if feed.worker is None:
+                feed.worker = threading.Thread(
+                    target=self._run_commands, args=(feed,),
+                    name=f"QilowattLocalCommand-{feed.device.device_id}",
+                )
+                feed.worker.daemon = True
+                feed.worker.start()
+
+    def _run_commands(self, feed: _Feed):
+        """Command worker of one device: run its commands in order and reply."""
+        device_id = feed.device.device_id
+        while True:
+            with self._lock:
+                if not feed.commands_ready.wait_for(lambda: feed.commands, _COMMAND_IDLE):
+                    feed.worker = None
+                    return
+                conn, request_id, payload = feed.commands.popleft()
+            try:
+                feed.device.execute_command(payload)
+                reply = encode_frame(OK, device_id, request_id=request_id)
+            except Exception as e:
+                self.errors += 1
+                reply = encode_frame(ERROR, device_id, str(e).encode("utf-8"), request_id)
+            with self._lock:
+                # The client may have gone away meanwhile
+                if self._connections.get(conn.sock) is not conn:
+                    continue
+                conn.outbuf += reply
+            self._wake()
+
+    def _feed(self, device_id: str, allow_all: bool = False) -> Optional[_Feed]:
+        if allow_all and device_id == "":
+            return None
+        feed = self._feeds.get(device_id)
+        if feed is None:
+            raise IPCError(f"Unknown device {device_id!r}")
+        return feed
+
+    @staticmethod
+    def _snapshot(feed: _Feed, flags: bytes) -> bytes:
+        fresh = bool(flags and flags[0] & FRESH)
+        if feed.payload is not None and not fresh:
+            return feed.payload
+        # Nothing published yet (or asked to): build it the way a publish would
+        data = feed.device.get_sensor_data() or {}
+        text = data.payload if isinstance(data, SerializedData) else json.dumps(data)
+        return text.encode("utf-8")
+
+    def _write(self, conn: _Connection):
+        with self._lock:
+            if not conn.outbuf:
+                return
+            try:
+                sent = conn.sock.send(conn.outbuf)
+            except BlockingIOError:
+                return
+            except OSError:
+                sent = -1
+            if sent >= 0:
+                del conn.outbuf[:sent]
+        if sent < 0:
+            self._close(conn)
+
+    def _update_events(self):
+        """Watch for writability only while a connection has data queued."""
+        with self._lock:
+            connections = list(self._connections.values())
+        for conn in connections:
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.outbuf else 0)
+            try:
+                if self._selector.get_key(conn.sock).events != events:
+                    self._selector.modify(conn.sock, events, None)
+            except (KeyError, ValueError):
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connections": len(self._connections),
+                "subscribers": sum(1 for c in self._connections.values() if c.subscriptions),
+                "requests": self.requests,
+                "commands": self.commands,
+                "errors": self.errors,
+                "dropped": sum(c.dropped for c in self._connections.values()),
+                "updates": {device_id: feed.updates for device_id, feed in self._feeds.items()},
+            }
+
+
+class LocalClient:
+    """Blocking client for LocalServer, e.g. for an energy manager or tests."""
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self._timeout = timeout
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(path)
+        except OSError as e:
+            self._sock.close()
+            raise ConnectionError(f"Cannot connect to {path}: {e}")
+        self._buffer = bytearray()
+        self._frames: Deque[Tuple[int, int, str, bytes]] = deque()
+        self._updates: Deque[Tuple[str, bytes]] = deque()
+        self._request_id = 0
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self) -> "LocalClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def snapshot(self, device_id: str, fresh: bool = False) -> bytes:
+        """The device's last SENSOR payload (JSON bytes)."""
+        return self._request(SNAPSHOT, device_id, bytes((FRESH,)) if fresh else b"")
+
+    def command(self, device_id: str, command: bytes):
+        """Run a command such as ``b"WORKMODE {...}"`` through execute_command().
+
+        Raises:
+            IPCError: If the device rejected the command.
+        """
+        self._request(COMMAND, device_id, command)
+
+    def subscribe(self, device_id: str = ""):
+        """Receive every SENSOR payload of ``device_id`` ("" for all devices)."""
+        self._request(SUBSCRIBE, device_id)
+
+    def unsubscribe(self, device_id: str = ""):
+        self._request(UNSUBSCRIBE, device_id)
+
+    def read_update(self, timeout: Optional[float] = None) -> Tuple[str, bytes]:
+        """Wait for the next streamed (device id, SENSOR payload).
+
+        Raises:
+            socket.timeout: If nothing arrives within ``timeout``.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._updates:
+            self._receive(deadline)
+        return self._updates.popleft()
+
+    def _request(self, kind: int, device_id: str, payload: bytes = b"") -> bytes:
+        self._request_id = self._request_id % 0xFFFF + 1
+        request_id = self._request_id
+        self._sock.sendall(encode_frame(kind, device_id, payload, request_id))
+        while True:
+            while self._frames:
+                reply_kind, reply_id, _, reply = self._frames.popleft()
+                if reply_id != request_id:
+                    continue
+                if reply_kind == ERROR:
+                    raise IPCError(reply.decode("utf-8", "replace"))
+                return reply
+            self._receive(None)
+
+    def _receive(self, deadline: Optional[float]):
+        if deadline is not None:
+            self._sock.settimeout(max(0.0, deadline - time.monotonic()))
+        try:
+            data = self._sock.recv(65536)
+        finally:
+            if deadline is not None:
+                self._sock.settimeout(self._timeout)
+        if not data:
+            raise ConnectionError("Local server closed the connection")
+        self._buffer += data
+        for frame in _decode_frames(self._buffer):
+            if frame[0] == UPDATE:
+                self._updates.append((frame[2], frame[3]))
+            else:
+                self._frames.append(frame)
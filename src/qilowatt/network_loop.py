@@ -0,0 +1,285 @@
+# qilowatt/network_loop.py
+
+import selectors
+import socket
+import threading
+import time
+import logging
+import paho.mqtt.client as mqtt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+_logger = logging.getLogger(__name__)
+
+
+class _LoopEntry:
+    """Bookkeeping for one paho client driven by the shared loop."""
+
+    __slots__ = ("client", "should_reconnect", "sock", "connecting",
+                 "next_reconnect", "reconnect_delay")
+
+    def __init__(self, client: mqtt.Client, should_reconnect: Callable[[], bool], delay: float):
+        self.client = client
+        self.should_reconnect = should_reconnect
+        self.sock: Optional[socket.socket] = None
+        self.connecting = False
+        self.next_reconnect: Optional[float] = None
+        self.reconnect_delay = delay
+
+
+class SharedNetworkLoop:
+    """Drive the network I/O of many MQTT clients from a single thread.
+
+    Clients created with ``network_loop=...`` register their sockets here
+    instead of starting one paho network thread each. Reads, writes and
+    keepalive handling run on the loop thread; blocking (re)connects run on
+    a small worker pool so one slow broker handshake does not stall the rest.
+    """
+
+    def __init__(
+        self,
+        misc_interval: float = 1.0,
+        reconnect_workers: int = 4,
+        reconnect_delay: float = 10.0,
+        max_reconnect_delay: float = 60.0,
+    ):
+        self._misc_interval = misc_interval
+        self._min_reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max(reconnect_delay, max_reconnect_delay)
+        self._reconnect_workers = max(1, reconnect_workers)
+
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.RLock()
+        self._entries: Dict[mqtt.Client, _LoopEntry] = {}
+        self._removals = []
+
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        """Start the loop thread."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="QilowattNetworkLoop")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the loop thread. Registered clients are left as they are."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._wake()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def add(self, client: mqtt.Client, should_reconnect: Callable[[], bool], connect: bool = False):
+        """Start servicing a paho client.
+
+        Must be called before the client connects, so its socket is seen.
+        ``should_reconnect`` is asked before every automatic reconnect. With
+        ``connect=True`` the (blocking) connect is done on the worker pool;
+        the client must already know its broker (``connect_async``).
+        """
+        entry = _LoopEntry(client, should_reconnect, self._min_reconnect_delay)
+        with self._lock:
+            self._entries[client] = entry
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        if connect:
+            self._submit_reconnect(entry)
+        self.start()
+
+    def remove(self, client: mqtt.Client, timeout: float = 5.0):
+        """Stop servicing a client after flushing what it has queued.
+
+        Blocks until the loop thread has let go of the client (or timeout).
+        """
+        done = threading.Event()
+        with self._lock:
+            if client not in self._entries:
+                return
+            self._removals.append((client, done))
+            running = self._running
+        if running and threading.current_thread() is not self._thread:
+            self._wake()
+            done.wait(timeout)
+        else:
+            self._process_removals()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the number of serviced clients and connected sockets."""
+        with self._lock:
+            return {
+                "clients": len(self._entries),
+                "sockets": sum(1 for e in self._entries.values() if e.sock is not None),
+                "reconnecting": sum(1 for e in self._entries.values() if e.connecting),
+            }
+
+    # paho socket callbacks - may be called from any thread
+
+    def _on_socket_open(self, client, userdata, sock):
+        with self._lock:
+            entry = self._entries.get(client)
+            if entry is None:
+                return
+            entry.sock = sock
+            entry.reconnect_delay = self._min_reconnect_delay
+            entry.next_reconnect = None
+            self._selector.register(sock, selectors.EVENT_READ, client)
+        self._wake()
+
+    def _on_socket_close(self, client, userdata, sock):
+        with self._lock:
+            entry = self._entries.get(client)
+            if entry is not None and entry.sock is sock:
+                entry.sock = None
+            try:
+                self._selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._set_events(sock, client, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._set_events(sock, client, selectors.EVENT_READ)
+
+    def _set_events(self, sock, client, events: int):
+        with self._lock:
+            try:
+                self._selector.modify(sock, events, client)
+            except (KeyError, ValueError):
+                return
+        if events & selectors.EVENT_WRITE:
+            self._wake()
+
+    # loop thread
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        next_misc = time.monotonic()
+        while self._running:
+            timeout = max(0.0, next_misc - time.monotonic())
+            try:
+                events = self._selector.select(timeout)
+            except OSError as exc:
+                _logger.debug("Selector error: %s", exc)
+                events = []
+
+            for key, mask in events:
+                if key.fileobj is self._wake_r:
+                    self._drain_wake()
+                    continue
+                client = key.data
+                if mask & selectors.EVENT_READ:
+                    self._read(client)
+                if mask & selectors.EVENT_WRITE:
+                    self._call(client.loop_write)
+
+            self._process_removals()
+
+            now = time.monotonic()
+            if now >= next_misc:
+                next_misc = now + self._misc_interval
+                self._run_misc(now)
+
+    def _read(self, client: mqtt.Client):
+        # SSL sockets can hold decrypted bytes select() does not report,
+        # so keep reading until the TLS buffer is empty
+        while self._call(client.loop_read) == mqtt.MQTT_ERR_SUCCESS:
+            entry = self._entries.get(client)
+            sock = entry.sock if entry else None
+            if sock is None or not getattr(sock, "pending", None) or not sock.pending():
+                break
+
+    def _call(self, method: Callable[[], int]) -> int:
+        try:
+            return method()
+        except Exception as exc:
+            _logger.error(f"Error in network loop: {exc}")
+            return mqtt.MQTT_ERR_UNKNOWN
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _process_removals(self):
+        with self._lock:
+            removals, self._removals = self._removals, []
+        for client, done in removals:
+            # Flush queued packets (e.g. DISCONNECT) before letting go of the socket
+            self._call(client.loop_write)
+            with self._lock:
+                entry = self._entries.pop(client, None)
+                if entry is not None and entry.sock is not None:
+                    try:
+                        self._selector.unregister(entry.sock)
+                    except (KeyError, ValueError):
+                        pass
+            done.set()
+
+    def _run_misc(self, now: float):
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            if entry.connecting:
+                continue
+            if self._call(entry.client.loop_misc) != mqtt.MQTT_ERR_NO_CONN:
+                continue
+            if not entry.should_reconnect():
+                continue
+            if entry.next_reconnect is None:
+                entry.next_reconnect = now + entry.reconnect_delay
+            elif now >= entry.next_reconnect:
+                self._submit_reconnect(entry)
+
+    def _submit_reconnect(self, entry: _LoopEntry):
+        entry.connecting = True
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._reconnect_workers,
+                thread_name_prefix="QilowattReconnect",
+            )
+        self._executor.submit(self._reconnect, entry)
+
+    def _reconnect(self, entry: _LoopEntry):
+        try:
+            if entry.should_reconnect():
+                entry.client.reconnect()
+        except Exception as exc:
+            _logger.debug(f"Reconnect failed: {exc}")
+            entry.reconnect_delay = min(entry.reconnect_delay * 2, self._max_reconnect_delay)
+            # paho only reports this itself when it runs its own network loop
+            on_connect_fail = entry.client.on_connect_fail
+            if on_connect_fail is not None:
+                try:
+                    on_connect_fail(entry.client, entry.client.user_data_get())
+                except Exception as e:
+                    _logger.error(f"Error in connect failure callback: {e}")
+        finally:
+            entry.next_reconnect = None
+            entry.connecting = False
@@ -0,0 +1,228 @@
+# qilowatt/outbound.py
+
+import itertools
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+# Priority classes - lower value is sent first
+PRIORITY_HIGH = 0    # POWER1 state changes, command results
+PRIORITY_NORMAL = 1  # STATE, STATUS0
+PRIORITY_LOW = 2     # periodic SENSOR telemetry
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# Default priority per topic class
+DEFAULT_TOPIC_PRIORITIES = {
+    "POWER1": PRIORITY_HIGH,
+    "STATE": PRIORITY_NORMAL,
+    "STATUS0": PRIORITY_NORMAL,
+    "SENSOR": PRIORITY_LOW,
+}
+
+
+class OutboundQueue:
+    """Bounded outbound queue with per-topic latest-value-wins slots.
+
+    Every topic has at most one pending message: putting a new payload for a
+    topic that is still queued replaces the old payload in place. Messages are
+    sent by a single writer thread, highest priority first. When the queue is
+    full the oldest message of the lowest priority class is dropped, unless
+    the new message has an even lower priority, in which case it is dropped.
+    ``on_discard(topic, payload, reason)`` is told about every message that
+    leaves the queue unsent, with reason "superseded", "dropped" or "discarded".
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[str, Any], bool],
+        max_depth: int = 100,
+        ready: Optional[Callable[[], bool]] = None,
+        name: str = "QilowattOutbound",
+        on_discard: Optional[Callable[[str, Any, str], None]] = None,
+    ):
+        self._writer = writer
+        self._on_discard = on_discard
+        self._max_depth = max(1, max_depth)
+        self._ready = ready or (lambda: True)
+        self._name = name
+        self._condition = threading.Condition()
+        self._slots: Dict[int, "OrderedDict[Any, Tuple[str, Any]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._depth = 0
+        self._unique = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._writing = False
+
+        self._enqueued = 0
+        self._replaced = 0
+        self._sent = 0
+        self._failed = 0
+        self._dropped = {priority: 0 for priority in PRIORITIES}
+
+    @property
+    def depth(self) -> int:
+        """Number of messages waiting to be written."""
+        return self._depth
+
+    def start(self):
+        """Start the writer thread."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> int:
+        """Stop the writer thread and discard pending messages.
+
+        Returns the number of discarded messages.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        return self.clear()
+
+    def clear(self) -> int:
+        """Discard all pending messages, returning how many were discarded."""
+        with self._condition:
+            discarded = [
+                message for slots in self._slots.values() for message in slots.values()
+            ]
+            for slots in self._slots.values():
+                slots.clear()
+            self._depth = 0
+            self._condition.notify_all()
+        self._discard(discarded, "discarded")
+        return len(discarded)
+
+    def _discard(self, messages, reason: str):
+        if self._on_discard is None:
+            return
+        for topic, payload in messages:
+            try:
+                self._on_discard(topic, payload, reason)
+            except Exception as exc:
+                _logger.error(f"Error in discard callback for {topic}: {exc}")
+
+    def notify(self):
+        """Wake the writer, e.g. after the connection became ready."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def put(self, topic: str, payload: Any, priority: int = PRIORITY_NORMAL,
+            coalesce: bool = True) -> bool:
+        """Queue a message. Returns False if it was dropped.
+
+        With ``coalesce=False`` the message gets its own slot instead of
+        replacing a pending message for the same topic.
+        """
+        key = topic if coalesce else (topic, next(self._unique))
+        discarded, reason, queued = None, "dropped", True
+        with self._condition:
+            slots = self._slots[priority]
+            if key in slots:
+                discarded, reason = slots[key], "superseded"
+                slots[key] = (topic, payload)
+                self._replaced += 1
+            elif self._depth >= self._max_depth:
+                discarded = self._evict_for(priority)
+                if discarded is None:
+                    self._dropped[priority] += 1
+                    discarded, queued = (topic, payload), False
+                else:
+                    self._add(slots, key, topic, payload)
+            else:
+                self._add(slots, key, topic, payload)
+
+        if discarded is not None:
+            self._discard([discarded], reason)
+        return queued
+
+    def _add(self, slots, key, topic: str, payload: Any):
+        slots[key] = (topic, payload)
+        self._depth += 1
+        self._enqueued += 1
+        self._condition.notify()
+
+    def _evict_for(self, priority: int) -> Optional[Tuple[str, Any]]:
+        """Drop the oldest message of the lowest class at or below ``priority``."""
+        for victim in reversed(PRIORITIES):
+            if victim < priority:
+                return None
+            slots = self._slots[victim]
+            if slots:
+                message = slots.popitem(last=False)[1]
+                self._depth -= 1
+                self._dropped[victim] += 1
+                return message
+        return None
+
+    def _next(self) -> Optional[Tuple[str, Any]]:
+        for priority in PRIORITIES:
+            slots = self._slots[priority]
+            if slots:
+                self._depth -= 1
+                return slots.popitem(last=False)[1]
+        return None
+
+    def wait_empty(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message has been handed to the writer."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._depth and not self._writing, timeout
+            )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: not self._running or (self._depth and self._ready()),
+                    timeout=1.0,
+                )
+                if not self._running:
+                    return
+                if not self._depth or not self._ready():
+                    continue
+                topic, payload = self._next()
+                self._writing = True
+
+            try:
+                ok = self._writer(topic, payload)
+            except Exception as exc:
+                _logger.error(f"Error writing to {topic}: {exc}")
+                ok = False
+
+            with self._condition:
+                self._writing = False
+                if ok:
+                    self._sent += 1
+                else:
+                    self._failed += 1
+                self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and message counters."""
+        with self._condition:
+            return {
+                "depth": self._depth,
+                "max_depth": self._max_depth,
+                "enqueued": self._enqueued,
+                "replaced": self._replaced,
+                "sent": self._sent,
+                "failed": self._failed,
+                "dropped": {
+                    "high": self._dropped[PRIORITY_HIGH],
+                    "normal": self._dropped[PRIORITY_NORMAL],
+                    "low": self._dropped[PRIORITY_LOW],
+                },
+            }
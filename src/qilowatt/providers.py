@@ -0,0 +1,239 @@
+# qilowatt/providers.py
+
+import asyncio
+import inspect
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+# Default time budget for one round of provider calls, in seconds
+PROVIDER_TIMEOUT = 2.0
+
+
+class _Provider:
+    """Bookkeeping for one registered data provider."""
+
+    __slots__ = ("name", "func", "max_age", "future", "started", "value",
+                 "fetched_at", "fresh", "calls", "errors", "timeouts", "cached",
+                 "last_duration")
+
+    def __init__(self, name: str, func: Callable[[], Any], max_age: float):
+        self.name = name
+        self.func = func
+        self.max_age = max_age
+        self.future: Optional[Future] = None
+        self.started = 0.0
+        self.value: Any = None
+        self.fetched_at: Optional[float] = None
+        # Set when a result arrived that was not applied yet
+        self.fresh = False
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cached = 0
+        self.last_duration: Optional[float] = None
+
+
+class ProviderRunner:
+    """Call a device's data providers concurrently within a time budget.
+
+    Sync providers run on a small thread pool, coroutine functions on an event
+    loop (a private one unless set_event_loop() is used). A provider whose
+    last result is younger than its ``max_age`` is not called again, and one
+    still running from an earlier round is not started twice. Results that
+    arrive after the budget are applied on the next round.
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[Any], None],
+        timeout: float = PROVIDER_TIMEOUT,
+        max_workers: int = 4,
+        name: str = "QilowattProvider",
+    ):
+        self._apply = apply
+        self._timeout = timeout
+        self._max_workers = max(1, max_workers)
+        self._name = name
+        self._providers: List[_Provider] = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._own_loop = False
+        self._loop_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._providers)
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value: float):
+        self._timeout = max(0.0, value)
+
+    def add(self, func: Callable[[], Any], name: Optional[str] = None,
+            max_age: float = 0.0) -> str:
+        """Register a provider and return its name."""
+        name = name or getattr(func, "__name__", None) or f"provider{len(self._providers)}"
+        with self._lock:
+            if any(p.name == name for p in self._providers):
+                raise ValueError(f"Data provider {name} already registered")
+            self._providers = self._providers + [_Provider(name, func, max(0.0, max_age))]
+        return name
+
+    def remove(self, name: str) -> bool:
+        """Unregister a provider. Returns False if it was not registered."""
+        with self._lock:
+            remaining = [p for p in self._providers if p.name != name]
+            removed = len(remaining) != len(self._providers)
+            self._providers = remaining
+        return removed
+
+    def set_event_loop(self, loop: Optional[asyncio.AbstractEventLoop]):
+        """Run coroutine providers on ``loop`` (None: use a private loop)."""
+        with self._lock:
+            self._stop_own_loop()
+            self._loop = loop
+            self._own_loop = False
+
+    def refresh(self, timeout: Optional[float] = None) -> int:
+        """Run due providers, wait up to the budget and apply new results.
+
+        Returns the number of results applied.
+        """
+        budget = self._timeout if timeout is None else timeout
+        with self._refresh_lock:
+            providers = self._providers
+            now = time.monotonic()
+            running: List[Tuple[_Provider, Future]] = []
+            for provider in providers:
+                if provider.future is None:
+                    if (provider.fetched_at is not None
+                            and now - provider.fetched_at < provider.max_age):
+                        provider.cached += 1
+                        continue
+                    self._start(provider)
+                future = provider.future
+                if future is not None:
+                    running.append((provider, future))
+
+            if running:
+                wait([future for _, future in running], timeout=budget)
+                for provider, future in running:
+                    if not future.done():
+                        provider.timeouts += 1
+                        _logger.warning(
+                            f"Data provider {provider.name} did not finish within {budget:.1f}s"
+                        )
+
+            applied = 0
+            for provider in providers:
+                if not provider.fresh:
+                    continue
+                provider.fresh = False
+                try:
+                    self._apply(provider.value)
+                    applied += 1
+                except Exception as e:
+                    _logger.error(f"Error applying data from provider {provider.name}: {e}")
+            return applied
+
+    def _start(self, provider: _Provider):
+        provider.calls += 1
+        provider.started = time.monotonic()
+        try:
+            if inspect.iscoroutinefunction(provider.func):
+                future = asyncio.run_coroutine_threadsafe(provider.func(), self._get_loop())
+            else:
+                future = self._get_executor().submit(self._call_sync, provider.func)
+        except Exception as e:
+            provider.errors += 1
+            _logger.error(f"Could not start data provider {provider.name}: {e}")
+            return
+        provider.future = future
+        future.add_done_callback(lambda f, p=provider: self._finished(p, f))
+
+    def _call_sync(self, func: Callable[[], Any]) -> Any:
+        result = func()
+        if inspect.isawaitable(result):
+            return asyncio.run_coroutine_threadsafe(result, self._get_loop()).result()
+        return result
+
+    def _finished(self, provider: _Provider, future: Future):
+        provider.last_duration = time.monotonic() - provider.started
+        try:
+            value = future.result()
+        except Exception as e:
+            provider.errors += 1
+            _logger.error(f"Data provider {provider.name} failed: {e}")
+        else:
+            provider.value = value
+            provider.fetched_at = time.monotonic()
+            provider.fresh = True
+        finally:
+            provider.future = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix=self._name
+                )
+            return self._executor
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._own_loop = True
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name=f"{self._name}Loop"
+                )
+                self._loop_thread.daemon = True
+                self._loop_thread.start()
+            return self._loop
+
+    def _stop_own_loop(self):
+        if self._own_loop and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if self._loop_thread and self._loop_thread is not threading.current_thread():
+                self._loop_thread.join(timeout=1.0)
+            if not self._loop.is_running():
+                self._loop.close()
+            self._loop = None
+            self._loop_thread = None
+            self._own_loop = False
+
+    def close(self):
+        """Release the worker threads and the private event loop.
+
+        They are created again when the next round needs them.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self._stop_own_loop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get call counters and result age per provider."""
+        now = time.monotonic()
+        return {
+            provider.name: {
+                "calls": provider.calls,
+                "errors": provider.errors,
+                "timeouts": provider.timeouts,
+                "cached": provider.cached,
+                "running": provider.future is not None,
+                "age": None if provider.fetched_at is None else now - provider.fetched_at,
+                "last_duration": provider.last_duration,
+            }
+            for provider in self._providers
+        }
@@ -0,0 +1,196 @@
+# qilowatt/recording.py
+
+import struct
+import threading
+import time
+import logging
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, NamedTuple, Optional, Union
+
+_logger = logging.getLogger(__name__)
+
+# File header: magic and format version
+MAGIC = b"QWTRAFFIC"
+FORMAT_VERSION = 1
+
+INBOUND = 0
+OUTBOUND = 1
+
+# Per record: direction, seconds since recording start, topic and payload length
+_RECORD = struct.Struct("<BdHI")
+
+
+class TrafficRecord(NamedTuple):
+    """One recorded MQTT message."""
+
+    direction: int
+    timestamp: float
+    topic: str
+    payload: bytes
+
+    @property
+    def inbound(self) -> bool:
+        return self.direction == INBOUND
+
+
+class TrafficRecorder:
+    """Append inbound commands and outbound publishes to a binary log.
+
+    Timestamps are monotonic seconds since the recorder was created. Pass an
+    open binary file instead of a path to record into memory or a pipe; it is
+    left open on close().
+    """
+
+    def __init__(self, target: Union[str, BinaryIO], clock=time.monotonic):
+        if isinstance(target, (str, bytes)) or hasattr(target, "__fspath__"):
+            self._file: BinaryIO = open(target, "wb")
+            self._owns_file = True
+        else:
+            self._file = target
+            self._owns_file = False
+        self._clock = clock
+        self._started = clock()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.records = 0
+        self.bytes_written = 0
+        self._write(MAGIC + bytes((FORMAT_VERSION,)))
+
+    def record_inbound(self, topic: str, payload: bytes):
+        self.record(INBOUND, topic, payload)
+
+    def record_outbound(self, topic: str, payload: Union[str, bytes]):
+        self.record(OUTBOUND, topic, payload)
+
+    def record(self, direction: int, topic: str, payload: Union[str, bytes]):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        topic_bytes = topic.encode("utf-8")
+        header = _RECORD.pack(direction, self._clock() - self._started,
+                              len(topic_bytes), len(payload))
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._write(header + topic_bytes + payload)
+            except (OSError, ValueError) as e:
+                _logger.error(f"Error writing traffic recording: {e}")
+                return
+            self.records += 1
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._file.flush()
+            if self._owns_file:
+                self._file.close()
+
+    def __enter__(self) -> "TrafficRecorder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "bytes": self.bytes_written,
+            "closed": self._closed,
+        }
+
+
+def read_traffic(source: Union[str, BinaryIO]) -> Iterator[TrafficRecord]:
+    """Yield the records of a traffic log in the order they were written.
+
+    A record cut short at the end (e.g. by a crash) is ignored.
+
+    Raises:
+        ValueError: If ``source`` is not a traffic log.
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+        with open(source, "rb") as f:
+            yield from read_traffic(f)
+        return
+
+    header = source.read(len(MAGIC) + 1)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a qilowatt traffic recording")
+    if header[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported traffic recording version {header[len(MAGIC)]}")
+
+    while True:
+        raw = source.read(_RECORD.size)
+        if len(raw) < _RECORD.size:
+            return
+        direction, timestamp, topic_len, payload_len = _RECORD.unpack(raw)
+        body = source.read(topic_len + payload_len)
+        if len(body) < topic_len + payload_len:
+            return
+        yield TrafficRecord(
+            direction, timestamp, body[:topic_len].decode("utf-8"), body[topic_len:]
+        )
+
+
+class TrafficReplayer:
+    """Feed recorded inbound commands into a device's handle_command.
+
+    ``speed`` scales the recorded gaps between commands (2.0 replays twice as
+    fast); None replays as fast as possible.
+    """
+
+    def __init__(self, device, speed: Optional[float] = 1.0):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive or None")
+        self.device = device
+        self.speed = speed
+
+    def replay(self, records: Union[str, BinaryIO, Iterable[TrafficRecord]],
+               stop_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Replay the inbound records and return timing statistics."""
+        if isinstance(records, (str, bytes)) or hasattr(records, "__fspath__") \
+                or hasattr(records, "read"):
+            records = read_traffic(records)
+
+        commands = 0
+        errors = 0
+        first: Optional[float] = None
+        started = time.monotonic()
+        for record in records:
+            if not record.inbound:
+                continue
+            if first is None:
+                first = record.timestamp
+            if self.speed is not None:
+                delay = started + (record.timestamp - first) / self.speed - time.monotonic()
+                if delay > 0:
+                    if stop_event is not None:
+                        if stop_event.wait(delay):
+                            break
+                    else:
+                        time.sleep(delay)
+            if stop_event is not None and stop_event.is_set():
+                break
+            try:
+                self.device.handle_command(record.payload)
+            except Exception as e:
+                errors += 1
+                _logger.error(f"Error replaying command: {e}")
+            commands += 1
+
+        duration = time.monotonic() - started
+        return {
+            "commands": commands,
+            "errors": errors,
+            "duration": duration,
+            "rate": commands / duration if duration > 0 else None,
+        }
@@ -0,0 +1,244 @@
+# qilowatt/rules.py
+
+import math
+import sys
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+from .exceptions import DataValidationError
+
+# Absolute maximum power limit - failsafe that cannot be exceeded
+ABSOLUTE_MAX_POWER = 100000.0
+
+ZERO = "zero"
+CLAMP = "clamp"
+DROP = "drop"
+REJECT = "reject"
+POLICIES = (ZERO, CLAMP, DROP, REJECT)
+
+# Results of a compiled check besides the (possibly repaired) value
+_DROPPED = object()
+_INVALID = object()
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    """Allowed values for one ENERGY/METRICS field.
+
+    Every value must be a finite number within ``minimum``/``maximum``; list
+    fields must also have ``min_length`` to ``max_length`` items. None (a
+    missing reading) is always let through as is. ``policy``
+    says what happens to a violation: "zero" or "clamp" the bad values,
+    "drop" the field from the payload, or "reject" the write with
+    DataValidationError. A list of the wrong length cannot be repaired, so it
+    is dropped unless the policy is "reject".
+    """
+
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    policy: str = ZERO
+
+    def __post_init__(self):
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown rule policy: {self.policy}")
+
+
+def _power() -> FieldRule:
+    return FieldRule(-ABSOLUTE_MAX_POWER, ABSOLUTE_MAX_POWER)
+
+
+# The defaults only catch what is never valid: non-finite values, power beyond
+# the failsafe, negative counters, voltages and SOC outside 0-100. Tighter
+# ranges and list lengths are site specific - set them with set_field_rule().
+_FINITE = FieldRule()
+_NON_NEGATIVE = FieldRule(0.0)
+
+DEFAULT_ENERGY_RULES: Mapping[str, FieldRule] = MappingProxyType({
+    "Power": _power(),
+    "Today": _NON_NEGATIVE,
+    "Total": _NON_NEGATIVE,
+    "Current": _FINITE,
+    "Voltage": _NON_NEGATIVE,
+    "Frequency": _NON_NEGATIVE,
+})
+
+DEFAULT_METRICS_RULES: Mapping[str, FieldRule] = MappingProxyType({
+    "PvPower": _power(),
+    "PvVoltage": _NON_NEGATIVE,
+    "PvCurrent": _FINITE,
+    "LoadPower": _power(),
+    "BatterySOC": FieldRule(0, 100, policy=CLAMP),
+    "LoadCurrent": _FINITE,
+    "BatteryPower": _power(),
+    "BatteryCurrent": _FINITE,
+    "BatteryVoltage": _NON_NEGATIVE,
+    "GenVoltage": _NON_NEGATIVE,
+    "GenPower": _power(),
+    "GenCurrent": _FINITE,
+    "GridExportLimit": _power(),
+    "BatteryTemperature": _FINITE,
+    "InverterTemperature": _FINITE,
+    "AlarmCodes": _NON_NEGATIVE,
+    "InverterStatus": _FINITE,
+})
+
+
+# Fields always limited to +/-ABSOLUTE_MAX_POWER, whatever rule is set for them
+POWER_FIELDS: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+    "ENERGY": ("Power",),
+    "METRICS": ("PvPower", "LoadPower", "BatteryPower", "GenPower", "GridExportLimit"),
+})
+
+
+def limit_rule(rule: Optional[FieldRule], limit: float, zero: bool = False) -> FieldRule:
+    """``rule`` with its range narrowed to -limit..limit (a plain range if None).
+
+    With ``zero`` a "clamp" rule zeroes its violations instead, so values
+    beyond the limit are reported as 0.
+    """
+    if rule is None:
+        return FieldRule(-limit, limit)
+    minimum = -limit if rule.minimum is None else max(rule.minimum, -limit)
+    maximum = limit if rule.maximum is None else min(rule.maximum, limit)
+    policy = ZERO if zero and rule.policy == CLAMP else rule.policy
+    return replace(rule, minimum=minimum, maximum=maximum, policy=policy)
+
+
+def compile_rule(rule: FieldRule) -> Callable[[Any], Any]:
+    """Turn a rule into a check returning the value itself when it passes.
+
+    A violating value comes back repaired, or as a marker for drop/reject.
+    Lists are first checked as a whole with sum(), min() and max(), which
+    run in C; only a list that fails is checked item by item.
+    """
+    lo = -math.inf if rule.minimum is None else rule.minimum
+    hi = math.inf if rule.maximum is None else rule.maximum
+    min_length = rule.min_length or 0
+    max_length = sys.maxsize if rule.max_length is None else rule.max_length
+    policy = rule.policy
+
+    def repair(value):
+        if value is None:
+            return value
+        try:
+            if value - value == 0 and lo <= value <= hi:
+                return value
+            finite = value - value == 0
+        except TypeError:
+            finite = False
+        if policy == ZERO or (policy == CLAMP and not finite):
+            return 0 if isinstance(value, int) else 0.0
+        if policy == CLAMP:
+            return min(max(value, lo), hi)
+        return _DROPPED if policy == DROP else _INVALID
+
+    def check(value):
+        if not isinstance(value, (list, tuple)):
+            return repair(value)
+        if not min_length <= len(value) <= max_length:
+            return _INVALID if policy == REJECT else _DROPPED
+        try:
+            # Infinity and NaN make the sum non-finite, which the ranges miss
+            total = sum(value)
+            if not value or (total - total == 0 and lo <= min(value) and max(value) <= hi):
+                return value
+        except TypeError:
+            pass
+        repaired = tuple(repair(item) for item in value)
+        for item in repaired:
+            if item is _DROPPED or item is _INVALID:
+                return item
+        # Only missing readings (None) stopped the fast check
+        if all(item is original for item, original in zip(repaired, value)):
+            return value
+        return repaired
+
+    return check
+
+
+class SectionRules:
+    """Compiled rules for one data section, with violation counters per field."""
+
+    def __init__(self, name: str, rules: Mapping[str, FieldRule]):
+        self.name = name
+        self._rules = dict(rules)
+        self._checks = {field: compile_rule(rule) for field, rule in self._rules.items()}
+        self._reject_fields: Tuple[str, ...] = ()
+        self._update_reject_fields()
+        # Bumped on every rule change, so cached results can be invalidated
+        self.version = 0
+        self.violations: Dict[str, int] = {}
+
+    def get_rule(self, field: str) -> Optional[FieldRule]:
+        return self._rules.get(field)
+
+    def set_rule(self, field: str, rule: Optional[FieldRule]):
+        """Replace the rule for ``field``; None removes it."""
+        rules = dict(self._rules)
+        checks = dict(self._checks)
+        if rule is None:
+            rules.pop(field, None)
+            checks.pop(field, None)
+        else:
+            rules[field] = rule
+            checks[field] = compile_rule(rule)
+        self._rules, self._checks = rules, checks
+        self._update_reject_fields()
+        self.version += 1
+
+    def _update_reject_fields(self):
+        self._reject_fields = tuple(
+            field for field, rule in self._rules.items() if rule.policy == REJECT
+        )
+
+    def validate(self, values: Mapping[str, Any]):
+        """Check incoming values against the "reject" rules.
+
+        Raises:
+            DataValidationError: If a value violates a "reject" rule.
+        """
+        for field in self._reject_fields:
+            if field not in values:
+                continue
+            if self._checks[field](values[field]) is _INVALID:
+                self._count(field)
+                raise DataValidationError(
+                    f"{self.name}.{field} value {values[field]!r} violates its rule"
+                )
+
+    def apply(self, section: Mapping[str, Any],
+              previous: Optional[Tuple[Mapping[str, Any], Mapping[str, Any]]] = None
+              ) -> Mapping[str, Any]:
+        """Return ``section`` with violations repaired or dropped.
+
+        ``section`` itself is returned when every value passes. ``previous``
+        is an earlier (section, result) pair under the same rules: values
+        that are the very same objects as there are not checked again.
+        """
+        checks = self._checks
+        previous_section, previous_result = previous or (None, None)
+        result = None
+        for field, value in section.items():
+            if previous_section is not None and previous_section.get(field) is value:
+                checked = previous_result.get(field, _DROPPED)
+            else:
+                check = checks.get(field)
+                if check is None:
+                    continue
+                checked = check(value)
+                if checked is not value:
+                    self._count(field)
+            if checked is value:
+                continue
+            if result is None:
+                result = dict(section)
+            if checked is _DROPPED or checked is _INVALID:
+                del result[field]
+            else:
+                result[field] = checked
+        return section if result is None else MappingProxyType(result)
+
+    def _count(self, field: str):
+        self.violations[field] = self.violations.get(field, 0) + 1
@@ -0,0 +1,377 @@
+# qilowatt/schema.py
+
+import json
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from .base_device import BaseDevice
+from .exceptions import CommandError
+from .serialization import SerializedData
+
+_logger = logging.getLogger(__name__)
+
+# Field kinds
+NUMBER = "number"
+SWITCH = "switch"  # truthy -> "ON", falsy -> "OFF"
+BOOLEAN = "boolean"
+TEXT = "text"
+KINDS = (NUMBER, SWITCH, BOOLEAN, TEXT)
+
+_NO_VALUE = object()
+
+
+@dataclass(frozen=True)
+class Field:
+    """One value in a generated SENSOR or STATE payload.
+
+    The value is read from the device attribute (or property) ``attribute``,
+    or is the constant ``value``. ``section`` nests it, e.g. under "ENERGY".
+    Numbers are rounded to ``precision`` decimals; 0 gives an int. ``unit``
+    is metadata for consumers, see DeviceSchema.units().
+    """
+
+    name: str
+    attribute: Optional[str] = None
+    kind: str = NUMBER
+    precision: Optional[int] = None
+    unit: Optional[str] = None
+    section: Optional[str] = None
+    value: Any = _NO_VALUE
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise ValueError(f"Unknown field kind: {self.kind}")
+        if (self.attribute is None) == (self.value is _NO_VALUE):
+            raise ValueError(f"Field {self.name} needs exactly one of attribute and value")
+        if self.attribute is not None and not self.attribute.isidentifier():
+            raise ValueError(f"Field {self.name}: {self.attribute!r} is not an attribute name")
+
+
+@dataclass(frozen=True)
+class Command:
+    """A backlog command such as ``POWER1 1``, dispatched to a device method.
+
+    The text after the command name is converted with ``parse`` and checked
+    against ``choices`` or ``minimum``/``maximum`` before ``handler`` (the
+    name of a device method) is called with it.
+    """
+
+    name: str
+    handler: str
+    parse: Callable[[str], Any] = str
+    choices: Optional[Tuple[Any, ...]] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+
+def parse_switch(argument: str) -> bool:
+    """Parse the argument of a POWER style command."""
+    value = argument.strip().upper()
+    if value in ("1", "ON", "TRUE"):
+        return True
+    if value in ("0", "OFF", "FALSE"):
+        return False
+    raise ValueError(f"Invalid switch value: {argument!r}")
+
+
+class DeviceSchema:
+    """Declarative description of a device's payloads and commands.
+
+    ``sensor`` and ``state`` list the fields of the SENSOR and STATE topics,
+    in payload order after "Time". SENSOR ends with "VERSION". ``power``
+    names the attribute published as 1/0 on the POWER1 topic. compile()
+    turns the schema into serializers that build the dict and its JSON in a
+    single pass, plus a command dispatcher; see SchemaDevice.
+    """
+
+    def __init__(
+        self,
+        sensor: Sequence[Field] = (),
+        state: Sequence[Field] = (),
+        commands: Sequence[Command] = (),
+        power: Optional[str] = None,
+    ):
+        self.sensor = tuple(sensor)
+        self.state = tuple(state)
+        self.commands = tuple(commands)
+        self.power = power
+        self._compiled: Optional["CompiledSchema"] = None
+
+    def units(self) -> Dict[str, str]:
+        """Units per field, keyed like ``"SENSOR.ANALOG.Temperature"``."""
+        units = {}
+        for topic, fields in (("SENSOR", self.sensor), ("STATE", self.state)):
+            for field in fields:
+                if field.unit:
+                    path = f"{field.section}.{field.name}" if field.section else field.name
+                    units[f"{topic}.{path}"] = field.unit
+        return units
+
+    def compile(self) -> "CompiledSchema":
+        """Generate the serializers and dispatcher, once per schema."""
+        if self._compiled is None:
+            self._compiled = CompiledSchema(
+                _compile_serializer("sensor", self.sensor, version=True),
+                _compile_serializer("state", self.state, version=False),
+                _compile_dispatch(self.commands),
+            )
+        return self._compiled
+
+
+class CompiledSchema:
+    def __init__(self, sensor: Callable[[Any], SerializedData],
+                 state: Callable[[Any], SerializedData],
+                 dispatch: Dict[str, Callable[[Any, str], Any]]):
+        self.sensor = sensor
+        self.state = state
+        self.dispatch = dispatch
+
+
+def _finite(value: Any) -> Any:
+    """NaN and infinity become None: JSON has no literal for them."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _encode_number(value: Any) -> str:
+    if value.__class__ is float and value - value == 0:
+        return float.__repr__(value)
+    if value.__class__ is int:
+        return int.__repr__(value)
+    return json.dumps(value)
+
+
+def _rounder(precision: int) -> Callable[[Any], Any]:
+    if precision == 0:
+        def round_int(value):
+            try:
+                return int(round(value))
+            except (TypeError, ValueError, OverflowError):
+                return value
+        return round_int
+
+    def round_value(value):
+        try:
+            return round(value, precision)
+        except TypeError:
+            return value
+    return round_value
+
+
+def _version(device) -> Tuple[Dict[str, Any], str]:
+    """VERSION data and its JSON, encoded again only when it changed."""
+    data = device.get_version_data()
+    cached = device._version_json
+    if cached is None or cached[0] != data:
+        cached = (data, json.dumps(data))
+        device._version_json = cached
+    return cached
+
+
+def _compile_serializer(topic: str, fields: Sequence[Field],
+                        version: bool) -> Callable[[Any], SerializedData]:
+    """Generate a function building a topic's dict and JSON from a device.
+
+    The JSON matches json.dumps() of the dict; constant keys and values are
+    encoded once here instead of on every call.
+    """
+    namespace: Dict[str, Any] = {
+        "SerializedData": SerializedData,
+        "_num": _encode_number,
+        "_finite": _finite,
+        "_dumps": json.dumps,
+        "_version": _version,
+    }
+    lines = ["time = device._clock.timestamp()"]
+    # Top-level (key, (dict expr, JSON piece)) in order; a section holds a list of them
+    layout: List[Tuple[str, Any]] = [("Time", ("time", (False, "_dumps(time)")))]
+    sections: Dict[str, List[Tuple[str, Any]]] = {}
+
+    for index, field in enumerate(fields):
+        if field.value is not _NO_VALUE:
+            constant = f"c{index}"
+            namespace[constant] = field.value
+            exprs = (constant, (True, json.dumps(field.value)))
+        else:
+            var = f"v{index}"
+            lines.append(f"{var} = device.{field.attribute}")
+            if field.kind == NUMBER:
+                if field.precision is not None:
+                    namespace[f"round{index}"] = _rounder(field.precision)
+                    lines.append(f"{var} = round{index}({var})")
+                lines.append(f"{var} = _finite({var})")
+                exprs = (var, (False, f"_num({var})"))
+            elif field.kind == SWITCH:
+                exprs = (f"('ON' if {var} else 'OFF')",
+                         (False, f"('\"ON\"' if {var} else '\"OFF\"')"))
+            elif field.kind == BOOLEAN:
+                lines.append(f"{var} = bool({var})")
+                exprs = (var, (False, f"('true' if {var} else 'false')"))
+            else:
+                exprs = (var, (False, f"_dumps({var})"))
+
+        if field.section is None:
+            layout.append((field.name, exprs))
+        else:
+            if field.section not in sections:
+                sections[field.section] = []
+                layout.append((field.section, sections[field.section]))
+            sections[field.section].append((field.name, exprs))
+
+    if version:
+        lines.append("version, version_json = _version(device)")
+        layout.append(("VERSION", ("version", (False, "version_json"))))
+
+    dict_expr, json_parts = _object_exprs(layout)
+    lines.append(f"data = {dict_expr}")
+    lines.append(f"payload = {_join_parts(json_parts)}")
+    lines.append("return SerializedData(data, payload)")
+    source = f"def serialize_{topic}(device):\n" + "".join(f"    {line}\n" for line in lines)
+    exec(source, namespace)
+    return namespace[f"serialize_{topic}"]
+
+
+def _object_exprs(items: List[Tuple[str, Any]]) -> Tuple[str, List[Tuple[bool, str]]]:
+    """Dict expression and JSON pieces for an object.
+
+    Pieces are (True, literal text) or (False, expression).
+    """
+    dict_items = []
+    json_parts = [(True, "{")]
+    for position, (key, exprs) in enumerate(items):
+        if position:
+            json_parts.append((True, ", "))
+        json_parts.append((True, json.dumps(key) + ": "))
+        if isinstance(exprs, list):
+            value_expr, value_parts = _object_exprs(exprs)
+            json_parts.extend(value_parts)
+        else:
+            value_expr = exprs[0]
+            json_parts.append(exprs[1])
+        dict_items.append(f"{key!r}: {value_expr}")
+    json_parts.append((True, "}"))
+    return "{" + ", ".join(dict_items) + "}", json_parts
+
+
+def _join_parts(parts: List[Tuple[bool, str]]) -> str:
+    """Concatenation expression, with neighbouring literals joined up front."""
+    exprs: List[str] = []
+    pending = None
+    for literal, text in parts:
+        if literal:
+            pending = text if pending is None else pending + text
+            continue
+        if pending is not None:
+            exprs.append(repr(pending))
+            pending = None
+        exprs.append(text)
+    if pending is not None:
+        exprs.append(repr(pending))
+    return " + ".join(exprs)
+
+
+def _compile_dispatch(commands: Sequence[Command]) -> Dict[str, Callable[[Any, str], Any]]:
+    dispatch = {}
+    for command in commands:
+        dispatch[command.name.upper()] = _compile_command(command)
+    return dispatch
+
+
+def _compile_command(command: Command) -> Callable[[Any, str], Any]:
+    parse = command.parse
+    choices = command.choices
+    minimum = command.minimum
+    maximum = command.maximum
+    handler = command.handler
+
+    def run(device, argument: str):
+        value = parse(argument)
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f"{command.name} must be a finite number")
+        if choices is not None and value not in choices:
+            raise ValueError(f"{command.name} must be one of {', '.join(map(str, choices))}")
+        if minimum is not None and value < minimum:
+            raise ValueError(f"{command.name} must be at least {minimum}")
+        if maximum is not None and value > maximum:
+            raise ValueError(f"{command.name} must be at most {maximum}")
+        return getattr(device, handler)(value)
+
+    return run
+
+
+class SchemaDevice(BaseDevice):
+    """Device whose payloads and commands are generated from ``schema``.
+
+    Subclasses set the ``schema`` class attribute and keep the attributes it
+    names up to date; get_sensor_data(), get_state_data() and
+    handle_command() come from the compiled schema.
+    """
+
+    schema: DeviceSchema = DeviceSchema()
+
+    def __init__(self, device_id: str):
+        super().__init__(device_id)
+        self._compiled = self.schema.compile()
+        self._version_json: Optional[Tuple[Dict[str, Any], str]] = None
+
+    @property
+    def uptime(self) -> int:
+        """Seconds since the device was created."""
+        return int((self._clock.utcnow() - self._startup_utc).total_seconds())
+
+    def get_sensor_data(self) -> Dict[str, Any]:
+        """Get current sensor data."""
+        return self._compiled.sensor(self)
+
+    def get_state_data(self) -> Dict[str, Any]:
+        """Get current state data."""
+        return self._compiled.state(self)
+
+    def handle_command(self, payload: bytes):
+        """Dispatch ``;`` separated commands to the schema's handlers."""
+        try:
+            self.execute_command(payload)
+        except Exception as e:
+            _logger.error(f"Error processing command message: {e}")
+
+    def execute_command(self, payload: bytes):
+        """Run every ``;`` separated command, then raise if any of them failed.
+
+        Raises:
+            CommandError: Listing the unknown, invalid or failed commands.
+        """
+        try:
+            message = payload.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise CommandError(f"Command is not UTF-8: {e}")
+        errors = []
+        for part in message.split(";"):
+            name, _, argument = part.strip().partition(" ")
+            if not name:
+                continue
+            run = self._compiled.dispatch.get(name.upper())
+            if run is None:
+                errors.append(f"unknown command {name}")
+                continue
+            try:
+                run(self, argument.strip())
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+        if errors:
+            raise CommandError(f"{self.device_id}: {'; '.join(errors)}")
+
+    def publish_power(self):
+        """Publish the schema's ``power`` attribute as 1/0 on the POWER1 topic."""
+        if self.schema.power is None or not hasattr(self, '_publish_callback'):
+            return None
+        return self._publish_callback(
+            self.power_topic, 1 if getattr(self, self.schema.power) else 0
+        )
+
+    def send_update(self):
+        """Publish SENSOR, STATE and POWER1 now, e.g. after a command."""
+        self.publish_sensor_data()
+        self.publish_state_data()
+        self.publish_power()
@@ -0,0 +1,67 @@
+# qilowatt/serialization.py
+
+import json
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+
+class SerializedData(dict):
+    """Publish data that carries its own JSON encoding.
+
+    Behaves like the plain dict devices always returned, but the client sends
+    ``payload`` as is instead of encoding the dict again. Do not modify it.
+    """
+
+    def __init__(self, data: Mapping[str, Any], payload: str):
+        super().__init__(data)
+        self.payload = payload
+
+
+class SectionEncoder:
+    """Encode frozen sections, re-encoding only fields whose value changed.
+
+    Frozen sections are immutable and share unchanged values between
+    snapshots, so a field whose value is the very same object as last time
+    reuses its cached JSON fragment.
+    """
+
+    def __init__(self):
+        self._last: Tuple[Optional[Mapping[str, Any]], str] = (None, "")
+        self._fragments: Dict[str, Tuple[Any, str]] = {}
+        self.encoded_fields = 0
+
+    def encode(self, section: Mapping[str, Any]) -> str:
+        last_section, last_json = self._last
+        if section is last_section:
+            return last_json
+
+        parts = []
+        for key, value in section.items():
+            cached = self._fragments.get(key)
+            if cached is None or cached[0] is not value:
+                cached = (value, f"{json.dumps(key)}: {json.dumps(value)}")
+                self._fragments[key] = cached
+                self.encoded_fields += 1
+            parts.append(cached[1])
+        encoded = encode_object(parts)
+        self._last = (section, encoded)
+        return encoded
+
+
+def encode_object(parts: Iterable[str]) -> str:
+    """Join ``"key": value`` fragments the way json.dumps formats an object."""
+    return "{" + ", ".join(parts) + "}"
+
+
+def add_fields(data: Mapping[str, Any], extra: Mapping[str, Any]) -> Dict[str, Any]:
+    """Copy ``data`` with the ``extra`` keys appended.
+
+    The JSON payload of SerializedData is extended instead of encoded again.
+    """
+    merged = dict(data)
+    merged.update(extra)
+    payload = getattr(data, "payload", None)
+    if payload is None or not payload.endswith("}") or any(key in data for key in extra):
+        return merged
+    parts = [f"{json.dumps(key)}: {json.dumps(value)}" for key, value in extra.items()]
+    separator = ", " if len(data) else ""
+    return SerializedData(merged, payload[:-1] + separator + ", ".join(parts) + "}")
@@ -0,0 +1,201 @@
+# qilowatt/sinks.py
+
+import ssl
+import uuid
+from abc import ABC, abstractmethod
+import threading
+import logging
+from collections import deque
+import paho.mqtt.client as mqtt
+from typing import Any, Callable, Dict, Optional
+from .outbound import OutboundQueue, DEFAULT_TOPIC_PRIORITIES, PRIORITY_NORMAL
+
+_logger = logging.getLogger(__name__)
+
+
+class PublishSink(ABC):
+    """Extra destination for the payloads a client publishes.
+
+    Clients serialize every message once and submit the same payload string
+    to each of their sinks. A sink has its own bounded latest-value-wins
+    queue and writer thread, so a slow or unreachable destination only fills
+    (and coalesces) its own queue and never delays the Qilowatt connection.
+    One sink may be added to many clients. Subclasses implement write().
+    """
+
+    def __init__(self, name: str, queue_size: int = 100,
+                 topic_priorities: Optional[Dict[str, int]] = None):
+        self.name = name
+        self._priorities = dict(DEFAULT_TOPIC_PRIORITIES)
+        if topic_priorities:
+            self._priorities.update(topic_priorities)
+        self._queue = OutboundQueue(
+            self._write_item,
+            max_depth=queue_size,
+            ready=self.ready,
+            name=f"QilowattSink-{name}",
+        )
+        self._lock = threading.Lock()
+        self.bytes_sent = 0
+
+    def submit(self, topic: str, payload: str, topic_class: Optional[str] = None) -> bool:
+        """Queue a serialized payload without blocking. Returns False if dropped."""
+        priority = self._priorities.get(topic_class, PRIORITY_NORMAL)
+        return self._queue.put(topic, (payload, topic_class), priority)
+
+    def start(self):
+        """Start the writer thread. Calling it again has no effect."""
+        self._queue.start()
+
+    def close(self) -> int:
+        """Stop the writer, returning the number of discarded messages."""
+        return self._queue.stop()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued was written. Returns False on timeout."""
+        return self._queue.wait_empty(timeout)
+
+    def ready(self) -> bool:
+        """Whether write() can be called now; queued messages wait otherwise."""
+        return True
+
+    def notify(self):
+        """Wake the writer, e.g. after the destination became ready."""
+        self._queue.notify()
+
+    @abstractmethod
+    def write(self, topic: str, payload: str, topic_class: Optional[str]) -> bool:
+        """Deliver one payload. Called on the sink's writer thread only."""
+        pass
+
+    def _write_item(self, topic: str, item) -> bool:
+        payload, topic_class = item
+        if not self.write(topic, payload, topic_class):
+            return False
+        with self._lock:
+            self.bytes_sent += len(payload)
+        return True
+
+    @property
+    def depth(self) -> int:
+        return self._queue.depth
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._queue.get_stats()
+        with self._lock:
+            stats["bytes"] = self.bytes_sent
+        return stats
+
+
+class CallbackSink(PublishSink):
+    """Sink handing each payload to ``callback(topic, payload)``.
+
+    The callback runs on the sink's writer thread; returning False counts the
+    message as failed.
+    """
+
+    def __init__(self, callback: Callable[[str, str], Any], name: str = "callback",
+                 queue_size: int = 100, topic_priorities: Optional[Dict[str, int]] = None):
+        super().__init__(name, queue_size, topic_priorities)
+        self._callback = callback
+
+    def write(self, topic: str, payload: str, topic_class: Optional[str]) -> bool:
+        return self._callback(topic, payload) is not False
+
+
+class MQTTSink(PublishSink):
+    """Sink publishing to a second MQTT broker, e.g. a local mosquitto.
+
+    Uses one connection however many clients the sink is added to. Topics
+    are published as ``topic_prefix + topic``; ``retain`` makes the broker
+    keep the last STATE/STATUS0 for late subscribers such as Home Assistant.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        topic_prefix: str = "",
+        qos: int = 0,
+        retain: bool = False,
+        tls_context: Optional[ssl.SSLContext] = None,
+        client_id: Optional[str] = None,
+        queue_size: int = 100,
+        max_unwritten: int = 10,
+        topic_priorities: Optional[Dict[str, int]] = None,
+        name: Optional[str] = None,
+    ):
+        super().__init__(name or f"{host}:{port}", queue_size, topic_priorities)
+        self.host = host
+        self.port = port
+        self._topic_prefix = topic_prefix
+        self._qos = qos
+        self._retain = retain
+        self._max_unwritten = max(1, max_unwritten)
+        self._unwritten: deque = deque()
+        self._connecting = False
+
+        self._client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id or f"qilowatt-sink-{uuid.uuid4().hex[:8]}",
+        )
+        if username:
+            self._client.username_pw_set(username, password)
+        if tls_context is not None:
+            self._client.tls_set_context(tls_context)
+        self._client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self._client.on_connect = self._on_connect
+
+    def start(self):
+        """Start the writer and connect in the background."""
+        super().start()
+        with self._lock:
+            if self._connecting:
+                return
+            self._connecting = True
+        self._client.connect_async(self.host, self.port, keepalive=30)
+        self._client.loop_start()
+
+    def close(self) -> int:
+        discarded = super().close()
+        with self._lock:
+            if not self._connecting:
+                return discarded
+            self._connecting = False
+        self._client.disconnect()
+        self._client.loop_stop()
+        return discarded
+
+    def ready(self) -> bool:
+        return self._client.is_connected()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if getattr(reason_code, "is_failure", False):
+            _logger.error(f"Sink {self.name} failed to connect: {reason_code}")
+            return
+        _logger.info(f"Sink {self.name} connected")
+        self.notify()
+
+    def write(self, topic: str, payload: str, topic_class: Optional[str]) -> bool:
+        result = self._client.publish(
+            self._topic_prefix + topic, payload, qos=self._qos, retain=self._retain
+        )
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            _logger.warning(f"Sink {self.name} failed to publish to {topic}: {result.rc}")
+            return False
+        self._unwritten.append(result)
+        while len(self._unwritten) > self._max_unwritten:
+            # Keep the backlog in our coalescing queue, not in paho's
+            oldest = self._unwritten.popleft()
+            try:
+                oldest.wait_for_publish(timeout=30)
+            except (ValueError, RuntimeError):
+                pass
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["connected"] = self._client.is_connected()
+        return stats
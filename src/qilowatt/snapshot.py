@@ -0,0 +1,38 @@
+# qilowatt/snapshot.py
+
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, NamedTuple, Optional
+
+NO_CHANGES: Mapping[str, FrozenSet[str]] = MappingProxyType({})
+
+
+class DataSnapshot(NamedTuple):
+    """A consistent, immutable view of a device's ENERGY and METRICS data.
+
+    Writers build a new snapshot and swap it in with one reference assignment,
+    so readers can take ``device.snapshot`` from any thread without locking
+    and always see both sections from the same moment. ``dirty`` names the
+    fields per section ("energy", "metrics") changed by the write that
+    produced this snapshot.
+    """
+
+    version: int = 0
+    energy: Optional[Mapping[str, Any]] = None
+    metrics: Optional[Mapping[str, Any]] = None
+    dirty: Mapping[str, FrozenSet[str]] = NO_CHANGES
+
+
+def freeze(data: Any) -> Mapping[str, Any]:
+    """Copy a dataclass or dict into a read-only mapping with lists as tuples."""
+    items = data.items() if isinstance(data, Mapping) else vars(data).items()
+    return MappingProxyType(
+        {key: tuple(value) if isinstance(value, list) else value for key, value in items}
+    )
+
+
+def thaw(section: Mapping[str, Any]) -> Dict[str, Any]:
+    """Copy a frozen section back into a plain dict with lists."""
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in section.items()
+    }
@@ -0,0 +1,228 @@
+# qilowatt/statestore.py
+
+import os
+import struct
+import threading
+import zlib
+import logging
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+from .clock import Clock, SYSTEM_CLOCK
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b"QWSTATE\x01"
+
+# Per record: CRC32 of the rest, key length, value length, wall-clock write time
+_RECORD = struct.Struct("<IHId")
+
+# Rewrite the log once it holds this many records per live key (plus slack)
+_COMPACT_FACTOR = 8
+_COMPACT_SLACK = 64
+
+
+class StateStore:
+    """Small crash-safe key/value store for device state across restarts.
+
+    Every put() appends a checksummed record to a log file and hands it to
+    the OS at once, so a crashed process loses nothing. fsync() is batched to
+    at most once per ``fsync_interval`` seconds to spare flash storage; use
+    flush() where a value must survive a power cut right away. A torn or
+    corrupt tail is dropped on open. When the log has grown well past the
+    live data it is compacted into a new file that atomically replaces it.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 1.0, clock: Clock = SYSTEM_CLOCK):
+        self.path = path
+        self._fsync_interval = max(0.0, fsync_interval)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[bytes, float]] = {}
+        self._records = 0
+        self._sync_timer = None
+        self._closed = False
+        self.fsyncs = 0
+        self.compactions = 0
+        self.compaction_errors = 0
+        self._compact_retry_at = 0
+        self.dropped_bytes = 0
+        self._file = self._open()
+
+    def get(self, key: str, default: Optional[bytes] = None) -> Optional[bytes]:
+        entry = self._values.get(key)
+        return default if entry is None else entry[0]
+
+    def written_at(self, key: str) -> Optional[float]:
+        """Wall-clock time (seconds since the epoch) the value was stored."""
+        entry = self._values.get(key)
+        return None if entry is None else entry[1]
+
+    def put(self, key: str, value: bytes):
+        written_at = self._clock.time()
+        record = _encode_record(key, value, written_at)
+        with self._lock:
+            if self._closed:
+                return
+            self._values[key] = (value, written_at)
+            try:
+                self._file.write(record)
+                self._file.flush()
+            except OSError as e:
+                _logger.error(f"Error writing state store {self.path}: {e}")
+                return
+            self._records += 1
+            if (self._records > _COMPACT_FACTOR * len(self._values) + _COMPACT_SLACK
+                    and self._records >= self._compact_retry_at and self._compact()):
+                return
+            if self._fsync_interval == 0:
+                self._fsync()
+            elif self._sync_timer is None:
+                self._sync_timer = self._clock.call_later(self._fsync_interval, self._timed_sync)
+
+    def flush(self):
+        """fsync everything written so far."""
+        with self._lock:
+            if not self._closed:
+                self._fsync()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._fsync()
+            self._closed = True
+            self._file.close()
+
+    def __enter__(self) -> "StateStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _timed_sync(self):
+        with self._lock:
+            self._sync_timer = None
+            if not self._closed:
+                self._fsync()
+
+    def _fsync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        except OSError as e:
+            _logger.error(f"Error syncing state store {self.path}: {e}")
+
+    def _open(self) -> BinaryIO:
+        """Load the log, dropping a damaged tail, and open it for appending."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+
+        if data and not data.startswith(MAGIC):
+            _logger.error(f"{self.path} is not a state store, moving it aside")
+            os.replace(self.path, self.path + ".corrupt")
+            data = b""
+        if not data:
+            return self._write_file({})
+
+        offset = len(MAGIC)
+        while offset + _RECORD.size <= len(data):
+            crc, key_len, value_len, written_at = _RECORD.unpack_from(data, offset)
+            end = offset + _RECORD.size + key_len + value_len
+            if end > len(data) or crc != zlib.crc32(data[offset + 4:end]):
+                break
+            body = data[offset + _RECORD.size:end]
+            self._values[body[:key_len].decode("utf-8")] = (body[key_len:], written_at)
+            self._records += 1
+            offset = end
+
+        f = open(self.path, "r+b")
+        if offset < len(data):
+            self.dropped_bytes = len(data) - offset
+            _logger.warning(f"Dropped {self.dropped_bytes} damaged bytes from {self.path}")
+            f.truncate(offset)
+        f.seek(offset)
+        return f
+
+    def _compact(self) -> bool:
+        """Rewrite the log with only the live values. Returns False on failure."""
+        try:
+            new_file = self._write_file(self._values)
+        except OSError as e:
+            # Keep appending to the current log and try again after more writes
+            _logger.error(f"Error compacting state store {self.path}: {e}")
+            self.compaction_errors += 1
+            self._compact_retry_at = self._records + _COMPACT_SLACK
+            return False
+        old_file, self._file = self._file, new_file
+        try:
+            old_file.close()
+        except OSError:
+            pass
+        self._records = len(self._values)
+        self.compactions += 1
+        return True
+
+    def _write_file(self, values: Dict[str, Tuple[bytes, float]]) -> BinaryIO:
+        """Write a complete store next to the log and atomically replace it.
+
+        Returns the new log opened for appending. On failure the current log
+        is left as it was.
+        """
+        tmp_path = self.path + ".tmp"
+        f = None
+        try:
+            f = open(tmp_path, "wb")
+            f.write(MAGIC)
+            for key, (value, written_at) in values.items():
+                f.write(_encode_record(key, value, written_at))
+            f.flush()
+            os.fsync(f.fileno())
+            self.fsyncs += 1
+            # The handle follows the file through the rename
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if f is not None:
+                f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+        return f
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._values),
+            "records": self._records,
+            "fsyncs": self.fsyncs,
+            "compactions": self.compactions,
+            "compaction_errors": self.compaction_errors,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+
+def _encode_record(key: str, value: bytes, written_at: float) -> bytes:
+    key_bytes = key.encode("utf-8")
+    rest = _RECORD.pack(0, len(key_bytes), len(value), written_at)[4:] + key_bytes + value
+    return struct.pack("<I", zlib.crc32(rest)) + rest
+
+
+def _fsync_directory(path: str):
+    # Makes the rename durable; not possible on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
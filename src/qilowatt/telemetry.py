@@ -0,0 +1,355 @@
+# qilowatt/telemetry.py
+
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+import logging
+from array import array
+from collections import deque
+from typing import (
+    Any, BinaryIO, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+)
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b"QWTELEM\x01"
+SEGMENT_SUFFIX = ".qwt"
+
+# Per batch: marker, flags, header length, body length, CRC32 of header and body
+_BATCH = struct.Struct("<4sBIII")
+_BATCH_MARKER = b"QWTB"
+_FLAG_ZLIB = 1
+
+# (directory, prefix) of every open recorder in this process
+_open_recorders = set()
+_open_recorders_lock = threading.Lock()
+
+NUMERIC = "d"
+JSON = "j"
+
+_NAN = float("nan")
+
+# Top-level SENSOR keys recorded by default; Time and VERSION add nothing
+DEFAULT_INCLUDE = ("ENERGY", "METRICS", "WORKMODE")
+
+
+def flatten(data: Mapping[str, Any], include: Optional[Iterable[str]] = None,
+            prefix: str = "") -> Dict[str, Any]:
+    """Flatten nested SENSOR data into ``"ENERGY.Power[0]"`` style columns."""
+    flat: Dict[str, Any] = {}
+    keys = data.keys() if include is None else [k for k in include if k in data]
+    for key in keys:
+        _flatten_value(flat, f"{prefix}{key}", data[key])
+    return flat
+
+
+def _flatten_value(flat: Dict[str, Any], name: str, value: Any):
+    if isinstance(value, Mapping):
+        for key, item in value.items():
+            _flatten_value(flat, f"{name}.{key}", item)
+    elif isinstance(value, (list, tuple)):
+        for index, item in enumerate(value):
+            _flatten_value(flat, f"{name}[{index}]", item)
+    else:
+        flat[name] = value
+
+
+def _pack_floats(values: List[float]) -> bytes:
+    packed = array("d", values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_floats(data: bytes) -> List[float]:
+    packed = array("d")
+    packed.frombytes(data)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tolist()
+
+
+def encode_batch(rows: List[Tuple[float, Dict[str, Any]]], compress: bool = True) -> bytes:
+    """Encode flattened rows into one columnar batch.
+
+    Columns holding only numbers are stored as little-endian float64 (NaN
+    where a row lacks the column); anything else as a JSON list.
+    """
+    names: Dict[str, None] = {}
+    for _, flat in rows:
+        for name in flat:
+            names.setdefault(name)
+
+    parts = [_pack_floats([timestamp for timestamp, _ in rows])]
+    columns = []
+    for name in names:
+        values = [flat.get(name) for _, flat in rows]
+        if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool))
+               for v in values):
+            data = _pack_floats([_NAN if v is None else v for v in values])
+            kind = NUMERIC
+        else:
+            data = json.dumps(values).encode("utf-8")
+            kind = JSON
+        columns.append([name, kind, len(data)])
+        parts.append(data)
+
+    header = json.dumps({"rows": len(rows), "columns": columns}).encode("utf-8")
+    body = b"".join(parts)
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= _FLAG_ZLIB
+    crc = zlib.crc32(body, zlib.crc32(header))
+    return _BATCH.pack(_BATCH_MARKER, flags, len(header), len(body), crc) + header + body
+
+
+def decode_batch(header: bytes, body: bytes,
+                 flags: int) -> Tuple[List[float], Dict[str, List[Any]]]:
+    info = json.loads(header)
+    if flags & _FLAG_ZLIB:
+        body = zlib.decompress(body)
+    rows = info["rows"]
+    offset = rows * 8
+    timestamps = _unpack_floats(body[:offset])
+    columns: Dict[str, List[Any]] = {}
+    for name, kind, length in info["columns"]:
+        data = body[offset:offset + length]
+        offset += length
+        columns[name] = _unpack_floats(data) if kind == NUMERIC else json.loads(data)
+    return timestamps, columns
+
+
+class TelemetryRecorder:
+    """Store every SENSOR sample locally in compact, rotating segment files.
+
+    record() only queues the sample; a background thread flattens queued
+    samples into columns and writes them as one batch every ``batch_rows``
+    samples or ``flush_interval`` seconds, optionally zlib compressed. A new
+    segment file is started once the current one reaches ``segment_bytes``;
+    with ``max_segments`` the oldest ones are deleted. When the writer falls
+    ``max_pending`` samples behind, the oldest queued samples are dropped.
+
+    Segments are named after ``prefix``, and pruning removes the oldest
+    segments with that prefix. Recorders sharing a directory (e.g. one per
+    device) therefore each need their own prefix, such as the device id.
+
+    Raises:
+        ValueError: If another open recorder uses the same directory and prefix.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "sensor",
+        batch_rows: int = 512,
+        flush_interval: float = 10.0,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_segments: Optional[int] = None,
+        compress: bool = True,
+        include: Optional[Iterable[str]] = DEFAULT_INCLUDE,
+        max_pending: int = 100000,
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self._key = (os.path.realpath(directory), prefix)
+        with _open_recorders_lock:
+            if self._key in _open_recorders:
+                raise ValueError(
+                    f"A telemetry recorder already writes {prefix!r} segments to {directory}"
+                )
+            _open_recorders.add(self._key)
+        self._batch_rows = max(1, batch_rows)
+        self._flush_interval = max(0.0, flush_interval)
+        self._segment_bytes = max(1, segment_bytes)
+        self._max_segments = max_segments
+        self._compress = compress
+        self._include = None if include is None else tuple(include)
+        self._pending: Deque[Tuple[float, Mapping[str, Any]]] = deque(maxlen=max(1, max_pending))
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flush_requested = False
+        self._writing = False
+        self._file: Optional[BinaryIO] = None
+        self._segment_path: Optional[str] = None
+        self._segment_seq = 0
+        self.rows = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.segments = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=f"QilowattTelemetry-{prefix}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, data: Mapping[str, Any], timestamp: Optional[float] = None):
+        """Queue one sample. ``data`` must not be modified afterwards."""
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append((time.time() if timestamp is None else timestamp, data))
+            if len(self._pending) >= self._batch_rows:
+                self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued so far. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+            while self._pending or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Write what is queued and close the current segment."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        with _open_recorders_lock:
+            _open_recorders.discard(self._key)
+
+    def __enter__(self) -> "TelemetryRecorder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and not self._flush_requested \
+                        and len(self._pending) < self._batch_rows:
+                    self._cond.wait(self._flush_interval or None)
+                rows = [self._pending.popleft()
+                        for _ in range(min(len(self._pending), self._batch_rows))]
+                closing = self._closed and not self._pending
+                self._writing = bool(rows)
+            try:
+                if rows:
+                    self._write_batch(rows)
+            except Exception as e:
+                _logger.error(f"Error writing telemetry segment: {e}")
+            with self._cond:
+                self._writing = False
+                if not self._pending:
+                    self._flush_requested = False
+                self._cond.notify_all()
+            if closing:
+                self._close_segment()
+                return
+
+    def _write_batch(self, rows: List[Tuple[float, Mapping[str, Any]]]):
+        flat = [(timestamp, flatten(data, self._include)) for timestamp, data in rows]
+        batch = encode_batch(flat, self._compress)
+        if self._file is None or self._file.tell() + len(batch) > self._segment_bytes:
+            self._open_segment()
+        self._file.write(batch)
+        self._file.flush()
+        self.rows += len(rows)
+        self.batches += 1
+        self.bytes_written += len(batch)
+
+    def _open_segment(self):
+        self._close_segment()
+        self._segment_seq += 1
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        name = f"{self.prefix}-{stamp}-{self._segment_seq:04d}{SEGMENT_SUFFIX}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._file = open(self._segment_path, "wb", buffering=1024 * 1024)
+        self._file.write(MAGIC)
+        self.segments += 1
+        self._prune_segments()
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _prune_segments(self):
+        if not self._max_segments:
+            return
+        segments = segment_paths(self.directory, self.prefix)
+        for path in segments[:-self._max_segments]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                _logger.warning(f"Could not remove old telemetry segment {path}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "bytes": self.bytes_written,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "segments": self.segments,
+            "segment": self._segment_path,
+        }
+
+
+def segment_paths(directory: str, prefix: str = "sensor") -> List[str]:
+    """Segment files of a recorder, oldest first."""
+    # Exact names only: prefix "sensor" must not match "sensor-INV1-..." segments
+    pattern = re.compile(rf"{re.escape(prefix)}-\d{{8}}T\d{{6}}-\d{{4,}}{re.escape(SEGMENT_SUFFIX)}")
+    names = [name for name in os.listdir(directory) if pattern.fullmatch(name)]
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def read_batches(path: str, prefix: str = "sensor"
+                 ) -> Iterator[Tuple[List[float], Dict[str, List[Any]]]]:
+    """Yield (timestamps, columns) per batch from a segment or a directory.
+
+    One batch is in memory at a time. A batch cut short at the end of a
+    segment (e.g. by a crash) ends that segment.
+
+    Raises:
+        ValueError: If a file is not a telemetry segment.
+    """
+    paths = segment_paths(path, prefix) if os.path.isdir(path) else [path]
+    for segment in paths:
+        with open(segment, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{segment} is not a telemetry segment")
+            while True:
+                raw = f.read(_BATCH.size)
+                if len(raw) < _BATCH.size:
+                    break
+                marker, flags, header_len, body_len, crc = _BATCH.unpack(raw)
+                header = f.read(header_len)
+                body = f.read(body_len)
+                if (marker != _BATCH_MARKER or len(body) < body_len
+                        or zlib.crc32(body, zlib.crc32(header)) != crc):
+                    _logger.warning(f"Damaged batch at the end of {segment}")
+                    break
+                yield decode_batch(header, body, flags)
+
+
+def read_records(path: str, prefix: str = "sensor") -> Iterator[Dict[str, Any]]:
+    """Yield one flat dict per sample, with its time under ``"timestamp"``.
+
+    Columns a sample did not have (and NaN values) are left out.
+    """
+    for timestamps, columns in read_batches(path, prefix):
+        for row, timestamp in enumerate(timestamps):
+            record = {"timestamp": timestamp}
+            for name, values in columns.items():
+                value = values[row]
+                if value is None or value != value:
+                    continue
+                record[name] = value
+            yield record
@@ -0,0 +1,143 @@
+# qilowatt/tls.py
+
+import ssl
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+_logger = logging.getLogger(__name__)
+
+
+class _SessionCachingSSLSocket(ssl.SSLSocket):
+    """SSLSocket that hands its TLS session back to the owning context."""
+
+    def do_handshake(self, block=False):
+        super().do_handshake(block)
+        self.context._handshake_done(self)
+
+    def close(self):
+        # TLS 1.3 tickets arrive after the handshake, so look again on close
+        self.context._remember_session(self)
+        super().close()
+
+
+class QilowattTLSContext(ssl.SSLContext):
+    """SSLContext meant to be shared by many QilowattMQTTClient instances.
+
+    Besides avoiding one context (and certificate store) per client, it keeps
+    the last TLS session per server hostname and offers it on the next
+    handshake, so reconnects can use an abbreviated handshake.
+    """
+
+    sslsocket_class = _SessionCachingSSLSocket
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self._session_lock = threading.Lock()
+        self._sessions: Dict[str, ssl.SSLSession] = {}
+        self._handshakes = 0
+        self._resumed = 0
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None and server_hostname and not server_side:
+            with self._session_lock:
+                session = self._sessions.get(server_hostname)
+        try:
+            ssl_sock = super().wrap_socket(
+                sock, server_side=server_side,
+                do_handshake_on_connect=do_handshake_on_connect,
+                suppress_ragged_eofs=suppress_ragged_eofs,
+                server_hostname=server_hostname, session=session,
+            )
+        except ValueError:
+            if session is None:
+                raise
+            # The cached session does not fit this socket - fall back to a full handshake
+            _logger.debug("Discarding cached TLS session for %s", server_hostname)
+            self.forget_session(server_hostname)
+            ssl_sock = super().wrap_socket(
+                sock, server_side=server_side,
+                do_handshake_on_connect=do_handshake_on_connect,
+                suppress_ragged_eofs=suppress_ragged_eofs,
+                server_hostname=server_hostname,
+            )
+        return ssl_sock
+
+    def _handshake_done(self, ssl_sock: ssl.SSLSocket):
+        with self._session_lock:
+            self._handshakes += 1
+            if ssl_sock.session_reused:
+                self._resumed += 1
+        self._remember_session(ssl_sock)
+
+    def _remember_session(self, ssl_sock: ssl.SSLSocket):
+        hostname = ssl_sock.server_hostname
+        if not hostname or ssl_sock.server_side:
+            return
+        try:
+            session = ssl_sock.session
+        except (ValueError, OSError):
+            return
+        if session is None:
+            return
+        with self._session_lock:
+            self._sessions[hostname] = session
+
+    def forget_session(self, hostname: Optional[str] = None):
+        """Drop the cached session for a hostname (or all sessions)."""
+        with self._session_lock:
+            if hostname is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(hostname, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get handshake and session resumption counters."""
+        with self._session_lock:
+            return {
+                "handshakes": self._handshakes,
+                "resumed": self._resumed,
+                "cached_sessions": len(self._sessions),
+            }
+
+
+def create_tls_context(
+    verify: bool = False,
+    ca_certs: Optional[str] = None,
+    certfile: Optional[str] = None,
+    keyfile: Optional[str] = None,
+) -> QilowattTLSContext:
+    """Create a TLS context that can be passed to many clients.
+
+    Args:
+        verify: Verify the broker certificate and hostname. When False the
+            certificate is not checked, which matches the historical behaviour.
+        ca_certs: CA bundle to verify against (system store if omitted).
+        certfile: Optional client certificate.
+        keyfile: Private key for certfile.
+    """
+    context = QilowattTLSContext(ssl.PROTOCOL_TLS_CLIENT)
+    if verify:
+        if ca_certs:
+            context.load_verify_locations(ca_certs)
+        else:
+            context.load_default_certs()
+    else:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if certfile:
+        context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+_default_context: Optional[QilowattTLSContext] = None
+_default_context_lock = threading.Lock()
+
+
+def get_default_tls_context() -> QilowattTLSContext:
+    """Return the process-wide context used by clients without tls_context."""
+    global _default_context
+    with _default_context_lock:
+        if _default_context is None:
+            _default_context = create_tls_context()
+        return _default_context
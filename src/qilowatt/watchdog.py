@@ -0,0 +1,172 @@
+# qilowatt/watchdog.py
+
+import contextvars
+import queue
+import threading
+import weakref
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .exceptions import DeadlineExceededError
+
+_logger = logging.getLogger(__name__)
+
+# Seconds an idle helper thread waits for the next call before exiting
+_IDLE_TIMEOUT = 60.0
+
+
+class _Helpers:
+    """Helper threads shared by all guards.
+
+    A call goes to an idle helper or, when none is idle, to a new one, so
+    calls that hang never hold up the calls of other guards. The most recently
+    used helpers are reused first and the others exit once idle long enough.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Inboxes of the idle helpers
+        self._idle: List["queue.SimpleQueue"] = []
+
+    def submit(self, job: Tuple[Future, contextvars.Context, Callable[..., Any], tuple]):
+        with self._lock:
+            inbox = self._idle.pop() if self._idle else None
+        if inbox is None:
+            inbox = queue.SimpleQueue()
+            thread = threading.Thread(target=self._work, args=(inbox,), name="QilowattGuard")
+            thread.daemon = True
+            thread.start()
+        inbox.put(job)
+
+    def _work(self, inbox: "queue.SimpleQueue"):
+        while True:
+            try:
+                future, context, func, args = inbox.get(timeout=_IDLE_TIMEOUT)
+            except queue.Empty:
+                with self._lock:
+                    # Unless a call was just handed to us
+                    if any(idle is inbox for idle in self._idle):
+                        self._idle = [idle for idle in self._idle if idle is not inbox]
+                        return
+                continue
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(context.run(func, *args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._idle.append(inbox)
+
+
+_helpers = _Helpers()
+
+
+class DeadlineGuard:
+    """Run a user call on a helper thread and stop waiting after a deadline.
+
+    Helper threads are shared by all guards but never waited for: a call
+    that hangs keeps its helper, and the next call of any guard starts a new
+    one, so it only holds up the guard it was made through. The call itself
+    cannot be interrupted. While it is still running, further calls through
+    the same guard fail at once instead of piling up behind it. Calls run in
+    a copy of the caller's context, so context variables set by the caller
+    stay visible. With ``timeout=None`` calls run inline on the caller's
+    thread.
+    """
+
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self._pending: Optional[Future] = None
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def call(self, func: Callable[..., Any], *args) -> Any:
+        """Call ``func(*args)`` and return its result.
+
+        Raises:
+            DeadlineExceededError: If the call missed the deadline, or the
+                previous call has not returned yet.
+        """
+        if self.timeout is None:
+            return self._counted(func, *args)
+
+        pending = self._pending
+        if pending is not None and not pending.done():
+            self.skipped += 1
+            raise DeadlineExceededError(f"{self.name} is still busy with the previous call")
+
+        future = Future()
+        self._pending = future
+        _helpers.submit((future, contextvars.copy_context(), self._counted, (func,) + args))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.overruns += 1
+            raise DeadlineExceededError(
+                f"{self.name} did not return within {self.timeout:.1f}s"
+            )
+
+    def _counted(self, func: Callable[..., Any], *args) -> Any:
+        try:
+            return func(*args)
+        except Exception:
+            self.errors += 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        pending = self._pending
+        return {
+            "timeout": self.timeout,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "busy": pending is not None and not pending.done(),
+        }
+
+
+class TimerWatchdog:
+    """Background thread asking watched devices to check their timer jobs."""
+
+    def __init__(self, check_interval: float = 5.0):
+        self._check_interval = check_interval
+        self._devices: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, device):
+        with self._lock:
+            self._devices.add(device)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="QilowattWatchdog")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unwatch(self, device):
+        with self._lock:
+            self._devices.discard(device)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._check_interval)
+            with self._lock:
+                devices = list(self._devices)
+                if not devices:
+                    self._thread = None
+                    return
+            for device in devices:
+                try:
+                    # Each device judges its jobs by its own clock
+                    device.check_timer_jobs()
+                except Exception as e:
+                    _logger.error(f"Error in timer watchdog: {e}")
+
+
+_watchdog = TimerWatchdog()
+
+
+def get_watchdog() -> TimerWatchdog:
+    """Return the process-wide timer watchdog."""
+    return _watchdog
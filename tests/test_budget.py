@@ -0,0 +1,160 @@
+import itertools
+import os
+import sys
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice, SENSOR_INTERVAL
+from qilowatt.budget import BandwidthBudget, publish_overhead
+from qilowatt.clock import VirtualClock
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+def noon_clock():
+    # Noon UTC: half of the day has passed
+    return VirtualClock(wall_start=datetime(2024, 5, 10, 12, tzinfo=timezone.utc).timestamp())
+
+
+def sensor(power, voltage=230.0):
+    return {
+        "ENERGY": {"Power": [power, 0, 0], "Voltage": [voltage, 0, 0]},
+        "METRICS": {"BatteryPower": [0.0]},
+    }
+
+
+def test_publish_overhead():
+    # Fixed header (2) + topic length (2) + topic (5)
+    assert publish_overhead("a/b/c", 10, qos=0) == 9
+    # Packet identifier and PUBACK
+    assert publish_overhead("a/b/c", 10, qos=1) == 9 + 2 + 4
+    # Remaining length needs a second byte from 128 bytes on
+    assert publish_overhead("a/b/c", 200, qos=0) == 10
+
+
+def test_saving_mode_follows_projection():
+    clock = noon_clock()
+    budget = BandwidthBudget(daily_bytes=1000, clock=clock)
+
+    assert budget.record(400) is False
+    assert not budget.saving
+    # 600 bytes by noon projects to 1200 for the day
+    assert budget.record(200) is True
+    assert budget.saving
+    assert budget.interval_scale == 1.25
+
+    # Still above 90% of the budget: hold saving mode
+    clock.advance(3 * 3600)
+    assert budget.record(0) is False
+    assert budget.saving
+    # 600 bytes by 20:00 projects to 720
+    clock.advance(5 * 3600)
+    assert budget.record(0) is True
+    assert not budget.saving
+    assert budget.interval_scale == 1.0
+
+    stats = budget.get_stats()
+    assert stats["periods"]["daily"]["used"] == 600
+    assert stats["saving"] is False
+
+
+def test_new_day_resets_usage():
+    clock = noon_clock()
+    budget = BandwidthBudget(daily_bytes=1000, clock=clock)
+    budget.record(2000)
+    assert budget.saving
+
+    clock.advance(13 * 3600)
+    budget.record(10)
+    assert not budget.saving
+    assert budget.get_stats()["periods"]["daily"]["used"] == 10
+
+
+def test_deadband_and_heartbeat_while_saving():
+    clock = noon_clock()
+    budget = BandwidthBudget(daily_bytes=1000, deadband=0.05, heartbeat=300, clock=clock)
+    budget.record(2000)
+
+    assert budget.filter_sensor(sensor(1000)) is not None
+    # Within 5%: skipped
+    assert budget.filter_sensor(sensor(1040)) is None
+    # Changed by more than 5% from the last published value
+    assert budget.filter_sensor(sensor(1100)) is not None
+    # Heartbeat forces a publish even without change
+    clock.advance(301)
+    assert budget.filter_sensor(sensor(1100)) is not None
+    assert budget.get_stats()["deadband_skipped"] == 1
+
+
+def test_optional_fields_dropped_while_saving():
+    clock = noon_clock()
+    budget = BandwidthBudget(daily_bytes=1000, clock=clock)
+    data = sensor(1000)
+    assert budget.filter_sensor(data) is data
+
+    budget.record(2000)
+    filtered = budget.filter_sensor(sensor(2000))
+    assert filtered["ENERGY"] == {"Power": [2000, 0, 0]}
+    assert budget.get_stats()["fields_dropped"] == 1
+
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    client.is_connected.return_value = True
+    mids = itertools.count(1)
+    client.publish.side_effect = lambda *a, **k: MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+    with patch("qilowatt.client.mqtt.Client", return_value=client):
+        yield client
+
+
+def test_client_counts_bytes_and_stretches_intervals(mock_client):
+    # The budget follows the client's clock
+    clock = noon_clock()
+    budget = BandwidthBudget(daily_bytes=1000)
+    client = QilowattMQTTClient("user", "pass", DummyDevice(), bandwidth_budget=budget,
+                                clock=clock)
+    device = client.device
+
+    client.publish(device.sensor_topic, sensor(1000))
+    stats = client.get_stats()["bandwidth"]
+    payload = mock_client.publish.call_args.args[1]
+    assert stats["bytes_out"] == len(payload) + publish_overhead(device.sensor_topic, len(payload))
+    assert stats["by_class"] == {"SENSOR": stats["bytes_out"]}
+
+    for _ in range(20):
+        client.publish(device.state_topic, {"Time": "x" * 50})
+    assert budget.saving
+    assert device.get_stats()["interval_scale"] == budget.interval_scale > 1.0
+    assert device._next_sensor_interval() == SENSOR_INTERVAL * budget.interval_scale
+
+    # Unchanged SENSOR data is held back while saving
+    handle = client.publish(device.sensor_topic, sensor(1000))
+    assert handle.done() and handle.reason == "deadband"
+    assert handle.skipped and not handle.delivered
+    assert client.get_stats()["bandwidth"]["budget"]["deadband_skipped"] == 1
+    assert "deadband" not in client.get_delivery_stats()["failed"]
+
+    # A new day on the client's clock starts a new budget period
+    clock.advance(13 * 3600)
+    client.publish(device.state_topic, {})
+    assert not budget.saving
+    client.disconnect()
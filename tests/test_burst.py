@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.clock import VirtualClock
+from qilowatt.devices.inverter import InverterDevice
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    clock = VirtualClock(start=1000.0)
+    monkeypatch.setattr("qilowatt.base_device.SYSTEM_CLOCK", clock)
+    return clock
+
+
+def test_burst_disabled_by_default(fake_time):
+    device = InverterDevice(device_id="INV1")
+    device.trigger_burst()
+
+    assert device.burst_active is False
+    assert device._next_sensor_interval() == 10.0
+
+
+def test_workmode_command_starts_burst_window(fake_time):
+    device = InverterDevice(device_id="INV1")
+    device.set_burst_mode(duration=5.0, interval=1.0)
+
+    device.handle_command(b'WORKMODE {"Mode": "buy"}')
+
+    assert device.burst_active is True
+    assert device._next_sensor_interval() == 1.0
+    assert device.get_stats()["burst"]["triggered"] == 1
+
+    fake_time.advance(5.0)
+    assert device.burst_active is False
+    assert device._next_sensor_interval() == 10.0
+
+
+def test_burst_rate_cap_falls_back_to_normal_interval(fake_time):
+    device = InverterDevice(device_id="INV1")
+    device.set_burst_mode(duration=30.0, interval=1.0, max_per_minute=3)
+    device.trigger_burst()
+
+    for _ in range(4):
+        device._record_sensor_publish()
+        fake_time.advance(1.0)
+
+    stats = device.get_stats()["burst"]
+    assert stats["publishes"] == 3
+    assert stats["rate_limited"] == 1
+    assert device._next_sensor_interval() == 10.0
+
+    # Older burst publishes age out of the one minute window
+    device.trigger_burst()
+    fake_time.advance(60.0)
+    device.trigger_burst()
+    assert device._next_sensor_interval() == 1.0
+
+
+def test_burst_interval_is_floored():
+    device = InverterDevice(device_id="INV1")
+    device.set_burst_mode(duration=5.0, interval=0.01)
+
+    assert device.get_stats()["burst"]["interval"] == 0.5
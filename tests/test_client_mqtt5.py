@@ -0,0 +1,150 @@
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+    def stop_timers(self) -> None:
+        pass
+
+
+class ManualTimer:
+    def __init__(self, delay, callback):
+        self.delay = delay
+        self.callback = callback
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        pass
+
+
+@pytest.fixture
+def patched_environment(monkeypatch):
+    mock_client = MagicMock()
+    mock_client.is_connected.return_value = True
+    mock_client.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 1)
+    mock_client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+
+    with patch("qilowatt.client.mqtt.Client", return_value=mock_client) as factory:
+        monkeypatch.setattr("qilowatt.client.threading.Timer", ManualTimer)
+        mock_client.factory = factory
+        yield mock_client
+
+
+def connack_properties(alias_max):
+    properties = Properties(PacketTypes.CONNACK)
+    properties.TopicAliasMaximum = alias_max
+    return properties
+
+
+def make_client(**kwargs):
+    return QilowattMQTTClient(
+        mqtt_username="user",
+        mqtt_password="pass",
+        device=DummyDevice(),
+        mqtt_v5=True,
+        **kwargs,
+    )
+
+
+def test_v5_client_requests_session_expiry(patched_environment):
+    client = make_client(session_expiry=120, client_id="fixed-id")
+
+    _, factory_kwargs = patched_environment.factory.call_args
+    assert factory_kwargs["protocol"] == mqtt.MQTTv5
+    assert factory_kwargs["client_id"] == "fixed-id"
+
+    patched_environment.is_connected.return_value = False
+    client.connect()
+    _, connect_kwargs = patched_environment.connect.call_args
+    assert connect_kwargs["properties"].SessionExpiryInterval == 120
+
+    client.disconnect()
+
+
+def test_topic_alias_replaces_topic_after_first_publish(patched_environment):
+    client = make_client()
+    client._on_connect(patched_environment, None, MagicMock(), 0, connack_properties(10))
+
+    device = client.device
+    device._publish_callback(device.sensor_topic, {"a": 1})
+    device._publish_callback(device.sensor_topic, {"a": 2})
+
+    first, second = patched_environment.publish.call_args_list
+    assert first.args[0] == device.sensor_topic
+    assert second.args[0] == ""
+    assert first.kwargs["properties"].TopicAlias == 1
+    assert second.kwargs["properties"].TopicAlias == 1
+    assert second.kwargs["properties"].MessageExpiryInterval == 30
+
+    client.disconnect()
+
+
+def test_no_alias_when_broker_disallows_aliases(patched_environment):
+    client = make_client()
+    client._on_connect(patched_environment, None, MagicMock(), 0, connack_properties(0))
+
+    device = client.device
+    device._publish_callback(device.state_topic, {})
+    device._publish_callback(device.state_topic, {})
+
+    topics = [c.args[0] for c in patched_environment.publish.call_args_list]
+    assert topics == [device.state_topic, device.state_topic]
+
+    client.disconnect()
+
+
+def test_resumed_session_skips_resubscribe(patched_environment):
+    client = make_client()
+    client._on_connect(patched_environment, None, MagicMock(session_present=False), 0, None)
+    client._on_subscribe(patched_environment, None, 1, [0], None)
+    client._on_disconnect(patched_environment, None, MagicMock(), 7, None)
+
+    client._on_connect(patched_environment, None, MagicMock(session_present=True), 0, None)
+
+    assert patched_environment.subscribe.call_count == 1
+    assert client.connected is True
+    assert client.subscribed is True
+
+    client.disconnect()
+
+
+def test_rejected_v5_falls_back_to_v311(patched_environment):
+    client = make_client()
+    rejected = ReasonCode(PacketTypes.CONNACK, "Unsupported protocol version")
+
+    client._on_connect(patched_environment, None, MagicMock(), rejected, None)
+
+    assert client.mqtt_v5 is False
+    _, factory_kwargs = patched_environment.factory.call_args
+    assert "protocol" not in factory_kwargs
+    patched_environment.connect_async.assert_called_once_with(
+        client.host, client.port, keepalive=30
+    )
+
+    client.disconnect()
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import uuid
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+
+# Set to "host:port" of a plain-TCP broker to run the latency tests
+TEST_BROKER = os.environ.get("QILOWATT_TEST_BROKER")
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+    def stop_timers(self) -> None:
+        pass
+
+
+class ManualTimer:
+    def __init__(self, delay, callback):
+        self.delay = delay
+        self.callback = callback
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        pass
+
+
+@pytest.fixture
+def patched_environment(monkeypatch):
+    mock_client = MagicMock()
+    mock_client.is_connected.return_value = True
+    mock_client.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 1)
+
+    with patch("qilowatt.client.mqtt.Client", return_value=mock_client) as factory:
+        monkeypatch.setattr("qilowatt.client.threading.Timer", ManualTimer)
+        mock_client.factory = factory
+        yield mock_client
+
+
+def test_persistent_session_uses_stable_client_id(patched_environment):
+    QilowattMQTTClient("user", "pass", DummyDevice(), clean_session=False)
+
+    _, factory_kwargs = patched_environment.factory.call_args
+    assert factory_kwargs["client_id"] == "qilowatt-DEVICE123"
+    assert factory_kwargs["clean_session"] is False
+
+
+def test_session_present_marks_ready_without_subscribe(patched_environment):
+    states = []
+    client = QilowattMQTTClient("user", "pass", DummyDevice(), clean_session=False)
+    client.add_connection_callback(states.append)
+
+    client._on_pre_connect(patched_environment, None)
+    client._on_connect(patched_environment, None, MagicMock(session_present=True), 0, None)
+
+    assert patched_environment.subscribe.call_count == 0
+    assert client.connected is True
+    assert client.subscribed is True
+    assert states == [True]
+    stats = client.get_stats()
+    assert stats["session_resumes"] == 1
+    assert stats["last_ready_latency"] is not None
+
+    client.disconnect()
+
+
+def test_clean_session_always_resubscribes(patched_environment):
+    client = QilowattMQTTClient("user", "pass", DummyDevice())
+
+    client._on_connect(patched_environment, None, MagicMock(session_present=True), 0, None)
+
+    assert patched_environment.subscribe.call_count == 1
+    assert client.connected is False
+
+    client.disconnect()
+
+
+def _wait_ready(client, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not client.connected and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert client.connected, "client did not become ready"
+    return client.get_stats()["last_ready_latency"]
+
+
+@pytest.mark.skipif(not TEST_BROKER, reason="QILOWATT_TEST_BROKER not set")
+def test_reconnect_to_ready_latency_against_broker():
+    host, port = TEST_BROKER.rsplit(":", 1)
+    client_id = f"qilowatt-test-{uuid.uuid4().hex[:8]}"
+
+    def make_client(clean_session):
+        return QilowattMQTTClient(
+            "user", "pass", DummyDevice(), host=host, port=int(port), tls=False,
+            client_id=client_id, clean_session=clean_session,
+        )
+
+    # Clean session: every connect waits for SUBACK
+    clean = make_client(True)
+    clean.connect()
+    clean_latency = _wait_ready(clean)
+    clean.disconnect()
+
+    # Persistent session: first connect subscribes, the restart resumes
+    first = make_client(False)
+    first.connect()
+    _wait_ready(first)
+    first.disconnect()
+
+    restarted = make_client(False)
+    restarted.connect()
+    resumed_latency = _wait_ready(restarted)
+    stats = restarted.get_stats()
+    restarted.disconnect()
+
+    assert stats["session_resumes"] == 1
+    assert clean_latency is not None
+    assert resumed_latency is not None
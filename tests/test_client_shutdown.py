@@ -0,0 +1,128 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.reasoncodes import ReasonCode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self, events):
+        super().__init__(device_id="DEVICE123")
+        self.events = events
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+    def stop_timers(self) -> None:
+        self.events.append("stop_timers")
+
+
+PUBACK = ReasonCode(PacketTypes.PUBACK, "Success")
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def mock_client(events):
+    client = MagicMock()
+    client.is_connected.return_value = True
+    mids = itertools.count(1)
+    client.publish.side_effect = lambda *a, **k: MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+    client.disconnect.side_effect = lambda *a, **k: events.append("disconnect")
+    with patch("qilowatt.client.mqtt.Client", return_value=client):
+        yield client
+
+
+def make_client(events, **kwargs):
+    return QilowattMQTTClient("user", "pass", DummyDevice(events), qos={"POWER1": 1}, **kwargs)
+
+
+def test_disconnect_waits_for_acks(mock_client, events):
+    client = make_client(events)
+    client._connected = True
+    handle = client.publish(client.device.power_topic, 1)
+
+    ack = threading.Timer(0.05, client._on_publish, (mock_client, None, handle.mid, PUBACK, None))
+    ack.start()
+    report = client.disconnect(flush_timeout=5)
+    ack.join()
+
+    assert report == {"flushed": 1, "abandoned": 0}
+    assert handle.delivered
+    assert events == ["stop_timers", "disconnect"]
+
+
+def test_disconnect_abandons_after_deadline(mock_client, events):
+    client = make_client(events)
+    handle = client.publish(client.device.power_topic, 1)
+
+    report = client.disconnect(flush_timeout=0.05)
+
+    assert report == {"flushed": 0, "abandoned": 1}
+    assert handle.reason == "abandoned"
+    assert client.get_delivery_stats()["inflight"] == 0
+
+
+def test_disconnect_does_not_wait_for_qos0_messages(mock_client, events):
+    client = make_client(events)
+    client.publish(client.device.sensor_topic, {})
+
+    started = time.monotonic()
+    report = client.disconnect(flush_timeout=5)
+
+    assert time.monotonic() - started < 1
+    assert report == {"flushed": 0, "abandoned": 1}
+
+
+def test_disconnect_drains_outbound_queue(mock_client, events):
+    client = make_client(events, outbound_queue_size=10)
+    mids = itertools.count(1)
+    # Hold the writer back until disconnect() has started
+    flushing = threading.Event()
+    client.device.stop_timers = flushing.set
+
+    def written(*args, **kwargs):
+        flushing.wait(2)
+        # paho reports QoS 0 messages as published once written
+        mid = next(mids)
+        client._on_publish(mock_client, None, mid, PUBACK, None)
+        return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=mid)
+
+    mock_client.publish.side_effect = written
+    client.publish(client.device.sensor_topic, {"v": 1})
+    client.publish(client.device.state_topic, {})
+    client._outbound.start()
+
+    report = client.disconnect(flush_timeout=2)
+
+    assert report == {"flushed": 2, "abandoned": 0}
+
+
+def test_disconnect_without_connection_does_not_wait(mock_client, events):
+    client = make_client(events, outbound_queue_size=10)
+    mock_client.is_connected.return_value = False
+    client.publish(client.device.sensor_topic, {})
+
+    report = client.disconnect(flush_timeout=30)
+
+    assert report == {"flushed": 0, "abandoned": 1}
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+from collections import Counter
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.clock import VirtualClock
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {"Time": self._clock.timestamp()}
+
+    def get_state_data(self):
+        return {}
+
+
+def test_timestamp_is_formatted_once_per_second():
+    clock = VirtualClock(wall_start=1704067200.0)
+    first = clock.timestamp()
+    assert first == "2024-01-01T00:00:00"
+
+    clock.advance(0.5)
+    assert clock.timestamp() is first
+    clock.advance(0.5)
+    assert clock.timestamp() == "2024-01-01T00:00:01"
+
+
+def test_virtual_clock_runs_a_day_of_device_timers():
+    clock = VirtualClock()
+    device = DummyDevice()
+    device.set_clock(clock)
+    published = Counter()
+    last_sensor = []
+
+    def publish(topic, data):
+        published[topic.rsplit("/", 1)[1]] += 1
+        if topic == device.sensor_topic:
+            last_sensor[:] = [data]
+
+    device.set_publish_callback(publish)
+    started = time.monotonic()
+    device.start_timers()
+    clock.advance(24 * 3600)
+    elapsed = time.monotonic() - started
+    device.stop_timers()
+
+    # STATUS0 once at startup and then hourly
+    assert published == {"SENSOR": 8640, "STATE": 1440, "STATUS0": 25}
+    assert last_sensor[0]["Time"] == "2024-01-02T00:00:00"
+    assert device.check_timer_jobs() == []
+    assert elapsed < 30
+
+
+def test_auth_backoff_in_virtual_time():
+    clock = VirtualClock()
+    mock_client = MagicMock()
+    mock_client.is_connected.return_value = False
+    with patch("qilowatt.client.mqtt.Client", return_value=mock_client):
+        client = QilowattMQTTClient(
+            "user", "pass", DummyDevice(), max_auth_retries=5,
+            auth_retry_delay=5.0, max_auth_retry_delay=60.0, clock=clock,
+        )
+        client._on_connect(mock_client, None, MagicMock(), 5, None)
+
+        clock.advance(4.9)
+        assert mock_client.reconnect.call_count == 0
+        clock.advance(0.1)
+        assert mock_client.reconnect.call_count == 1
+
+        # Second failure backs off to 10s
+        client._on_connect(mock_client, None, MagicMock(), 5, None)
+        clock.advance(9.9)
+        assert mock_client.reconnect.call_count == 1
+        clock.advance(0.1)
+        assert mock_client.reconnect.call_count == 2
+        client.disconnect()
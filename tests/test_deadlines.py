@@ -0,0 +1,145 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.base_device import BaseDevice
+from qilowatt.devices.inverter import InverterDevice
+
+
+class HangingDevice(BaseDevice):
+    """get_sensor_data blocks while ``release`` is not set, like a hung Modbus read."""
+
+    def __init__(self, device_id: str = "DEVICE123"):
+        super().__init__(device_id=device_id)
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+        self.reads = 0
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        self.release.wait(5)
+        if self.fail:
+            raise IOError("Modbus timeout")
+        self.reads += 1
+        return {"Time": "t", "Reads": self.reads}
+
+    def get_state_data(self):
+        return {}
+
+
+@pytest.fixture
+def device():
+    device = HangingDevice()
+    device.set_call_deadline("sensor", 0.05)
+    published = []
+    device.set_publish_callback(lambda topic, data: published.append(data))
+    device.published = published
+    yield device
+    device.release.set()
+
+
+def test_hung_getter_publishes_last_good_data_as_stale(device):
+    device.publish_sensor_data()
+    device.release.clear()
+
+    start = time.monotonic()
+    device.publish_sensor_data()
+    assert time.monotonic() - start < 1.0
+    # Still hung - the next publish does not queue another call behind it
+    device.publish_sensor_data()
+
+    first, stale, still_stale = device.published
+    assert first["Reads"] == 1 and "Stale" not in first
+    assert stale["Reads"] == 1 and stale["Stale"] >= 0
+    assert still_stale["Reads"] == 1
+    stats = device.get_stats()["deadlines"]["sensor"]
+    assert (stats["overruns"], stats["skipped"], stats["stale_publishes"]) == (1, 1, 2)
+
+
+def test_hung_devices_do_not_starve_other_devices(device):
+    hung = [HangingDevice(f"HUNG{i}") for i in range(20)]
+    try:
+        for other in hung:
+            other.set_call_deadline("sensor", 0.05)
+            other.set_publish_callback(lambda topic, data: None)
+            other.release.clear()
+            other.publish_sensor_data()
+
+        device.publish_sensor_data()
+        device.publish_sensor_data()
+
+        assert [data["Reads"] for data in device.published] == [1, 2]
+        assert not any("Stale" in data for data in device.published)
+    finally:
+        for other in hung:
+            other.release.set()
+
+
+def test_deadlines_are_on_by_default_and_share_helpers():
+    def helpers():
+        return [t for t in threading.enumerate() if t.name == "QilowattGuard"]
+
+    before = len(helpers())
+    devices = [HangingDevice(f"DEV{i}") for i in range(50)]
+    for device in devices:
+        device.set_publish_callback(lambda topic, data: None)
+        device.publish_sensor_data()
+
+    # Idle helpers are reused, not kept one per device
+    assert len(helpers()) <= before + 1
+    assert all(device.reads == 1 for device in devices)
+    assert devices[0].get_stats()["deadlines"]["sensor"]["timeout"] == 5.0
+
+
+def test_nothing_published_without_good_data(device):
+    device.release.clear()
+    device.publish_sensor_data()
+    assert device.published == []
+
+
+def test_getter_errors_fall_back_to_last_good_data(device):
+    device.publish_sensor_data()
+    device.fail = True
+    device.publish_sensor_data()
+
+    assert device.published[-1]["Stale"] >= 0
+    assert device.get_stats()["deadlines"]["sensor"]["errors"] == 1
+
+
+def test_slow_command_callback_does_not_block_command_handling():
+    device = InverterDevice(device_id="INV1")
+    device.set_call_deadline("command", 0.05)
+    device.set_burst_mode(duration=10.0)
+    release = threading.Event()
+    device.set_command_callback(lambda command: release.wait(5))
+
+    start = time.monotonic()
+    device.handle_command(b'WORKMODE {"Mode": "buy"}')
+    release.set()
+
+    assert time.monotonic() - start < 1.0
+    assert device.burst_active
+    assert device.get_stats()["deadlines"]["command"]["overruns"] == 1
+
+
+def test_watchdog_reports_stalled_jobs_once(device):
+    device._timer_jobs = {"state": [0.0, False], "sensor": [104.0, False]}
+
+    assert device.check_timer_jobs(now=110.0) == []
+    assert device.check_timer_jobs(now=121.0) == ["state"]
+    assert device.check_timer_jobs(now=125.0) == ["state", "sensor"]
+
+    watchdog = device.get_stats()["watchdog"]
+    assert watchdog["late"] == {"state": 1, "sensor": 1}
+    assert watchdog["stalled"] == ["state", "sensor"]
+
+    device._job_ran("state")
+    assert device.get_stats()["watchdog"]["stalled"] == ["sensor"]
@@ -0,0 +1,201 @@
+import itertools
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.histogram import LatencyHistogram
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+PUBACK = ReasonCode(PacketTypes.PUBACK, "Success")
+
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    client.is_connected.return_value = True
+    mids = itertools.count(1)
+    client.publish.side_effect = lambda *a, **k: MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+    with patch("qilowatt.client.mqtt.Client", return_value=client):
+        yield client
+
+
+def make_client(**kwargs):
+    return QilowattMQTTClient("user", "pass", DummyDevice(), **kwargs)
+
+
+def test_qos_follows_topic_class(mock_client):
+    client = make_client(qos={"POWER1": 1})
+    device = client.device
+
+    sensor = client.publish(device.sensor_topic, {})
+    power = client.publish(device.power_topic, 1)
+
+    qos_used = [c.kwargs["qos"] for c in mock_client.publish.call_args_list]
+    assert qos_used == [0, 1]
+    assert (sensor.qos, power.qos) == (0, 1)
+    assert client.get_delivery_stats()["inflight"] == 1
+
+
+def test_puback_resolves_handle_and_records_latency(mock_client):
+    client = make_client(qos={"POWER1": 1})
+    handle = client.publish(client.device.power_topic, 1)
+    assert not handle.done()
+
+    client._on_publish(mock_client, None, handle.mid, PUBACK, None)
+
+    assert handle.wait(timeout=0) is True
+    assert handle.latency is not None
+    stats = client.get_delivery_stats()
+    assert stats["inflight"] == 0
+    assert stats["delivered"] == 1
+    assert stats["ack_latency"]["POWER1"]["count"] == 1
+    assert stats["ack_latency"]["SENSOR"]["count"] == 0
+
+
+def test_ack_before_publish_returns(mock_client):
+    client = make_client(qos={"STATE": 1})
+
+    def publish_and_ack(*args, **kwargs):
+        # paho may write (and a QoS 0 publish complete) inside publish()
+        client._on_publish(mock_client, None, 7, PUBACK, None)
+        return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=7)
+
+    mock_client.publish.side_effect = publish_and_ack
+    handle = client.publish(client.device.state_topic, {})
+
+    assert handle.delivered
+    assert client.get_delivery_stats()["inflight"] == 0
+
+
+def test_full_window_fails_fast(mock_client):
+    client = make_client(qos={"POWER1": 1}, max_inflight=1, inflight_timeout=0)
+    first = client.publish(client.device.power_topic, 1)
+    second = client.publish(client.device.power_topic, 0)
+
+    assert second.done() and second.reason == "inflight_full"
+    assert mock_client.publish.call_count == 1
+    mock_client.max_inflight_messages_set.assert_called_with(1)
+
+    client._on_publish(mock_client, None, first.mid, PUBACK, None)
+    third = client.publish(client.device.power_topic, 0)
+    assert not third.done()
+    assert client.get_delivery_stats()["failed"] == {"inflight_full": 1}
+
+
+def test_command_callback_publish_does_not_wait_for_window(mock_client):
+    # A full window drains only on the network thread, which is waiting
+    # for the command callback running on its deadline guard thread
+    client = make_client(qos={"POWER1": 1}, max_inflight=1, inflight_timeout=5)
+    device = client.device
+    client.publish(device.power_topic, 1)
+    handles = []
+    device.handle_command = lambda payload: device._run_command_callback(
+        lambda: handles.append(client.publish(device.power_topic, 0))
+    )
+
+    start = time.monotonic()
+    client._on_message(mock_client, None, MagicMock(topic=device.command_topic, payload=b"x", qos=0))
+
+    assert time.monotonic() - start < 1.0
+    assert handles[0].reason == "inflight_full"
+
+
+def test_rejected_and_unconnected_publishes_fail(mock_client):
+    client = make_client(qos={"POWER1": 1})
+    handle = client.publish(client.device.power_topic, 1)
+    client._on_publish(
+        mock_client, None, handle.mid, ReasonCode(PacketTypes.PUBACK, "Not authorized"), None
+    )
+    assert handle.reason == "rejected"
+
+    mock_client.is_connected.return_value = False
+    assert client.publish(client.device.power_topic, 1).reason == "not_connected"
+
+
+def test_disconnect_fails_unsent_qos0_messages(mock_client):
+    client = make_client(qos={"POWER1": 1})
+    sensor = client.publish(client.device.sensor_topic, {})
+    power = client.publish(client.device.power_topic, 1)
+
+    # paho drops unsent QoS 0 messages on reconnect, but resends QoS 1/2
+    client._on_disconnect(mock_client, None, None, 7, None)
+
+    assert sensor.reason == "not_connected"
+    assert not power.done()
+    stats = client.get_delivery_stats()
+    assert stats["failed"] == {"not_connected": 1}
+    assert stats["inflight"] == 1
+
+
+def test_untracked_early_outcomes_are_bounded(mock_client):
+    client = make_client()
+    for mid in range(1000, 2000):
+        client._on_publish(mock_client, None, mid, PUBACK, None)
+    assert len(client._inflight._early) <= 256
+
+    handle = client.publish(client.device.sensor_topic, {})
+    assert not handle.done()
+
+
+def test_superseded_queue_entry_fails_handle(mock_client):
+    client = make_client(outbound_queue_size=10)
+    old = client.publish(client.device.sensor_topic, {"v": 1})
+    new = client.publish(client.device.sensor_topic, {"v": 2})
+
+    assert old.reason == "superseded"
+    assert not new.done()
+    client.disconnect()
+    assert new.reason == "discarded"
+
+
+def test_v5_qos1_topics_do_not_use_aliases(mock_client):
+    client = make_client(mqtt_v5=True, qos={"STATE": 1})
+    properties = Properties(PacketTypes.CONNACK)
+    properties.TopicAliasMaximum = 10
+    client._reset_topic_aliases(properties)
+
+    client.publish(client.device.state_topic, {})
+    client.publish(client.device.sensor_topic, {})
+
+    state_props = mock_client.publish.call_args_list[0].kwargs["properties"]
+    sensor_props = mock_client.publish.call_args_list[1].kwargs["properties"]
+    assert not hasattr(state_props, "TopicAlias")
+    assert sensor_props.TopicAlias == 1
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram(bounds=(0.01, 0.1, 1.0))
+    for value in [0.005] * 90 + [0.05] * 9 + [2.0]:
+        histogram.record(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["p50"] == 0.01
+    assert snapshot["p99"] == 0.1
+    assert snapshot["max"] == 2.0
+    assert snapshot["buckets"] == {"le_0.01": 90, "le_0.1": 9, "le_1": 0, "inf": 1}
@@ -0,0 +1,162 @@
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.clock import VirtualClock
+from qilowatt.endpoints import Endpoint, EndpointSelector
+
+A = ("a.example", 8883)
+B = ("b.example", 8883)
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+class FakeProbe:
+    def __init__(self, **rtts):
+        self.rtts = rtts
+
+    def __call__(self, endpoint, timeout):
+        return self.rtts.get(endpoint.host[0])
+
+
+def test_first_probe_picks_fastest_then_hysteresis():
+    probe = FakeProbe(a=0.100, b=0.050)
+    selector = EndpointSelector([A, B], smoothing=1.0, probe=probe)
+    assert selector.current == Endpoint(*A)
+    assert selector.probe() == Endpoint(*B)
+
+    # A slightly faster endpoint is not worth a switch
+    probe.rtts = {"a": 0.045, "b": 0.050}
+    assert selector.probe() == Endpoint(*B)
+    # A much faster one is
+    probe.rtts = {"a": 0.010, "b": 0.050}
+    assert selector.probe() == Endpoint(*A)
+    # An endpoint that stops answering probes is left at once
+    probe.rtts = {"b": 0.050}
+    assert selector.probe() == Endpoint(*B)
+    assert selector.get_stats()["switches"] == 3
+
+
+def test_failover_after_repeated_failures():
+    selector = EndpointSelector([A, B], failure_threshold=3)
+    assert not selector.record_failure()
+    assert not selector.record_failure()
+    selector.record_success()
+    assert not selector.record_failure()
+    assert not selector.record_failure()
+    assert selector.record_failure()
+    assert selector.current == Endpoint(*B)
+    # Without a healthy alternative the endpoints are tried in turn
+    assert selector.record_failure(immediate=True)
+    assert selector.current == Endpoint(*A)
+
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    client.is_connected.return_value = True
+    client.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 1)
+    with patch("qilowatt.client.mqtt.Client", return_value=client):
+        yield client
+
+
+def make_client(probe, clock=None):
+    selector = EndpointSelector([A, B], failure_threshold=2, probe=probe)
+    device = DummyDevice()
+    client = QilowattMQTTClient("user", "pass", device, endpoints=selector,
+                                endpoint_probe_interval=60, clock=clock)
+    published = []
+    device.set_publish_callback(lambda topic, data: published.append((topic, data)))
+    return client, device, published
+
+
+def connect(client, mock_client):
+    mock_client.is_connected.return_value = False
+    client.connect()
+    mock_client.is_connected.return_value = True
+
+
+def ready(client, mock_client):
+    client._on_connect(mock_client, None, MagicMock(session_present=False), 0, None)
+    client._on_subscribe(mock_client, None, 1, [0], None)
+
+
+def test_connect_skips_unreachable_endpoint(mock_client):
+    client, device, published = make_client(FakeProbe(a=0.01, b=0.05))
+    mock_client.connect.side_effect = [OSError("refused"), 0]
+
+    connect(client, mock_client)
+
+    hosts = [call[0][0] for call in mock_client.connect.call_args_list]
+    assert hosts == ["a.example", "b.example"]
+    ready(client, mock_client)
+    status = published[-1][1]
+    assert published[-1][0] == device.status0_topic
+    assert (status["StatusMQT"]["MqttHost"], status["StatusMQT"]["MqttPort"]) == B
+    assert client.get_stats()["endpoints"]["in_use"] == "b.example:8883"
+    client.disconnect()
+
+
+def test_reconnect_fails_over_and_probes_periodically(mock_client):
+    clock = VirtualClock()
+    probe = FakeProbe(a=0.01, b=0.05)
+    client, device, published = make_client(probe, clock)
+    connect(client, mock_client)
+    ready(client, mock_client)
+    assert device.get_status0_data().StatusMQT.MqttHost == "a.example"
+
+    # Two failed reconnects in a row move paho's reconnects to B
+    client._on_disconnect(mock_client, None, None, 7, None)
+    client._on_connect_fail(mock_client, None)
+    mock_client.connect_async.assert_not_called()
+    client._on_connect_fail(mock_client, None)
+    mock_client.connect_async.assert_called_once_with("b.example", 8883, keepalive=30)
+    ready(client, mock_client)
+    assert published[-1][1]["StatusMQT"]["MqttHost"] == "b.example"
+
+    # The periodic probe keeps a working connection where it is
+    clock.advance(60)
+    assert client.get_stats()["endpoints"]["probe_rounds"] == 2
+    stats = client.get_stats()["endpoints"]
+    assert (stats["current"], stats["in_use"]) == ("a.example:8883", "b.example:8883")
+    # and moves on the next reconnect
+    client._on_disconnect(mock_client, None, None, 7, None)
+    assert client.host == "a.example"
+    client.disconnect()
+
+
+def test_only_unavailable_broker_refusals_fail_over(mock_client):
+    client, device, published = make_client(FakeProbe(a=0.01, b=0.05))
+    connect(client, mock_client)
+    ready(client, mock_client)
+
+    # Bad credentials or a rejected client id would be refused everywhere
+    for code in (135, 135, 133, 133):
+        client._on_connect(mock_client, None, MagicMock(session_present=False), code, None)
+    mock_client.connect_async.assert_not_called()
+    assert client.get_stats()["endpoints"]["current"] == "a.example:8883"
+
+    # A busy broker is worth leaving
+    for _ in range(2):
+        client._on_connect(mock_client, None, MagicMock(session_present=False), 137, None)
+    mock_client.connect_async.assert_called_once_with("b.example", 8883, keepalive=30)
+    client.disconnect()
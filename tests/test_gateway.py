@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.base_device import BaseDevice
+from qilowatt.gateway import DeviceSpec, GatewaySupervisor, shard_for
+
+
+class RecordingDevice(BaseDevice):
+    """Device that reports what it was asked to do through get_stats()."""
+
+    def __init__(self, device_id):
+        super().__init__(device_id)
+        self.value = None
+        self._callback = None
+
+    def set_value(self, value):
+        self.value = value
+
+    def set_command_callback(self, callback):
+        self._callback = callback
+
+    def handle_command(self, payload: bytes) -> None:
+        if self._callback:
+            self._callback(payload.decode())
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["value"] = self.value
+        stats["pid"] = os.getpid()
+        return stats
+
+
+def make_spec(device_id):
+    # Nothing listens on port 1, so clients stay offline and keep retrying
+    return DeviceSpec(
+        device_id, RecordingDevice, "user", "pass",
+        client_kwargs={"host": "127.0.0.1", "port": 1, "tls": False},
+    )
+
+
+def wait_for(predicate, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def device_value(supervisor, device_id):
+    stats = supervisor.get_device_stats(device_id)
+    return stats["device"]["value"] if stats else None
+
+
+def test_shard_for_is_stable():
+    assert shard_for("INV1", 4) == shard_for("INV1", 4)
+    assert {shard_for(f"INV{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+@pytest.fixture
+def supervisor():
+    commands = []
+    supervisor = GatewaySupervisor(
+        workers=2, on_command=lambda d, c: commands.append((d, c)),
+        flush_interval=0.05, stats_interval=0.1, restart_delay=0.1,
+    )
+    supervisor.commands = commands
+    for i in range(4):
+        supervisor.add_device(make_spec(f"DEV{i}"))
+    supervisor.start()
+    yield supervisor
+    supervisor.stop()
+
+
+def test_calls_reach_workers_and_commands_come_back(supervisor):
+    for i in range(4):
+        supervisor.submit(f"DEV{i}", "set_value", i)
+    supervisor.submit("DEV1", "handle_command", b"POWER1 1")
+
+    assert wait_for(lambda: all(device_value(supervisor, f"DEV{i}") == i for i in range(4)))
+    assert wait_for(lambda: supervisor.commands == [("DEV1", "POWER1 1")])
+
+    stats = supervisor.get_stats()
+    assert stats["devices"] == 4
+    assert stats["alive"] == 2
+    pids = {supervisor.get_device_stats(f"DEV{i}")["device"]["pid"] for i in range(4)}
+    assert os.getpid() not in pids
+
+
+def test_dead_worker_is_restarted_with_state(supervisor):
+    supervisor.submit("DEV0", "set_value", "before crash")
+    assert wait_for(lambda: device_value(supervisor, "DEV0") == "before crash")
+
+    worker = supervisor._workers[supervisor.worker_for("DEV0")]
+    old_pid = worker.process.pid
+    worker.process.kill()
+
+    assert wait_for(lambda: supervisor.get_stats()["restarts"] == 1)
+    assert wait_for(
+        lambda: supervisor.get_device_stats("DEV0")["device"]["pid"] != old_pid
+    )
+    assert device_value(supervisor, "DEV0") == "before crash"
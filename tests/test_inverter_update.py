@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.exceptions import DataValidationError
+from qilowatt.models import EnergyData, MetricsData
+from qilowatt.serialization import SerializedData
+
+
+ENERGY = dict(
+    Power=[100.0, 200.0, 300.0], Today=5.0, Total=1000.0,
+    Current=[1.0, 2.0, 3.0], Voltage=[230.0, 231.0, 229.0], Frequency=50.0,
+)
+METRICS = dict(
+    PvPower=[1000.0, 1500.0], PvVoltage=[400.0, 410.0], PvCurrent=[2.5, 3.7],
+    LoadPower=[500.0, 600.0, 700.0], BatterySOC=[80], LoadCurrent=[2.2, 2.6, 3.0],
+    BatteryPower=[-500.0], BatteryCurrent=[-10.0], BatteryVoltage=[50.0],
+    GenVoltage=[0.0], GenPower=[0.0], GenCurrent=[0.0], GridExportLimit=10000.0,
+    BatteryTemperature=[25.0], InverterTemperature=45.0,
+)
+
+
+@pytest.fixture
+def device():
+    device = InverterDevice(device_id="INV1")
+    device.set_data(EnergyData(**ENERGY), MetricsData(**METRICS))
+    yield device
+    device.stop_timers()
+
+
+def test_update_marks_only_changed_fields_dirty(device):
+    before = device.snapshot
+    snapshot = device.update(
+        energy={"Frequency": 50.1, "Today": 5.0}, metrics={"BatterySOC": [81]}
+    )
+
+    assert snapshot.version == before.version + 1
+    assert snapshot.dirty == {"energy": {"Frequency"}, "metrics": {"BatterySOC"}}
+    assert snapshot.energy["Frequency"] == 50.1
+    assert snapshot.metrics["BatterySOC"] == (81,)
+    # Untouched values are shared with the previous snapshot
+    assert snapshot.energy["Power"] is before.energy["Power"]
+
+
+def test_update_without_changes_keeps_snapshot(device):
+    before = device.snapshot
+    assert device.update(energy={"Frequency": 50.0}) is before
+
+
+def test_unknown_field_rejects_whole_update(device):
+    before = device.snapshot
+    with pytest.raises(DataValidationError, match="Bogus"):
+        device.update(energy={"Frequency": 49.0}, metrics={"Bogus": 1})
+    assert device.snapshot is before
+
+
+def test_first_update_needs_complete_section():
+    device = InverterDevice(device_id="INV2")
+    with pytest.raises(DataValidationError):
+        device.update(energy={"Frequency": 50.0})
+
+    device.update(energy=ENERGY, metrics=METRICS)
+    assert device.snapshot.dirty["energy"] == set(ENERGY)
+    assert device.get_sensor_data()["ENERGY"]["Today"] == 5.0
+    device.stop_timers()
+
+
+def test_payload_matches_json_and_reencodes_only_changes(device):
+    device.set_max_battery_power(400.0)
+    data = device.get_sensor_data()
+
+    assert isinstance(data, SerializedData)
+    assert json.loads(data.payload) == json.loads(json.dumps(data))
+    assert data["METRICS"]["BatteryPower"] == [0.0]
+
+    encoder = device._encoders["metrics"]
+    encoded = encoder.encoded_fields
+    device.get_sensor_data()
+    assert encoder.encoded_fields == encoded
+
+    device.update(metrics={"InverterTemperature": 46.0})
+    data = device.get_sensor_data()
+    assert encoder.encoded_fields == encoded + 1
+    assert json.loads(data.payload)["METRICS"]["InverterTemperature"] == 46.0
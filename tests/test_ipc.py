@@ -0,0 +1,129 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.base_device import BaseDevice
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.exceptions import IPCError
+from qilowatt.ipc import LocalClient, LocalServer
+from qilowatt.models import EnergyData, MetricsData
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+        self.commands = []
+        self.reads = 0
+
+    def handle_command(self, payload: bytes) -> None:
+        self.commands.append(payload)
+
+    def get_sensor_data(self):
+        self.reads += 1
+        return {"Reads": self.reads}
+
+    def get_state_data(self):
+        return {}
+
+
+@pytest.fixture
+def server(tmp_path):
+    device = DummyDevice()
+    with LocalServer(str(tmp_path / "qilowatt.sock"), [device]) as server:
+        yield server, device
+
+
+def test_snapshot_reuses_last_published_payload(server):
+    server, device = server
+    with LocalClient(server.path) as client:
+        # Nothing published yet, so it is built on request
+        assert json.loads(client.snapshot("DEVICE123")) == {"Reads": 1}
+        device.publish_sensor_data()
+        reads = device.reads
+        for _ in range(3):
+            assert json.loads(client.snapshot("DEVICE123"))["Reads"] == reads
+        assert device.reads == reads
+        assert json.loads(client.snapshot("DEVICE123", fresh=True))["Reads"] == reads + 1
+
+        with pytest.raises(IPCError):
+            client.snapshot("OTHER")
+
+
+def test_stream_and_commands(server):
+    server, device = server
+    with LocalClient(server.path) as client, LocalClient(server.path) as idle:
+        client.subscribe()
+        device.publish_sensor_data()
+        device.publish_sensor_data()
+        updates = [client.read_update(timeout=2) for _ in range(2)]
+        assert [json.loads(p)["Reads"] for _, p in updates] == [1, 2]
+        assert updates[0][0] == "DEVICE123"
+
+        client.command("DEVICE123", b"POWER1 1")
+        idle.command("DEVICE123", b"POWER1 0")
+        assert device.commands == [b"POWER1 1", b"POWER1 0"]
+        with pytest.raises(socket.timeout):
+            idle.read_update(timeout=0.1)
+
+    stats = server.get_stats()
+    assert stats["commands"] == 2
+    assert stats["updates"] == {"DEVICE123": 2}
+
+
+def test_slow_command_does_not_hold_up_other_requests(server):
+    server, device = server
+    release = threading.Event()
+    device.handle_command = lambda payload: release.wait(5)
+    with LocalClient(server.path) as commander, LocalClient(server.path) as reader:
+        command = threading.Thread(target=commander.command, args=("DEVICE123", b"POWER1 1"))
+        command.start()
+        while not server.get_stats()["commands"]:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        reader.snapshot("DEVICE123")
+        assert time.monotonic() - start < 1.0
+        assert command.is_alive()
+
+        release.set()
+        command.join(2)
+        assert not command.is_alive()
+
+
+def test_slow_subscriber_misses_updates(tmp_path):
+    device = DummyDevice()
+    device.get_sensor_data = lambda: {"Blob": "x" * 65536}
+    with LocalServer(str(tmp_path / "q.sock"), [device], max_buffer=65536) as server:
+        client = LocalClient(server.path)
+        client.subscribe("DEVICE123")
+        # The client never reads, so the socket and then the buffer fill up
+        for _ in range(100):
+            device.publish_sensor_data()
+        assert server.get_stats()["dropped"] > 0
+        client.close()
+
+
+def test_inverter_workmode_over_ipc(tmp_path):
+    device = InverterDevice("INV1")
+    received = []
+    device.set_command_callback(received.append)
+    with LocalServer(str(tmp_path / "q.sock"), [device]) as server, \
+            LocalClient(server.path) as client:
+        client.command("INV1", b'WORKMODE {"Mode": "buy", "_source": "ems", "PowerLimit": 3000}')
+        # Rejected commands are reported back instead of only being logged
+        with pytest.raises(IPCError, match="Invalid WORKMODE"):
+            client.command("INV1", b'WORKMODE {"Mode": ')
+        with pytest.raises(IPCError, match="Unknown command"):
+            client.command("INV1", b"POWER1 1")
+    assert len(received) == 1
+    assert received[0].Mode == "buy"
+    assert received[0].PowerLimit == 3000
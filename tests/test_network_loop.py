@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.network_loop import SharedNetworkLoop
+
+# Set to "host:port" of a plain-TCP broker to run the broker tests
+TEST_BROKER = os.environ.get("QILOWATT_TEST_BROKER")
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self, device_id="DEVICE123"):
+        super().__init__(device_id=device_id)
+        self.commands = []
+
+    def handle_command(self, payload: bytes) -> None:
+        self.commands.append(payload)
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+def test_shared_loop_replaces_network_thread():
+    loop = SharedNetworkLoop()
+    mock_client = MagicMock()
+    mock_client.is_connected.return_value = False
+
+    with patch("qilowatt.client.mqtt.Client", return_value=mock_client):
+        client = QilowattMQTTClient("user", "pass", DummyDevice(), network_loop=loop)
+        client.connect()
+
+    mock_client.loop_start.assert_not_called()
+    assert mock_client.on_socket_open == loop._on_socket_open
+    assert loop.get_stats()["clients"] == 1
+
+    client.disconnect()
+    assert loop.get_stats()["clients"] == 0
+    loop.stop()
+
+
+def test_failed_connect_is_not_serviced():
+    loop = SharedNetworkLoop()
+    mock_client = MagicMock()
+    mock_client.is_connected.return_value = False
+    mock_client.connect.side_effect = OSError("refused")
+
+    with patch("qilowatt.client.mqtt.Client", return_value=mock_client):
+        client = QilowattMQTTClient("user", "pass", DummyDevice(), network_loop=loop)
+        with pytest.raises(OSError):
+            client.connect()
+
+    assert loop.get_stats()["clients"] == 0
+    loop.stop()
+
+
+@pytest.mark.skipif(not TEST_BROKER, reason="QILOWATT_TEST_BROKER not set")
+def test_many_clients_on_one_thread():
+    host, port = TEST_BROKER.rsplit(":", 1)
+    loop = SharedNetworkLoop()
+    threads_before = threading.active_count()
+    clients = [
+        QilowattMQTTClient(
+            "user", "pass", DummyDevice(f"LOOPTEST{i}"), host=host, port=int(port),
+            tls=False, network_loop=loop,
+        )
+        for i in range(20)
+    ]
+    for client in clients:
+        client.connect()
+
+    deadline = time.monotonic() + 10
+    while not all(c.connected for c in clients) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert all(c.connected for c in clients)
+    assert threading.active_count() == threads_before + 1
+
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    publisher.connect(host, int(port))
+    publisher.loop_start()
+    for client in clients:
+        publisher.publish(client.device.command_topic, b"POWER1 1").wait_for_publish()
+
+    deadline = time.monotonic() + 5
+    while any(not c.device.commands for c in clients) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    publisher.loop_stop()
+    publisher.disconnect()
+
+    assert all(c.device.commands == [b"POWER1 1"] for c in clients)
+
+    for client in clients:
+        client.disconnect()
+    loop.stop()
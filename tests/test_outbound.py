@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.outbound import (
+    OutboundQueue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+)
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+def drain(queue):
+    """Start the writer, wait until everything was written and stop it."""
+    queue.start()
+    assert queue.wait_empty(timeout=2)
+    queue.stop()
+
+
+def test_latest_value_wins_per_topic():
+    written = []
+    queue = OutboundQueue(lambda t, p: written.append((t, p)) or True)
+
+    queue.put("Q/1/SENSOR", "old", PRIORITY_LOW)
+    queue.put("Q/1/STATE", "state", PRIORITY_NORMAL)
+    queue.put("Q/1/SENSOR", "new", PRIORITY_LOW)
+    drain(queue)
+
+    assert written == [("Q/1/STATE", "state"), ("Q/1/SENSOR", "new")]
+    stats = queue.get_stats()
+    assert stats["replaced"] == 1
+    assert stats["sent"] == 2
+
+
+def test_high_priority_goes_first():
+    written = []
+    queue = OutboundQueue(lambda t, p: written.append(t) or True)
+
+    queue.put("SENSOR", 1, PRIORITY_LOW)
+    queue.put("STATE", 1, PRIORITY_NORMAL)
+    queue.put("POWER1", 1, PRIORITY_HIGH)
+    drain(queue)
+
+    assert written == ["POWER1", "STATE", "SENSOR"]
+
+
+def test_full_queue_drops_lowest_priority_first():
+    queue = OutboundQueue(lambda t, p: True, max_depth=2)
+
+    assert queue.put("a", 1, PRIORITY_LOW)
+    assert queue.put("b", 1, PRIORITY_NORMAL)
+    # Evicts the LOW message to make room
+    assert queue.put("c", 1, PRIORITY_HIGH)
+    # Nothing lower than NORMAL left, so the new LOW message is dropped
+    assert not queue.put("d", 1, PRIORITY_LOW)
+
+    stats = queue.get_stats()
+    assert stats["depth"] == 2
+    assert stats["dropped"] == {"high": 0, "normal": 0, "low": 2}
+
+
+def test_writer_waits_until_ready():
+    ready = threading.Event()
+    written = []
+    queue = OutboundQueue(lambda t, p: written.append(t) or True, ready=ready.is_set)
+    queue.start()
+    queue.put("SENSOR", 1)
+
+    assert not queue.wait_empty(timeout=0.1)
+    assert written == []
+
+    ready.set()
+    queue.notify()
+    assert queue.wait_empty(timeout=2)
+    assert written == ["SENSOR"]
+    queue.stop()
+
+
+def test_client_publishes_through_queue():
+    mock_client = MagicMock()
+    mock_client.is_connected.return_value = True
+    mock_client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+
+    with patch("qilowatt.client.mqtt.Client", return_value=mock_client):
+        client = QilowattMQTTClient(
+            "user", "pass", DummyDevice(), outbound_queue_size=10
+        )
+        device = client.device
+        device._publish_callback(device.sensor_topic, {"v": 1})
+        device._publish_callback(device.sensor_topic, {"v": 2})
+        device._publish_callback(device.power_topic, 1)
+        client._outbound.start()
+        assert client._outbound.wait_empty(timeout=2)
+
+    published = [c.args for c in mock_client.publish.call_args_list]
+    assert published == [(device.power_topic, "1"), (device.sensor_topic, '{"v": 2}')]
+    assert client.get_stats()["outbound"]["replaced"] == 1
+    client.disconnect()
@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.devices.plant import PlantDevice, split_total
+from qilowatt.exceptions import CommandError
+from qilowatt.models import EnergyData, MetricsData
+
+
+ENERGY = dict(
+    Power=[100.0, 200.0, 300.0], Today=5.0, Total=1000.0,
+    Current=[1.0, 2.0, 3.0], Voltage=[230.0, 231.0, 229.0], Frequency=50.0,
+)
+METRICS = dict(
+    PvPower=[1000.0, 1500.0], PvVoltage=[400.0, 410.0], PvCurrent=[2.5, 3.7],
+    LoadPower=[500.0, 600.0, 700.0], BatterySOC=[80], LoadCurrent=[2.2, 2.6, 3.0],
+    BatteryPower=[-500.0], BatteryCurrent=[-10.0], BatteryVoltage=[50.0],
+    GenVoltage=[0.0], GenPower=[0.0], GenCurrent=[0.0], GridExportLimit=10000.0,
+    BatteryTemperature=[25.0], InverterTemperature=45.0,
+)
+
+
+@pytest.fixture
+def devices():
+    members = [InverterDevice(f"INV{i}") for i in range(3)]
+    plant = PlantDevice("PLANT", members, weights=[1, 1, 2])
+    yield plant, members
+    for device in members + [plant]:
+        device.stop_timers()
+
+
+def fill(members):
+    for i, member in enumerate(members):
+        metrics = dict(METRICS, BatterySOC=[60 + 10 * i], InverterTemperature=40.0 + i)
+        if i == 2:
+            metrics["PvPower"] = [800.0]
+        member.set_data(EnergyData(**ENERGY), MetricsData(**metrics))
+
+
+def test_plant_combines_members(devices):
+    plant, members = devices
+    fill(members[:2])
+    assert plant.get_sensor_data() == {}
+    fill(members)
+
+    sensor = plant.get_sensor_data()
+    assert json.loads(sensor.payload) == json.loads(json.dumps(dict(sensor)))
+    assert sensor["ENERGY"]["Power"] == [300.0, 600.0, 900.0]
+    assert sensor["ENERGY"]["Voltage"] == [230.0, 231.0, 229.0]
+    assert sensor["ENERGY"]["Today"] == 15.0
+    # Members with fewer PV strings only add to the strings they have
+    assert sensor["METRICS"]["PvPower"] == [2800.0, 3000.0]
+    assert sensor["METRICS"]["BatterySOC"] == [70]
+    assert sensor["METRICS"]["InverterTemperature"] == 42.0
+
+
+def test_missing_member_readings_are_left_out(devices):
+    plant, members = devices
+    fill(members)
+    members[0].update(energy={"Frequency": None, "Power": [None, 200.0, 300.0]})
+    members[1].update(energy={"Frequency": 49.0})
+
+    assert plant.snapshot.energy["Frequency"] == 49.5
+    assert plant.snapshot.energy["Power"] == (200.0, 600.0, 900.0)
+    for member in members:
+        member.update(energy={"Frequency": None})
+    assert plant.snapshot.energy["Frequency"] is None
+
+
+def test_member_update_recombines_only_changed_fields(devices):
+    plant, members = devices
+    fill(members)
+    before = plant.snapshot
+
+    members[1].update(energy={"Today": 7.5})
+    after = plant.snapshot
+    assert after.version == before.version + 1
+    assert after.dirty == {"energy": {"Today"}}
+    assert after.energy["Today"] == 17.5
+    # Untouched totals are carried over as the very same objects
+    assert after.energy["Power"] is before.energy["Power"]
+    assert after.metrics is before.metrics
+
+    members[1].update(energy={"Today": 7.5})
+    assert plant.snapshot is after
+
+    plant.remove_member(members[2])
+    assert plant.snapshot.energy["Today"] == 12.5
+    members[2].update(energy={"Today": 100.0})
+    assert plant.snapshot.energy["Today"] == 12.5
+
+
+def test_workmode_split_by_weight(devices):
+    plant, members = devices
+    received = []
+    for member in members:
+        member.set_command_callback(received.append)
+
+    command = {"Mode": "buy", "_source": "ems", "PowerLimit": 10001, "BatterySoc": 90,
+               "PeakShaving": 4000, "ChargeCurrent": 100, "DischargeCurrent": 40,
+               "Custom": 7}
+    plant.handle_command(f"WORKMODE {json.dumps(command)}".encode())
+    assert [c.PowerLimit for c in received] == [2500, 2500, 5001]
+    assert [c.PeakShaving for c in received] == [1000, 1000, 2000]
+    assert [c.ChargeCurrent for c in received] == [25, 25, 50]
+    assert [c.DischargeCurrent for c in received] == [10, 10, 20]
+    # Targets and modes apply to every member as they are
+    assert {(c.Mode, c._source, c.BatterySoc, c.Custom) for c in received} == {
+        ("buy", "ems", 90, 7)
+    }
+    assert plant.get_stats()["members"]["INV2"]["weight"] == 2.0
+
+    plant.set_weights([0, 1, 1])
+    received.clear()
+    plant.handle_command(b'WORKMODE {"Mode": "sell", "PowerLimit": 3000}')
+    assert [c.PowerLimit for c in received] == [0, 1500, 1500]
+
+
+def test_member_failures_are_reported(devices):
+    plant, members = devices
+
+    def reject(payload):
+        raise CommandError("inverter busy")
+
+    members[1].execute_command = reject
+    received = []
+    members[2].set_command_callback(received.append)
+
+    with pytest.raises(CommandError, match="INV1: inverter busy"):
+        plant.execute_command(b'WORKMODE {"Mode": "buy", "PowerLimit": 4000}')
+    # The other members still got their part
+    assert [c.PowerLimit for c in received] == [2000]
+    with pytest.raises(CommandError):
+        plant.execute_command(b"WORKMODE [1, 2]")
+
+
+def test_split_total_adds_up():
+    assert split_total(100, [1, 1, 1]) == [34, 33, 33]
+    assert sum(split_total(-7001, [0.3, 0.3, 0.4])) == -7001
+    with pytest.raises(ValueError):
+        PlantDevice("PLANT", [InverterDevice("A")], weights=[1, 2])
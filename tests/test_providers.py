@@ -0,0 +1,156 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.devices.switch import SwitchDevice
+
+
+ENERGY = dict(
+    Power=[100.0, 200.0, 300.0], Today=5.0, Total=1000.0,
+    Current=[1.0, 2.0, 3.0], Voltage=[230.0, 231.0, 229.0], Frequency=50.0,
+)
+METRICS = dict(
+    PvPower=[1000.0, 1500.0], PvVoltage=[400.0, 410.0], PvCurrent=[2.5, 3.7],
+    LoadPower=[500.0, 600.0, 700.0], BatterySOC=[80], LoadCurrent=[2.2, 2.6, 3.0],
+    BatteryPower=[-500.0], BatteryCurrent=[-10.0], BatteryVoltage=[50.0],
+    GenVoltage=[0.0], GenPower=[0.0], GenCurrent=[0.0], GridExportLimit=10000.0,
+    BatteryTemperature=[25.0], InverterTemperature=45.0,
+)
+
+
+class FakeRegisters:
+    """Stands in for a Modbus client; every read takes ``delay`` seconds."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.reads = 0
+        self.frequency = 50.0
+
+    def read_energy(self):
+        time.sleep(self.delay)
+        self.reads += 1
+        return {"energy": dict(ENERGY, Frequency=self.frequency)}
+
+    async def read_metrics(self):
+        await asyncio.sleep(self.delay)
+        self.reads += 1
+        return {"metrics": METRICS}
+
+
+@pytest.fixture
+def device():
+    device = InverterDevice(device_id="INV1")
+    yield device
+    device.stop_timers()
+
+
+def published(device):
+    payloads = []
+
+    def callback(topic, data):
+        if topic == device.sensor_topic:
+            payloads.append(data)
+
+    device.set_publish_callback(callback)
+    return payloads
+
+
+def test_providers_initialize_device_and_run_concurrently(device):
+    registers = FakeRegisters(delay=0.2)
+    device.add_data_provider(registers.read_energy)
+    assert not device._data_initialized
+
+    start = time.monotonic()
+    device.add_data_provider(registers.read_metrics)
+    elapsed = time.monotonic() - start
+
+    # Both providers were polled in one round, the sync one in parallel
+    assert device._data_initialized
+    assert registers.reads == 3
+    assert elapsed < 0.35
+
+    payloads = published(device)
+    device.publish_sensor_data()
+    assert payloads[-1]["ENERGY"]["Frequency"] == 50.0
+    assert device.get_stats()["providers"]["read_metrics"]["calls"] == 2
+
+
+def test_results_are_cached_for_max_age(device):
+    registers = FakeRegisters()
+    device.add_data_provider(registers.read_energy, max_age=60)
+    device.add_data_provider(registers.read_metrics)
+    payloads = published(device)
+
+    registers.frequency = 49.9
+    device.publish_sensor_data()
+    device.publish_sensor_data()
+
+    stats = device.get_stats()["providers"]
+    assert stats["read_energy"]["calls"] == 1
+    assert stats["read_energy"]["cached"] == 3
+    assert stats["read_metrics"]["calls"] == 3
+    assert payloads[-1]["ENERGY"]["Frequency"] == 50.0
+
+
+def test_slow_provider_publishes_previous_value(device):
+    registers = FakeRegisters()
+    device.add_data_provider(registers.read_energy, name="energy")
+    device.add_data_provider(registers.read_metrics, name="metrics")
+    device.set_provider_timeout(0.05)
+    payloads = published(device)
+
+    release = threading.Event()
+
+    def slow_energy():
+        release.wait(2)
+        return {"energy": {"Frequency": 51.0}}
+
+    device.remove_data_provider("energy")
+    device.add_data_provider(slow_energy, name="energy")
+    device.publish_sensor_data()
+    assert payloads[-1]["ENERGY"]["Frequency"] == 50.0
+    assert device.get_stats()["providers"]["energy"]["timeouts"] == 1
+
+    release.set()
+    for _ in range(100):
+        if not device.get_stats()["providers"]["energy"]["running"]:
+            break
+        time.sleep(0.01)
+    device.publish_sensor_data()
+    # The late result is applied on the next round
+    assert payloads[-1]["ENERGY"]["Frequency"] == 51.0
+
+
+def test_failing_provider_is_counted(device):
+    registers = FakeRegisters()
+    device.add_data_provider(registers.read_energy)
+    device.add_data_provider(registers.read_metrics)
+
+    def broken():
+        raise IOError("Modbus timeout")
+
+    device.add_data_provider(broken)
+    device.add_data_provider(lambda: {"bogus": {}}, name="bad_section")
+    published(device)
+    device.publish_sensor_data()
+
+    stats = device.get_stats()["providers"]
+    assert stats["broken"]["errors"] == 1
+    assert stats["bad_section"]["errors"] == 0
+
+
+def test_device_without_provider_support_rejects_providers():
+    device = SwitchDevice("SW1")
+    try:
+        with pytest.raises(NotImplementedError):
+            device.add_data_provider(lambda: None)
+        assert device.get_stats()["providers"] == {}
+    finally:
+        device.stop_timers()
@@ -0,0 +1,112 @@
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.recording import (
+    INBOUND, OUTBOUND, TrafficRecord, TrafficRecorder, TrafficReplayer, read_traffic,
+)
+
+
+def workmode(mode, power=0):
+    return ("WORKMODE " + json.dumps({"Mode": mode, "_source": "test", "BatterySoc": 50,
+                                      "PowerLimit": power, "PeakShaving": 0,
+                                      "ChargeCurrent": 0, "DischargeCurrent": 0})).encode()
+
+
+def test_round_trip_and_truncated_tail():
+    times = iter([10.0, 10.5, 11.25])
+    buffer = io.BytesIO()
+    recorder = TrafficRecorder(buffer, clock=lambda: next(times))
+    recorder.record_inbound("Q/cmnd/backlog", b"POWER1 1")
+    recorder.record_outbound("Q/tele/SENSOR", '{"a": 1}')
+    assert recorder.get_stats()["records"] == 2
+
+    data = buffer.getvalue()
+    records = list(read_traffic(io.BytesIO(data)))
+    assert records == [
+        TrafficRecord(INBOUND, 0.5, "Q/cmnd/backlog", b"POWER1 1"),
+        TrafficRecord(OUTBOUND, 1.25, "Q/tele/SENSOR", b'{"a": 1}'),
+    ]
+    # A record cut short by a crash is skipped
+    assert len(list(read_traffic(io.BytesIO(data[:-3])))) == 1
+
+    with pytest.raises(ValueError):
+        list(read_traffic(io.BytesIO(b"garbage")))
+
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    client.is_connected.return_value = True
+    mids = itertools.count(1)
+    client.publish.side_effect = lambda *a, **k: MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+    with patch("qilowatt.client.mqtt.Client", return_value=client):
+        yield client
+
+
+def test_client_records_traffic(mock_client, tmp_path):
+    path = str(tmp_path / "traffic.bin")
+    device = InverterDevice("DEVICE123")
+    client = QilowattMQTTClient("user", "pass", device, recorder=TrafficRecorder(path))
+
+    client.publish(device.state_topic, {"Time": "now"})
+    message = SimpleNamespace(topic=device.command_topic, payload=workmode("normal"), qos=0)
+    client._on_message(mock_client, None, message)
+    client.set_recorder(None)
+    client.publish(device.state_topic, {"Time": "later"})
+
+    records = list(read_traffic(path))
+    assert [(r.direction, r.topic) for r in records] == [
+        (OUTBOUND, device.state_topic),
+        (INBOUND, device.command_topic),
+    ]
+    assert records[0].payload == b'{"Time": "now"}'
+
+
+def recording(gaps):
+    buffer = io.BytesIO()
+    clock = SimpleNamespace(now=0.0)
+    recorder = TrafficRecorder(buffer, clock=lambda: clock.now)
+    for i, gap in enumerate(gaps):
+        clock.now += gap
+        recorder.record_inbound("Q/cmnd/backlog", workmode("mode%d" % i, i))
+        recorder.record_outbound("Q/tele/SENSOR", "{}")
+    buffer.seek(0)
+    return list(read_traffic(buffer))
+
+
+def test_replay_as_fast_as_possible():
+    device = InverterDevice("DEVICE123")
+    seen = []
+    device.set_command_callback(lambda command: seen.append(command.Mode))
+
+    stats = TrafficReplayer(device, speed=None).replay(recording([10.0, 10.0, 10.0]))
+
+    assert seen == ["mode0", "mode1", "mode2"]
+    assert stats["commands"] == 3
+    assert stats["duration"] < 1.0
+
+
+def test_replay_keeps_recorded_timing():
+    device = InverterDevice("DEVICE123")
+    stamps = []
+    device.set_command_callback(lambda command: stamps.append(time.monotonic()))
+
+    # Recorded 0.2 s apart, replayed at double speed
+    TrafficReplayer(device, speed=2.0).replay(recording([0.2, 0.2, 0.2]))
+
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    assert len(gaps) == 2
+    assert all(0.08 <= gap < 0.3 for gap in gaps)
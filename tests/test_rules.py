@@ -0,0 +1,129 @@
+import json
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.exceptions import DataValidationError
+from qilowatt.models import EnergyData, MetricsData
+from qilowatt.rules import CLAMP, DROP, REJECT, FieldRule, SectionRules, compile_rule
+
+
+ENERGY = dict(
+    Power=[100.0, 200.0, 300.0], Today=5.0, Total=1000.0,
+    Current=[1.0, 2.0, 3.0], Voltage=[230.0, 231.0, 229.0], Frequency=50.0,
+)
+METRICS = dict(
+    PvPower=[1000.0, 1500.0], PvVoltage=[400.0, 410.0], PvCurrent=[2.5, 3.7],
+    LoadPower=[500.0, 600.0, 700.0], BatterySOC=[80], LoadCurrent=[2.2, 2.6, 3.0],
+    BatteryPower=[-500.0], BatteryCurrent=[-10.0], BatteryVoltage=[50.0],
+    GenVoltage=[0.0], GenPower=[0.0], GenCurrent=[0.0], GridExportLimit=10000.0,
+    BatteryTemperature=[25.0], InverterTemperature=45.0,
+)
+
+
+@pytest.fixture
+def device():
+    device = InverterDevice(device_id="INV1")
+    device.set_data(EnergyData(**ENERGY), MetricsData(**METRICS))
+    yield device
+    device.stop_timers()
+
+
+def test_compiled_checks_pass_valid_values_through():
+    check = compile_rule(FieldRule(-10, 10, 1, 3))
+    values = (1.0, -2.0, 3.0)
+    assert check(values) is values
+    assert check(5) == 5
+
+    assert check((1.0, math.nan, 20.0)) == (1.0, 0.0, 0.0)
+    assert check(math.inf) == 0.0
+    assert compile_rule(FieldRule(-10, 10, policy=CLAMP))((20.0, -math.inf, -30)) == (10.0, 0.0, -10)
+
+
+def test_missing_readings_are_left_alone(device):
+    check = compile_rule(FieldRule(-10, 10))
+    values = (1.0, None)
+    assert check(None) is None
+    assert check(values) is values
+    assert check((None, 20.0)) == (None, 0.0)
+
+    device.update(energy={"Frequency": None, "Power": [None, 200.0, 300.0]})
+    payload = json.loads(device.get_sensor_data().payload)
+    assert payload["ENERGY"]["Frequency"] is None
+    assert payload["ENERGY"]["Power"] == [None, 200.0, 300.0]
+    assert device.get_stats()["rules"] == {"ENERGY": {}, "METRICS": {}}
+
+
+def test_policies_for_section():
+    rules = SectionRules("ENERGY", {
+        "Power": FieldRule(-10, 10, 1, 3, policy=DROP),
+        "Today": FieldRule(0, policy=REJECT),
+    })
+    section = {"Power": (1.0, 2.0, 3.0, 4.0), "Today": 1.0}
+    assert rules.apply(section) == {"Today": 1.0}
+    assert rules.violations == {"Power": 1}
+
+    ok = {"Power": (1.0,), "Today": 1.0}
+    assert rules.apply(ok) is ok
+    with pytest.raises(DataValidationError, match="ENERGY.Today"):
+        rules.validate({"Today": -1.0})
+    assert rules.violations == {"Power": 1, "Today": 1}
+
+
+def test_bad_values_are_sanitized_on_publish(device):
+    device.update(energy={"Frequency": math.nan}, metrics={"BatterySOC": [130]})
+    data = device.get_sensor_data()
+
+    payload = json.loads(data.payload)
+    assert payload["ENERGY"]["Frequency"] == 0.0
+    assert payload["METRICS"]["BatterySOC"] == [100]
+    assert device.get_stats()["rules"] == {
+        "ENERGY": {"Frequency": 1}, "METRICS": {"BatterySOC": 1},
+    }
+    # The same sample is not checked (or counted) again
+    device.get_sensor_data()
+    assert device.get_stats()["rules"]["ENERGY"] == {"Frequency": 1}
+
+
+def test_power_limit_setters_adjust_rules(device):
+    device.set_max_energy_power(250.0)
+    assert device.get_sensor_data()["ENERGY"]["Power"] == [100.0, 200.0, 0.0]
+    assert device.get_field_rule("ENERGY", "Power").maximum == 250.0
+
+    device.set_max_energy_power(None)
+    assert device.get_sensor_data()["ENERGY"]["Power"] == [100.0, 200.0, 300.0]
+
+
+def test_absolute_power_limit_survives_rule_changes(device):
+    device.set_field_rule("ENERGY", "Power", None)
+    device.update(energy={"Power": [1e9, 200.0, 300.0]})
+    assert device.get_sensor_data()["ENERGY"]["Power"] == [0.0, 200.0, 300.0]
+
+    # The set_max_* limit is merged into a rule set later, and the reverse
+    device.set_max_energy_power(250.0)
+    device.set_field_rule("ENERGY", "Power", FieldRule(min_length=3, policy=CLAMP))
+    # Values beyond the set_max_* limit are reported as 0, not clamped
+    assert device.get_sensor_data()["ENERGY"]["Power"] == [0.0, 200.0, 0.0]
+    device.set_max_energy_power(None)
+    rule = device.get_field_rule("ENERGY", "Power")
+    assert (rule.maximum, rule.min_length, rule.policy) == (100000.0, 3, CLAMP)
+
+    device.set_field_rule("METRICS", "PvPower", FieldRule(policy=CLAMP))
+    device.update(metrics={"PvPower": [1e9, 1500.0]})
+    assert device.get_sensor_data()["METRICS"]["PvPower"] == [100000.0, 1500.0]
+
+
+def test_reject_rule_fails_the_write(device):
+    device.set_field_rule("METRICS", "InverterTemperature", FieldRule(-40, 120, policy=REJECT))
+    before = device.snapshot
+
+    with pytest.raises(DataValidationError):
+        device.update(metrics={"InverterTemperature": 500.0})
+    with pytest.raises(DataValidationError):
+        device.set_metrics_data(MetricsData(**dict(METRICS, InverterTemperature=math.nan)))
+    assert device.snapshot is before
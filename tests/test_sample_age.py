@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.clock import VirtualClock, format_timestamp
+from qilowatt.delivery import PublishHandle
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.models import EnergyData, MetricsData
+
+
+ENERGY = dict(
+    Power=[100.0, 200.0, 300.0], Today=5.0, Total=1000.0,
+    Current=[1.0, 2.0, 3.0], Voltage=[230.0, 231.0, 229.0], Frequency=50.0,
+)
+METRICS = dict(
+    PvPower=[1000.0, 1500.0], PvVoltage=[400.0, 410.0], PvCurrent=[2.5, 3.7],
+    LoadPower=[500.0, 600.0, 700.0], BatterySOC=[80], LoadCurrent=[2.2, 2.6, 3.0],
+    BatteryPower=[-500.0], BatteryCurrent=[-10.0], BatteryVoltage=[50.0],
+    GenVoltage=[0.0], GenPower=[0.0], GenCurrent=[0.0], GridExportLimit=10000.0,
+    BatteryTemperature=[25.0], InverterTemperature=45.0,
+)
+
+
+@pytest.fixture
+def setup():
+    clock = VirtualClock()
+    device = InverterDevice("INV1")
+    device.set_clock(clock)
+    published = []
+    device.set_publish_callback(lambda topic, data: published.append(data))
+    device.set_data(EnergyData(**ENERGY), MetricsData(**METRICS))
+    # Publish by hand only
+    device.stop_timers()
+    published.clear()
+    yield device, clock, published
+    device.stop_timers()
+
+
+def test_sample_time_and_age(setup):
+    device, clock, published = setup
+    sampled = device.sample_time
+    assert sampled == clock.time()
+    device.set_sample_time_field(True)
+
+    clock.advance(4)
+    device.publish_sensor_data()
+    data = published[-1]
+    assert data["SampleTime"] == format_timestamp(sampled)
+    assert json.loads(data.payload) == json.loads(json.dumps(dict(data)))
+    assert "Stale" not in data
+
+    # An update that changes nothing still counts as a fresh reading
+    device.update(energy={"Today": 5.0})
+    assert device.sample_time == clock.time()
+    device.publish_sensor_data()
+
+    age = device.get_stats()["samples"]["age"]
+    assert age["count"] == 2
+    assert age["max"] == pytest.approx(4.0)
+
+
+def test_stale_data_flagged_or_skipped(setup):
+    device, clock, published = setup
+    device.set_max_sample_age(30)
+    clock.advance(45)
+    device.publish_sensor_data()
+    assert published[-1]["Stale"] == 45.0
+    assert json.loads(published[-1].payload)["Stale"] == 45.0
+
+    device.set_max_sample_age(30, policy="skip")
+    assert device.publish_sensor_data() is None
+    assert len(published) == 1
+    device.update(energy={"Today": 6.0})
+    device.publish_sensor_data()
+    assert len(published) == 2 and "Stale" not in published[-1]
+
+    stats = device.get_stats()["samples"]
+    assert (stats["flagged"], stats["skipped"]) == (1, 1)
+    with pytest.raises(ValueError):
+        device.set_max_sample_age(30, policy="drop")
+
+
+def test_sample_age_at_ack(setup):
+    device, clock, _ = setup
+    handles = []
+
+    def publish(topic, data):
+        handles.append(PublishHandle(topic, qos=1))
+        return handles[-1]
+
+    device.set_publish_callback(publish)
+    clock.advance(3)
+    device.publish_sensor_data()
+    device.publish_sensor_data()
+    handles[0]._resolve(True)
+    handles[1]._resolve(False, "dropped")
+
+    at_ack = device.get_stats()["samples"]["age_at_ack"]
+    assert at_ack["count"] == 1
+    assert at_ack["min"] >= 3.0
@@ -0,0 +1,137 @@
+import json
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.exceptions import CommandError
+from qilowatt.schema import (
+    BOOLEAN, SWITCH, TEXT, Command, DeviceSchema, Field, SchemaDevice, parse_switch,
+)
+from qilowatt.devices.power_switch import PowerSwitchDevice
+from qilowatt.devices.thermostat import ThermostatDevice
+
+
+class DummyDevice(SchemaDevice):
+    schema = DeviceSchema(
+        sensor=(
+            Field("Power", "power", precision=0, unit="W", section="ENERGY"),
+            Field("Ratio", "ratio", precision=2, section="ENERGY"),
+            Field("Label", "label", kind=TEXT),
+            Field("Relay", "relay", kind=SWITCH),
+            Field("Online", "relay", kind=BOOLEAN, section="STATUS"),
+            Field("Unit", value="W"),
+        ),
+        state=(Field("Uptime", "uptime"),),
+        commands=(
+            Command("LEVEL", "set_level", parse=int, minimum=0, maximum=10),
+            Command("RELAY", "set_relay", parse=parse_switch),
+        ),
+    )
+
+    def __init__(self):
+        super().__init__("DEVICE123")
+        self.power = 1234.56
+        self.ratio = 1 / 3
+        self.label = 'say "hi"\n'
+        self.relay = True
+        self.calls = []
+
+    def set_level(self, level):
+        self.calls.append(("level", level))
+
+    def set_relay(self, on):
+        self.calls.append(("relay", on))
+
+
+@pytest.fixture
+def published():
+    messages = []
+
+    def attach(device):
+        device.stop_timers()
+        device.set_publish_callback(lambda topic, data: messages.append((topic, data)))
+        return device
+
+    yield messages, attach
+
+
+def test_generated_payload_matches_json_dumps():
+    device = DummyDevice()
+    data = device.get_sensor_data()
+    assert data.payload == json.dumps(data)
+    assert data["ENERGY"] == {"Power": 1235, "Ratio": 0.33}
+    assert data["Relay"] == "ON" and data["STATUS"] == {"Online": True}
+    assert list(data) == ["Time", "ENERGY", "Label", "Relay", "STATUS", "Unit", "VERSION"]
+
+    # Odd values still encode like json.dumps
+    device.power, device.ratio, device.label, device.relay = None, math.nan, "x", 0
+    data = device.get_sensor_data()
+    assert data.payload == json.dumps(data)
+    # NaN and infinity are not valid JSON, so they are published as null
+    assert data["ENERGY"] == {"Power": None, "Ratio": None}
+    device.power = math.inf
+    assert json.loads(device.get_sensor_data().payload)["ENERGY"]["Power"] is None
+
+    state = device.get_state_data()
+    assert state.payload == json.dumps(state) and "Uptime" in state
+    assert DummyDevice.schema.units() == {"SENSOR.ENERGY.Power": "W"}
+
+
+def test_command_dispatch_checks_arguments():
+    device = DummyDevice()
+    device.handle_command(b"LEVEL 3; relay off; LEVEL 11; LEVEL x; NOPE 1; RELAY maybe")
+    assert device.calls == [("level", 3), ("relay", False)]
+
+    with pytest.raises(CommandError, match="LEVEL: LEVEL must be at most 10; unknown command NOPE"):
+        device.execute_command(b"LEVEL 4; LEVEL 11; NOPE 1")
+    assert device.calls[-1] == ("level", 4)
+
+
+def test_field_needs_one_source():
+    with pytest.raises(ValueError):
+        Field("A")
+    with pytest.raises(ValueError):
+        Field("A", "a", value=1)
+    with pytest.raises(ValueError):
+        Field("A", "a.b")
+
+
+def test_power_switch(published):
+    messages, attach = published
+    device = attach(PowerSwitchDevice("SW1"))
+    device.update(power=57.26, current=0.2491)
+    toggled = []
+    device.set_command_callback(toggled.append)
+
+    device.handle_command(b"POWER1 1")
+
+    assert [topic for topic, _ in messages] == [
+        device.sensor_topic, device.state_topic, device.power_topic,
+    ]
+    sensor, state, power = (data for _, data in messages)
+    assert sensor["Switch1"] == "ON"
+    assert sensor["ENERGY"] == {"Power": 57.3, "Voltage": 230.0, "Current": 0.249, "Today": 0.0}
+    assert state["POWER1"] == "ON" and power == 1
+    assert toggled == [True]
+
+
+def test_thermostat(published):
+    messages, attach = published
+    device = attach(ThermostatDevice("TH1"))
+    device.update_temperature(22.04)
+    assert device.get_state_data()["POWER1"] == "OFF"
+
+    device.handle_command(b"TARGET 23.5")
+    device.handle_command(b"MODE fan")
+    device.handle_command(b"TARGET 80")
+    device.handle_command(b"TARGET nan; TARGET inf")
+
+    sensor = device.get_sensor_data()
+    assert sensor["ANALOG"] == {"Temperature": 22.0}
+    assert sensor["THERMOSTAT"] == {"Target": 23.5, "Mode": "heat", "Heating": "ON"}
+    assert sensor.payload == json.dumps(sensor)
+    assert messages[-1] == (device.power_topic, 1)
@@ -0,0 +1,136 @@
+import itertools
+import json
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.budget import BandwidthBudget
+from qilowatt.clock import VirtualClock
+from qilowatt.sinks import CallbackSink, MQTTSink, PublishSink
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self, device_id="DEVICE123"):
+        super().__init__(device_id=device_id)
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+def paho_mock():
+    client = MagicMock()
+    client.is_connected.return_value = True
+    mids = itertools.count(1)
+    client.publish.side_effect = lambda *a, **k: MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+    return client
+
+
+@pytest.fixture
+def mock_client():
+    client = paho_mock()
+    with patch("qilowatt.client.mqtt.Client", return_value=client):
+        yield client
+
+
+def test_payload_serialized_once_and_shared(mock_client):
+    received = []
+    sink = CallbackSink(lambda topic, payload: received.append((topic, payload)))
+    device = DummyDevice()
+    client = QilowattMQTTClient("user", "pass", device, sinks=[sink])
+
+    with patch("qilowatt.client.json.dumps", wraps=json.dumps) as dumps:
+        client.publish(device.state_topic, {"Time": "now"})
+    assert dumps.call_count == 1
+    assert sink.flush(timeout=2)
+
+    cloud_payload = mock_client.publish.call_args[0][1]
+    assert received == [(device.state_topic, '{"Time": "now"}')]
+    assert received[0][1] is cloud_payload
+    assert client.get_stats()["sinks"]["callback"]["sent"] == 1
+    sink.close()
+
+
+def test_slow_sink_does_not_delay_cloud(mock_client):
+    release = threading.Event()
+    written = []
+
+    def slow(topic, payload):
+        release.wait(5)
+        written.append(payload)
+
+    sink = CallbackSink(slow, name="local", queue_size=4)
+    device = DummyDevice()
+    client = QilowattMQTTClient("user", "pass", device, sinks=[sink])
+
+    for i in range(50):
+        client.publish(device.sensor_topic, {"n": i})
+    # Every message reached the cloud while the sink was stuck on the first one
+    assert mock_client.publish.call_count == 50
+    assert sink.depth <= 1
+
+    release.set()
+    assert sink.flush(timeout=2)
+    # The sink's latest-value slot kept only the newest SENSOR
+    assert written[-1] == '{"n": 49}'
+    assert len(written) <= 2
+    assert sink.get_stats()["replaced"] >= 48
+    sink.close()
+
+
+def test_sink_gets_samples_the_budget_skips(mock_client):
+    # Any publish exhausts this budget, so the repeat is deadbanded
+    budget = BandwidthBudget(daily_bytes=1, clock=VirtualClock(wall_start=1704067200.0))
+    received = []
+    sink = CallbackSink(lambda topic, payload: received.append(payload))
+    device = DummyDevice()
+    client = QilowattMQTTClient("user", "pass", device, bandwidth_budget=budget, sinks=[sink])
+
+    data = {"ENERGY": {"Power": [1]}}
+    client.publish(device.sensor_topic, data)
+    assert sink.flush(timeout=2)
+    handle = client.publish(device.sensor_topic, data)
+    assert handle.reason == "deadband"
+    assert sink.flush(timeout=2)
+    assert len(received) == 2
+    sink.close()
+
+
+def test_mqtt_sink_is_shared_between_clients(mock_client):
+    local = paho_mock()
+    with patch("qilowatt.sinks.mqtt.Client", return_value=local):
+        sink = MQTTSink("localhost", topic_prefix="qilowatt/", retain=True)
+    devices = [DummyDevice("A"), DummyDevice("B")]
+    clients = [QilowattMQTTClient("user", "pass", d, sinks=[sink]) for d in devices]
+
+    for client, device in zip(clients, devices):
+        client.publish(device.state_topic, {"id": device.device_id})
+    assert sink.flush(timeout=2)
+
+    local.connect_async.assert_called_once_with("localhost", 1883, keepalive=30)
+    topics = sorted(call[0][0] for call in local.publish.call_args_list)
+    assert topics == sorted("qilowatt/" + d.state_topic for d in devices)
+    assert all(call[1]["retain"] for call in local.publish.call_args_list)
+    sink.close()
+    local.loop_stop.assert_called_once()
+
+
+def test_sink_without_write_cannot_be_created():
+    class Incomplete(PublishSink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete")
@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.models import EnergyData, MetricsData
+
+
+def make_energy(value):
+    return EnergyData(
+        Power=[value] * 3, Today=value, Total=value,
+        Current=[value] * 3, Voltage=[value] * 3, Frequency=value,
+    )
+
+
+def make_metrics(value):
+    return MetricsData(
+        PvPower=[value] * 2, PvVoltage=[value] * 2, PvCurrent=[value] * 2,
+        LoadPower=[value] * 3, BatterySOC=[1], LoadCurrent=[value] * 3,
+        BatteryPower=[value], BatteryCurrent=[value], BatteryVoltage=[value],
+        GenVoltage=[value], GenPower=[value], GenCurrent=[value],
+        GridExportLimit=value, BatteryTemperature=[value], InverterTemperature=value,
+    )
+
+
+@pytest.fixture
+def device():
+    device = InverterDevice(device_id="INV1")
+    yield device
+    device.stop_timers()
+
+
+def test_snapshot_is_isolated_from_caller_mutation(device):
+    energy = make_energy(1.0)
+    device.set_data(energy, make_metrics(1.0))
+
+    energy.Today = 99.0
+    energy.Power.append(99.0)
+
+    snapshot = device.snapshot
+    assert snapshot.energy["Today"] == 1.0
+    assert snapshot.energy["Power"] == (1.0, 1.0, 1.0)
+    with pytest.raises(TypeError):
+        snapshot.energy["Today"] = 2.0
+    assert device.get_sensor_data()["ENERGY"]["Power"] == [1.0, 1.0, 1.0]
+
+
+def test_separate_setters_bump_version(device):
+    device.set_energy_data(make_energy(1.0))
+    assert device.snapshot.metrics is None
+    device.set_metrics_data(make_metrics(2.0))
+
+    snapshot = device.snapshot
+    assert snapshot.version == 2
+    assert snapshot.energy["Today"] == 1.0
+    assert snapshot.metrics["InverterTemperature"] == 2.0
+
+
+def test_readers_never_see_torn_data_with_concurrent_writers(device):
+    device.set_data(make_energy(0.0), make_metrics(0.0))
+    writers, rounds = 4, 2000
+    stop = threading.Event()
+    errors = []
+
+    def write(writer):
+        # Like the example, keep mutating the same objects in place
+        energy, metrics = make_energy(0.0), make_metrics(0.0)
+        for i in range(rounds):
+            value = float(writer * rounds + i)
+            energy.Today = energy.Total = energy.Frequency = value
+            energy.Power[:] = [value] * 3
+            metrics.InverterTemperature = value
+            metrics.PvPower[:] = [value] * 2
+            device.set_data(energy, metrics)
+
+    def read():
+        last_version = 0
+        while not stop.is_set():
+            version = device.snapshot.version
+            data = device.get_sensor_data()
+            values = {
+                data["ENERGY"]["Today"], data["ENERGY"]["Total"],
+                data["METRICS"]["InverterTemperature"],
+                *data["ENERGY"]["Power"], *data["METRICS"]["PvPower"],
+            }
+            if len(values) != 1:
+                errors.append(values)
+            if version < last_version:
+                errors.append(("version went back", last_version, version))
+            last_version = version
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+    for thread in readers + threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert device.snapshot.version == 1 + writers * rounds
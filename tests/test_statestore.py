@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.clock import VirtualClock
+from qilowatt.devices.inverter import InverterDevice
+from qilowatt.models import EnergyData, MetricsData
+from qilowatt.statestore import StateStore
+
+
+ENERGY = dict(
+    Power=[100.0, 200.0, 300.0], Today=5.0, Total=1000.0,
+    Current=[1.0, 2.0, 3.0], Voltage=[230.0, 231.0, 229.0], Frequency=50.0,
+)
+METRICS = dict(
+    PvPower=[1000.0, 1500.0], PvVoltage=[400.0, 410.0], PvCurrent=[2.5, 3.7],
+    LoadPower=[500.0, 600.0, 700.0], BatterySOC=[80], LoadCurrent=[2.2, 2.6, 3.0],
+    BatteryPower=[-500.0], BatteryCurrent=[-10.0], BatteryVoltage=[50.0],
+    GenVoltage=[0.0], GenPower=[0.0], GenCurrent=[0.0], GridExportLimit=10000.0,
+    BatteryTemperature=[25.0], InverterTemperature=45.0,
+)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.bin")
+
+
+def test_values_survive_reopen_and_torn_tail_is_dropped(path):
+    with StateStore(path) as store:
+        store.put("a", b"1")
+        store.put("b", b"two")
+        store.put("a", b"3")
+
+    # Simulate a crash in the middle of writing a record
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    store = StateStore(path)
+    assert store.get("a") == b"3"
+    assert store.get("b") == b"two"
+    assert store.get_stats()["dropped_bytes"] == 3
+    store.put("c", b"ok")
+    store.close()
+    assert StateStore(path).get("c") == b"ok"
+
+
+def test_foreign_file_is_moved_aside(path):
+    with open(path, "wb") as f:
+        f.write(b"something else")
+    store = StateStore(path)
+    assert store.get("a") is None
+    assert os.path.exists(path + ".corrupt")
+    store.close()
+
+
+def test_log_is_compacted(path):
+    store = StateStore(path)
+    for i in range(500):
+        store.put("counter", str(i).encode())
+    stats = store.get_stats()
+    store.close()
+
+    assert stats["compactions"] >= 1
+    assert stats["records"] <= 100
+    assert not os.path.exists(path + ".tmp")
+    assert os.path.getsize(path) < 2000
+    assert StateStore(path).get("counter") == b"499"
+
+
+def test_failed_compaction_keeps_the_log(path, monkeypatch):
+    store = StateStore(path)
+    real_replace = os.replace
+
+    def full_disk(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", full_disk)
+    for i in range(200):
+        store.put("counter", str(i).encode())
+    stats = store.get_stats()
+    assert stats["compaction_errors"] >= 1 and stats["compactions"] == 0
+    assert not os.path.exists(path + ".tmp")
+
+    monkeypatch.setattr(os, "replace", real_replace)
+    for i in range(200, 400):
+        store.put("counter", str(i).encode())
+    assert store.get_stats()["compactions"] >= 1
+    store.close()
+    assert StateStore(path).get("counter") == b"399"
+
+
+def test_fsync_is_batched(path):
+    clock = VirtualClock()
+    store = StateStore(path, fsync_interval=1.0, clock=clock)
+    synced = store.fsyncs
+    for i in range(10):
+        store.put("k", str(i).encode())
+    assert store.fsyncs == synced
+
+    clock.advance(1.0)
+    assert store.fsyncs == synced + 1
+    store.close()
+
+
+def test_device_warm_restart(path):
+    clock = VirtualClock()
+    store = StateStore(path, clock=clock)
+    device = InverterDevice("INV1")
+    device.set_clock(clock)
+    device.set_state_store(store)
+    device.set_publish_callback(lambda topic, data: None)
+    device.set_data(EnergyData(**ENERGY), MetricsData(**METRICS))
+    device.handle_command(b'WORKMODE {"Mode": "buy", "PowerLimit": 3000}')
+    device.publish_sensor_data()
+    device.stop_timers()
+    store.close()
+    assert device.get_status0_data().StatusPRM.BootCount == 1
+
+    # Restart 30 s later
+    clock.advance(30)
+    store = StateStore(path, clock=clock)
+    restarted = InverterDevice("INV1")
+    restarted.set_clock(clock)
+    restarted.set_state_store(store)
+    published = []
+    restarted.set_publish_callback(lambda topic, data: published.append((topic, data)))
+
+    assert restarted.get_status0_data().StatusPRM.BootCount == 2
+    assert restarted._workmode_command.Mode == "buy"
+
+    restarted.publish_restored_state()
+    topic, data = published[0]
+    assert topic == restarted.sensor_topic
+    assert data["ENERGY"]["Power"] == ENERGY["Power"]
+    assert data["WORKMODE"]["PowerLimit"] == 3000
+    assert data["Stale"] == 30.0
+    # Only once
+    restarted.publish_restored_state()
+    assert len(published) == 1
+    store.close()
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.base_device import BaseDevice
+from qilowatt.telemetry import (
+    TelemetryRecorder, flatten, read_batches, read_records, segment_paths,
+)
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+        self.power = 0.0
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {"ENERGY": {"Power": [self.power, 1.0]}, "WORKMODE": {"Mode": "normal"}}
+
+    def get_state_data(self):
+        return {}
+
+
+def sample(i):
+    return {
+        "Time": "ignored",
+        "ENERGY": {"Power": [float(i), 2.0, 3.0], "Today": 5},
+        "WORKMODE": {"Mode": "buy" if i % 2 else "normal"},
+    }
+
+
+def test_flatten():
+    assert flatten(sample(1), include=("ENERGY", "WORKMODE")) == {
+        "ENERGY.Power[0]": 1.0, "ENERGY.Power[1]": 2.0, "ENERGY.Power[2]": 3.0,
+        "ENERGY.Today": 5, "WORKMODE.Mode": "buy",
+    }
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_in_batches(tmp_path, compress):
+    recorder = TelemetryRecorder(str(tmp_path), batch_rows=4, compress=compress)
+    for i in range(10):
+        recorder.record(sample(i), timestamp=1000.0 + i)
+    # A sample with an extra column
+    recorder.record({"ENERGY": {"Frequency": 50.0}}, timestamp=2000.0)
+    recorder.close()
+
+    batches = list(read_batches(str(tmp_path)))
+    assert [len(timestamps) for timestamps, _ in batches] == [4, 4, 3]
+    records = list(read_records(str(tmp_path)))
+    assert len(records) == 11
+    assert records[3] == {
+        "timestamp": 1003.0, "ENERGY.Power[0]": 3.0, "ENERGY.Power[1]": 2.0,
+        "ENERGY.Power[2]": 3.0, "ENERGY.Today": 5.0, "WORKMODE.Mode": "buy",
+    }
+    assert records[-1] == {"timestamp": 2000.0, "ENERGY.Frequency": 50.0}
+    assert recorder.get_stats()["rows"] == 11
+
+
+def test_flush_interval_writes_partial_batches(tmp_path):
+    recorder = TelemetryRecorder(str(tmp_path), batch_rows=1000, flush_interval=0.05)
+    recorder.record(sample(1), timestamp=1.0)
+    deadline = time.monotonic() + 2.0
+    while recorder.get_stats()["batches"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [r["timestamp"] for r in read_records(str(tmp_path))] == [1.0]
+    recorder.close()
+
+
+def test_segments_rotate_and_old_ones_are_removed(tmp_path):
+    recorder = TelemetryRecorder(
+        str(tmp_path), batch_rows=1, segment_bytes=300, max_segments=3, compress=False,
+    )
+    for i in range(20):
+        recorder.record(sample(i), timestamp=float(i))
+        recorder.flush()
+    recorder.close()
+
+    assert recorder.get_stats()["segments"] > 3
+    assert len(segment_paths(str(tmp_path))) == 3
+    timestamps = [r["timestamp"] for r in read_records(str(tmp_path))]
+    assert timestamps == sorted(timestamps) and timestamps[-1] == 19.0
+
+
+def test_truncated_batch_is_skipped(tmp_path):
+    recorder = TelemetryRecorder(str(tmp_path), batch_rows=2)
+    for i in range(4):
+        recorder.record(sample(i), timestamp=float(i))
+    recorder.close()
+    path = segment_paths(str(tmp_path))[0]
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    assert [r["timestamp"] for r in read_records(path)] == [0.0, 1.0]
+
+
+def test_device_hands_samples_to_recorder(tmp_path):
+    device = DummyDevice()
+    recorder = TelemetryRecorder(str(tmp_path))
+    device.add_sensor_recorder(recorder)
+    for power in (10.0, 20.0):
+        device.power = power
+        device.publish_sensor_data()
+    device.remove_sensor_recorder(recorder)
+    device.publish_sensor_data()
+    recorder.close()
+
+    assert [r["ENERGY.Power[0]"] for r in read_records(str(tmp_path))] == [10.0, 20.0]
+
+
+def test_recorders_sharing_a_directory_keep_their_segments(tmp_path):
+    recorders = [
+        TelemetryRecorder(str(tmp_path), prefix=prefix, batch_rows=1, segment_bytes=300,
+                          max_segments=2, compress=False)
+        for prefix in ("sensor", "sensor-INV2")
+    ]
+    with pytest.raises(ValueError):
+        TelemetryRecorder(str(tmp_path), prefix="sensor")
+    for i in range(10):
+        for recorder in recorders:
+            recorder.record(sample(i), timestamp=float(i))
+            recorder.flush()
+    for recorder in recorders:
+        recorder.close()
+
+    assert len(segment_paths(str(tmp_path), "sensor")) == 2
+    assert len(segment_paths(str(tmp_path), "sensor-INV2")) == 2
+    # The prefix is free again once its recorder is closed
+    TelemetryRecorder(str(tmp_path), prefix="sensor").close()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from qilowatt.client import QilowattMQTTClient
+from qilowatt.base_device import BaseDevice
+from qilowatt.tls import create_tls_context, get_default_tls_context
+
+
+class DummyDevice(BaseDevice):
+    def __init__(self):
+        super().__init__(device_id="DEVICE123")
+
+    def handle_command(self, payload: bytes) -> None:
+        pass
+
+    def get_sensor_data(self):
+        return {}
+
+    def get_state_data(self):
+        return {}
+
+
+def test_clients_share_default_context():
+    clients = []
+    with patch("qilowatt.client.mqtt.Client", side_effect=lambda *a, **k: MagicMock()):
+        for _ in range(2):
+            clients.append(QilowattMQTTClient("user", "pass", DummyDevice()))
+
+    contexts = [c._client.tls_set_context.call_args.args[0] for c in clients]
+    assert contexts[0] is contexts[1] is get_default_tls_context()
+    assert contexts[0].verify_mode == ssl.CERT_NONE
+
+
+def test_explicit_context_is_used():
+    context = create_tls_context(verify=True)
+    with patch("qilowatt.client.mqtt.Client", return_value=MagicMock()) as factory:
+        QilowattMQTTClient("user", "pass", DummyDevice(), tls_context=context)
+
+    factory.return_value.tls_set_context.assert_called_once_with(context)
+    assert context.verify_mode == ssl.CERT_REQUIRED
+    assert context.check_hostname is True
+
+
+@pytest.fixture
+def tls_server(tmp_path):
+    if not shutil.which("openssl"):
+        pytest.skip("openssl not available")
+    cert, key = str(tmp_path / "cert.pem"), str(tmp_path / "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key,
+         "-out", cert, "-days", "1", "-subj", "/CN=localhost"],
+        check=True, capture_output=True,
+    )
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            try:
+                tls_conn = server_context.wrap_socket(conn, server_side=True)
+                tls_conn.sendall(b"ok")
+                tls_conn.recv(1)
+                tls_conn.close()
+            except (OSError, ssl.SSLError):
+                conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()[1]
+    listener.close()
+
+
+def test_reconnects_resume_tls_session(tls_server):
+    context = create_tls_context()
+
+    for _ in range(3):
+        raw = socket.create_connection(("127.0.0.1", tls_server))
+        tls_sock = context.wrap_socket(
+            raw, server_hostname="localhost", do_handshake_on_connect=False
+        )
+        tls_sock.do_handshake()
+        tls_sock.recv(2)
+        tls_sock.sendall(b"x")
+        tls_sock.close()
+
+    assert context.get_stats() == {"handshakes": 3, "resumed": 2, "cached_sessions": 1}